@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agricareai.settings')
 
 application = get_asgi_application()
+
+# Build the near-duplicate index before the first upload searches it.
+from detection.phash import near_duplicates  # noqa: E402
+
+near_duplicates.warm_up()
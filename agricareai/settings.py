@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'detection.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -155,11 +157,130 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Storage backends; static files are served by WhiteNoise (compressed, hashed once collected)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Crop images: one content-addressed blob per distinct upload, shared by all rows
+    'images': {'BACKEND': 'detection.storage.ContentAddressedStorage', 'OPTIONS': {'prefix': 'uploads'}},
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedStaticFilesStorage' if DEBUG
+        else 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Media delivery (detection.views.MediaView)
+MEDIA_PRIVATE = config('MEDIA_PRIVATE', default=False, cast=bool)  # only owners and staff may fetch uploads
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')  # nginx internal location, e.g. /protected-media/
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default=False, cast=bool)  # X-Sendfile for Apache/lighttpd
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
 
 
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+GEMINI_MODEL_NAME = config('GEMINI_MODEL_NAME', default='gemini-1.5-flash')
+# 'grpc' (default) or 'rest'; either way one pooled keep-alive client is shared per process.
+GEMINI_TRANSPORT = config('GEMINI_TRANSPORT', default=None)
+
+# Analyzer backend: 'gemini' (Google API), 'mock' (canned answers) or 'http'
+# (a Gemini-compatible REST endpoint such as `manage.py run_fake_gemini`)
+ANALYZER_BACKEND = config('ANALYZER_BACKEND', default='gemini')
+ANALYZER_HTTP_URL = config('ANALYZER_HTTP_URL', default='http://127.0.0.1:8765')
+ANALYZER_HTTP_TIMEOUT = config('ANALYZER_HTTP_TIMEOUT', default=60, cast=float)
+
+# Background analysis queue (see `manage.py run_analysis_worker`)
+ANALYSIS_WORKER_CONCURRENCY = config('ANALYSIS_WORKER_CONCURRENCY', default=4, cast=int)
+ANALYSIS_WORKER_POLL_INTERVAL = config('ANALYSIS_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+ANALYSIS_JOB_MAX_ATTEMPTS = 3
+ANALYSIS_JOB_STALE_SECONDS = 300
+
+# Result page streaming (result/<pk>/stream/, ASGI only): how often the relay task of an
+# image being watched polls its job, and how long a stream stays open
+RESULT_STREAM_POLL_INTERVAL = 1.0
+RESULT_STREAM_TIMEOUT = 120  # seconds
+
+# Multi-image batch uploads (api/upload/batch/)
+BATCH_UPLOAD_MAX_FILES = 50
+
+# Detections per history page (keyset pagination)
+HISTORY_PAGE_SIZE = 12
+
+# Disease statistics API (api/stats/), served from the daily rollups
+STATS_DEFAULT_DAYS = 30
+STATS_MAX_DAYS = 366
+
+# Cache holding result page validators and bodies (see detection.response_cache). The in-process
+# default only sees invalidations made by its own process; with several web processes, workers or
+# management commands, point CACHE_BACKEND/CACHE_LOCATION at a shared Redis or Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='agricareai'),
+    }
+}
+RESULT_CACHE_TIMEOUT = config('RESULT_CACHE_TIMEOUT', default=60 * 60, cast=int)  # seconds
+
+# Home page recent detections: kept in the cache above and updated as analyses are saved
+RECENT_DETECTIONS_COUNT = 6
+RECENT_DETECTIONS_MAX_AGE = 300  # seconds before a full rebuild in the background
+
+# Resized WebP/JPEG copies generated at ingest: name -> (max width, max height)
+IMAGE_VARIANT_SIZES = {
+    'preview': (800, 800),  # result page, admin change view
+    'card': (400, 400),  # history and recent detection cards
+    'thumb': (100, 100),  # admin list
+}
+BATCH_ANALYSIS_CONCURRENCY = config('BATCH_ANALYSIS_CONCURRENCY', default=4, cast=int)
+
+# Multi-image model calls for bulk analyses and queued jobs: concurrent analyses are collected
+# for up to ANALYSIS_BATCH_MAX_WAIT seconds into calls of up to ANALYSIS_BATCH_SIZE images (1 = off)
+ANALYSIS_BATCH_SIZE = config('ANALYSIS_BATCH_SIZE', default=1, cast=int)
+ANALYSIS_BATCH_MAX_WAIT = config('ANALYSIS_BATCH_MAX_WAIT', default=0.2, cast=float)
+
+# Admission control for Gemini calls, shared by all workers on the host via SQLite
+ADMISSION_CONTROL_ENABLED = config('ADMISSION_CONTROL_ENABLED', default=True, cast=bool)
+ADMISSION_STATE_PATH = config('ADMISSION_STATE_PATH', default=str(BASE_DIR / 'admission.sqlite3'))
+ADMISSION_MAX_CONCURRENCY = config('ADMISSION_MAX_CONCURRENCY', default=8, cast=int)
+ADMISSION_RATE_PER_SECOND = config('ADMISSION_RATE_PER_SECOND', default=5.0, cast=float)
+ADMISSION_BURST = 10
+ADMISSION_MAX_QUEUE = 50
+ADMISSION_MAX_WAIT = 30  # seconds a call may wait before 429/503
+ADMISSION_LEASE_TIMEOUT = 300  # seconds before a crashed holder's slot is reclaimed
+
+# Content-hash result cache in front of the analyzer
+ANALYSIS_CACHE_ENABLED = config('ANALYSIS_CACHE_ENABLED', default=True, cast=bool)
+ANALYSIS_CACHE_MAX_ENTRIES = 1024
+ANALYSIS_CACHE_TTL = 24 * 60 * 60  # seconds, in-process tier
+ANALYSIS_CACHE_DB_TTL = config('ANALYSIS_CACHE_DB_TTL', default=30 * 24 * 60 * 60, cast=int)  # seconds, 0 keeps entries forever
+ANALYSIS_CACHE_PRUNE_INTERVAL = 60 * 60  # seconds between expired-entry sweeps by the analysis worker
+
+# Image payload sent to the model: the largest size (longest edge), then the highest
+# quality, that fits the byte budget; tune with `manage.py evaluate_payloads`
+ANALYSIS_PAYLOAD_ENABLED = config('ANALYSIS_PAYLOAD_ENABLED', default=True, cast=bool)
+ANALYSIS_PAYLOAD_MAX_BYTES = config('ANALYSIS_PAYLOAD_MAX_BYTES', default=200 * 1024, cast=int)
+ANALYSIS_PAYLOAD_SIZES = (1024, 768, 512, 384)
+ANALYSIS_PAYLOAD_QUALITIES = (85, 75, 65)
+ANALYSIS_PAYLOAD_FORMAT = 'jpeg'  # or 'webp'
+ANALYSIS_PAYLOAD_COLOUR = 'full'  # 'subsampled' (4:2:0 chroma) or 'grayscale'
+ANALYSIS_PAYLOAD_CACHE_ENTRIES = 256  # encoded payloads kept per process
+
+# Reuse diagnoses of perceptually similar images (Hamming distance out of 64 bits)
+NEAR_DUPLICATE_ENABLED = config('NEAR_DUPLICATE_ENABLED', default=True, cast=bool)
+NEAR_DUPLICATE_MAX_DISTANCE = 6
+NEAR_DUPLICATE_WARM_UP = config('NEAR_DUPLICATE_WARM_UP', default=True, cast=bool)  # build the index when a server process starts
+
+# Circuit breaker around Gemini calls (per process)
+CIRCUIT_BREAKER_ENABLED = config('CIRCUIT_BREAKER_ENABLED', default=True, cast=bool)
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failed or slow calls before the circuit opens
+CIRCUIT_SLOW_CALL_SECONDS = 20  # calls slower than this count as failures
+CIRCUIT_RESET_TIMEOUT = 30  # seconds open before half-open probing starts
+CIRCUIT_HALF_OPEN_MAX_CALLS = 1
+CIRCUIT_DEGRADED_MAX_DISTANCE = 12  # looser near-duplicate match used while the circuit is open
+
+# Local CPU triage classifier; train it with `manage.py train_triage_model`
+TRIAGE_ENABLED = config('TRIAGE_ENABLED', default=True, cast=bool)
+TRIAGE_MODEL_PATH = config('TRIAGE_MODEL_PATH', default=str(BASE_DIR / 'triage_model.npz'))
+TRIAGE_CONFIDENCE_THRESHOLD = 0.9  # below this the image is escalated to Gemini
 
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
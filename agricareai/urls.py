@@ -14,10 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+from urllib.parse import urlsplit
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from detection.views import MediaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,5 +29,9 @@ urlpatterns = [
     path('', include('detection.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploads are served (or handed to the front proxy) by an access-checked view, unless
+# MEDIA_URL points at another host such as a CDN.
+if not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', MediaView.as_view(), name='media'),
+    ]
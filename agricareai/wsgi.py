@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agricareai.settings')
 
 application = get_wsgi_application()
+
+# Build the near-duplicate index before the first upload searches it.
+from detection.phash import near_duplicates  # noqa: E402
+
+near_duplicates.warm_up()
@@ -2,12 +2,72 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 from django.utils.html import format_html
-from .models import CropImage, DetectionHistory
-import csv
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from . import exports
+from .models import AnalysisJob, CropImage, DailyDiseaseStat, DetectionHistory
+
+class StreamingExportMixin:
+    """
+    Admin actions exporting the selected rows as CSV or JSON Lines, optionally gzipped.
+
+    The response is streamed from a chunked database cursor, so memory use stays
+    flat however many rows are selected. Set ``export_name`` to a key of
+    ``exports.EXPORTS``.
+    """
+    export_name = None
+
+    def _export(self, queryset, fmt, compress=False):
+        response = StreamingHttpResponse(
+            exports.stream(self.export_name, queryset, fmt, compress),
+            # Gzip is the file format here, not a Content-Encoding, so browsers save the .gz as-is.
+            content_type='application/gzip' if compress else exports.CONTENT_TYPES[fmt],
+        )
+        filename = exports.filename(self.export_name, fmt, compress)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_to_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+    export_to_csv.short_description = _('Export selected %(verbose_name_plural)s to CSV')
+
+    def export_to_csv_gz(self, request, queryset):
+        return self._export(queryset, 'csv', compress=True)
+    export_to_csv_gz.short_description = _('Export selected %(verbose_name_plural)s to CSV (gzip)')
+
+    def export_to_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+    export_to_jsonl.short_description = _('Export selected %(verbose_name_plural)s to JSON Lines')
+
+    def export_to_jsonl_gz(self, request, queryset):
+        return self._export(queryset, 'jsonl', compress=True)
+    export_to_jsonl_gz.short_description = _('Export selected %(verbose_name_plural)s to JSON Lines (gzip)')
+
+class RollupValueFilter(admin.SimpleListFilter):
+    """
+    List filter whose choices come from the daily rollups instead of a DISTINCT scan of every crop image.
+    """
+    def lookups(self, request, model_admin):
+        values = (
+            DailyDiseaseStat.objects.exclude(**{self.parameter_name: ''})
+            .values_list(self.parameter_name, flat=True).distinct().order_by(self.parameter_name)
+        )
+        return [(value, value) for value in values]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+class DiseaseNameFilter(RollupValueFilter):
+    title = _('Disease Name')
+    parameter_name = 'disease_name'
+
+class PlantTypeFilter(RollupValueFilter):
+    title = _('Plant Type')
+    parameter_name = 'plant_type'
 
 @admin.register(CropImage)
-class CropImageAdmin(admin.ModelAdmin):
+class CropImageAdmin(StreamingExportMixin, admin.ModelAdmin):
     """
     Admin interface for managing CropImage instances.
     """
@@ -24,29 +84,34 @@ class CropImageAdmin(admin.ModelAdmin):
     )
     list_filter = (
         'is_processed',
+        'from_cache',
+        'degraded',
+        'triaged_locally',
         'language',
-        'disease_name',
-        'plant_type',
+        DiseaseNameFilter,
+        PlantTypeFilter,
         ('uploaded_at', admin.DateFieldListFilter),
     )
     search_fields = ('plant_type', 'disease_name', 'explanation', 'treatment')
     list_per_page = 20
-    readonly_fields = ('uploaded_at', 'processing_error', 'image_preview')
+    export_name = 'crop_images'
+    readonly_fields = ('uploaded_at', 'updated_at', 'version', 'processing_error', 'image_preview', 'image_hash', 'session_key')
     list_select_related = ('user',)
     autocomplete_fields = ('user',)
+    raw_id_fields = ('duplicate_of',)
     ordering = ('-uploaded_at',)
     fieldsets = (
         (_('Image Details'), {
-            'fields': ('image', 'image_preview', 'user', 'language', 'uploaded_at'),
+            'fields': ('image', 'image_preview', 'image_hash', 'user', 'session_key', 'language', 'uploaded_at'),
         }),
         (_('AI Analysis Results'), {
             'fields': ('plant_type', 'disease_name', 'confidence', 'explanation', 'treatment'),
         }),
         (_('Processing Status'), {
-            'fields': ('is_processed', 'processing_error'),
+            'fields': ('is_processed', 'from_cache', 'degraded', 'triaged_locally', 'duplicate_of', 'processing_error', 'version', 'updated_at'),
         }),
     )
-    actions = ['export_to_csv']
+    actions = ['export_to_csv', 'export_to_csv_gz', 'export_to_jsonl', 'export_to_jsonl_gz']
 
     def get_queryset(self, request):
         """
@@ -60,8 +125,8 @@ class CropImageAdmin(admin.ModelAdmin):
         """
         if obj.image:
             return format_html(
-                '<img src="{}" style="max-height: 50px; max-width: 50px;" />',
-                obj.image.url
+                '<img src="{}" style="max-height: 50px; max-width: 50px;" loading="lazy" />',
+                obj.variant_url('thumb') or obj.image.url
             )
         return '-'
     thumbnail.short_description = _('Thumbnail')
@@ -73,7 +138,7 @@ class CropImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-height: 300px; max-width: 300px;" />',
-                obj.image.url
+                obj.variant_url('preview') or obj.image.url
             )
         return '-'
     image_preview.short_description = _('Image Preview')
@@ -85,39 +150,8 @@ class CropImageAdmin(admin.ModelAdmin):
         return f"{obj.confidence:.2f}%" if obj.confidence is not None else '-'
     confidence_display.short_description = _('Confidence')
 
-    def export_to_csv(self, request, queryset):
-        """
-        Export selected CropImage records to CSV.
-        """
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="crop_images_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'User', 'Plant Type', 'Disease Name', 'Confidence',
-            'Explanation', 'Treatment', 'Language', 'Uploaded At', 'Processed', 'Image URL'
-        ])
-
-        for obj in queryset:
-            writer.writerow([
-                obj.id,
-                obj.user.username if obj.user else 'Anonymous',
-                obj.plant_type,
-                obj.disease_name,
-                obj.confidence,
-                obj.explanation,
-                obj.treatment,
-                obj.language,
-                obj.uploaded_at,
-                obj.is_processed,
-                obj.image.url if obj.image else '',
-            ])
-
-        return response
-    export_to_csv.short_description = _('Export selected images to CSV')
-
 @admin.register(DetectionHistory)
-class DetectionHistoryAdmin(admin.ModelAdmin):
+class DetectionHistoryAdmin(StreamingExportMixin, admin.ModelAdmin):
     """
     Admin interface for managing DetectionHistory instances.
     """
@@ -135,6 +169,7 @@ class DetectionHistoryAdmin(admin.ModelAdmin):
     )
     search_fields = ('session_id', 'ip_address', 'user_agent', 'crop_image__plant_type', 'crop_image__disease_name')
     list_per_page = 20
+    export_name = 'detection_history'
     readonly_fields = ('created_at', 'user_agent')
     list_select_related = ('user', 'crop_image')
     autocomplete_fields = ('user', 'crop_image')
@@ -144,7 +179,7 @@ class DetectionHistoryAdmin(admin.ModelAdmin):
             'fields': ('crop_image', 'user', 'session_id', 'ip_address', 'user_agent', 'created_at'),
         }),
     )
-    actions = ['export_to_csv']
+    actions = ['export_to_csv', 'export_to_csv_gz', 'export_to_jsonl', 'export_to_jsonl_gz']
 
     def get_queryset(self, request):
         """
@@ -162,31 +197,41 @@ class DetectionHistoryAdmin(admin.ModelAdmin):
         return '-'
     crop_image_link.short_description = _('Crop Image')
 
-    def export_to_csv(self, request, queryset):
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    """
+    Admin interface for monitoring queued analysis jobs.
+    """
+    list_display = ('id', 'crop_image', 'status', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', ('created_at', admin.DateFieldListFilter))
+    search_fields = ('worker', 'error')
+    list_per_page = 20
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'worker', 'error')
+    list_select_related = ('crop_image',)
+    raw_id_fields = ('crop_image',)
+    ordering = ('-created_at',)
+
+@admin.register(DailyDiseaseStat)
+class DailyDiseaseStatAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the daily disease rollups (rebuilt with ``rebuild_disease_stats``).
+    """
+    list_display = ('day', 'plant_type', 'disease_name', 'language', 'count', 'average_confidence_display')
+    list_filter = ('language', ('day', admin.DateFieldListFilter))
+    search_fields = ('plant_type', 'disease_name')
+    list_per_page = 50
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def average_confidence_display(self, obj):
         """
-        Export selected DetectionHistory records to CSV.
+        Display the average confidence as a percentage.
         """
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="detection_history_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'User', 'Crop Image ID', 'Plant Type', 'Disease Name',
-            'Session ID', 'IP Address', 'User Agent', 'Created At'
-        ])
-
-        for obj in queryset:
-            writer.writerow([
-                obj.id,
-                obj.user.username if obj.user else 'Anonymous',
-                obj.crop_image.id if obj.crop_image else '',
-                obj.crop_image.plant_type if obj.crop_image else '',
-                obj.crop_image.disease_name if obj.crop_image else '',
-                obj.session_id,
-                obj.ip_address,
-                obj.user_agent,
-                obj.created_at,
-            ])
-
-        return response
-    export_to_csv.short_description = _('Export selected detection history to CSV')
\ No newline at end of file
+        average = obj.average_confidence
+        return f"{average:.2f}%" if average is not None else '-'
+    average_confidence_display.short_description = _('Average Confidence')
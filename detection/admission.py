@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_WAITING = 'wait'
+LEASE_RUNNING = 'run'
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a model call cannot be admitted; carries the HTTP status and Retry-After to report.
+    """
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after))
+        super().__init__(f"Analysis capacity exceeded ({reason}); retry after {self.retry_after}s.")
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.reason == 'rate_limited' else 503
+
+
+class AdmissionController:
+    """
+    Global concurrency limit plus token-bucket rate limit for Gemini calls.
+
+    State lives in a small SQLite file so every worker process on the host shares
+    the same limits. Callers wait in a bounded queue; when the queue is full, or a
+    caller waits longer than ``max_wait``, ``AdmissionRejected`` is raised.
+    """
+
+    def __init__(self, path: str, max_concurrency: int, rate: float, burst: int,
+                 max_queue: int, max_wait: float, lease_timeout: float) -> None:
+        self.path = str(path)
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.lease_timeout = lease_timeout
+        self._local = threading.local()
+
+    @contextmanager
+    def admit(self):
+        """
+        Block until a call may proceed, then hold a concurrency slot for the ``with`` body.
+        """
+        lease_id = self._enqueue()
+        started = time.monotonic()
+        try:
+            while True:
+                admitted, wait_hint, reason = self._try_acquire(lease_id)
+                if admitted:
+                    break
+                self._check_deadline(started, wait_hint, reason)
+                time.sleep(wait_hint)
+            self._record_admitted(started)
+            yield
+        finally:
+            self._release(lease_id)
+
+    @asynccontextmanager
+    async def aadmit(self):
+        """
+        Async variant of ``admit`` that waits without blocking the event loop.
+
+        The SQLite transactions can wait up to 10s for the file lock, so they run on
+        executor threads rather than on the loop.
+        """
+        lease_id = await sync_to_async(self._enqueue, thread_sensitive=False)()
+        started = time.monotonic()
+        try:
+            while True:
+                admitted, wait_hint, reason = await sync_to_async(self._try_acquire, thread_sensitive=False)(lease_id)
+                if admitted:
+                    break
+                self._check_deadline(started, wait_hint, reason)
+                await asyncio.sleep(wait_hint)
+            self._record_admitted(started)
+            yield
+        finally:
+            await sync_to_async(self._release, thread_sensitive=False)(lease_id)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the shared queue depth, in-flight calls and available tokens.
+        """
+        with self._transaction() as conn:
+            self._expire_leases(conn)
+            waiting, running = self._lease_counts(conn)
+            tokens = self._refill(conn)
+        return {'queue_depth': waiting, 'in_flight': running, 'tokens': tokens}
+
+    def _enqueue(self) -> str:
+        lease_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            self._expire_leases(conn)
+            waiting, running = self._lease_counts(conn)
+            if waiting >= self.max_queue:
+                metrics.incr('admission_rejections_total', reason='queue_full')
+                raise AdmissionRejected('queue_full', self._drain_estimate(waiting + running))
+            conn.execute(
+                "INSERT INTO leases (id, kind, created) VALUES (?, ?, ?)",
+                (lease_id, LEASE_WAITING, time.time()),
+            )
+        metrics.set_gauge('admission_queue_depth', waiting + 1)
+        return lease_id
+
+    def _try_acquire(self, lease_id: str) -> Tuple[bool, float, str]:
+        with self._transaction() as conn:
+            self._expire_leases(conn)
+            waiting, running = self._lease_counts(conn)
+            metrics.set_gauge('admission_queue_depth', waiting)
+            metrics.set_gauge('admission_in_flight', running)
+            if running >= self.max_concurrency:
+                return False, 0.05, 'concurrency'
+            tokens = self._refill(conn)
+            if self.rate > 0 and tokens < 1:
+                return False, min(1.0, (1 - tokens) / self.rate), 'rate_limited'
+            if self.rate > 0:
+                conn.execute("UPDATE bucket SET tokens = tokens - 1 WHERE id = 1")
+            conn.execute(
+                "UPDATE leases SET kind = ?, created = ? WHERE id = ?",
+                (LEASE_RUNNING, time.time(), lease_id),
+            )
+        return True, 0, ''
+
+    def _release(self, lease_id: str) -> None:
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        except sqlite3.Error as e:
+            # The lease expires on its own after lease_timeout.
+            logger.error(f"Failed to release admission lease: {str(e)}", exc_info=True)
+
+    def _check_deadline(self, started: float, wait_hint: float, reason: str) -> None:
+        if time.monotonic() - started + wait_hint > self.max_wait:
+            reason = 'rate_limited' if reason == 'rate_limited' else 'overloaded'
+            metrics.incr('admission_rejections_total', reason=reason)
+            raise AdmissionRejected(reason, math.ceil(max(wait_hint, 1)))
+
+    def _record_admitted(self, started: float) -> None:
+        waited = time.monotonic() - started
+        metrics.incr('admission_admitted_total')
+        metrics.incr('admission_wait_seconds_total', waited)
+
+    def _drain_estimate(self, backlog: int) -> int:
+        if self.rate > 0:
+            return math.ceil(backlog / self.rate)
+        return math.ceil(backlog / max(1, self.max_concurrency))
+
+    def _lease_counts(self, conn) -> Tuple[int, int]:
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM leases GROUP BY kind").fetchall())
+        return counts.get(LEASE_WAITING, 0), counts.get(LEASE_RUNNING, 0)
+
+    def _expire_leases(self, conn) -> None:
+        # Leases left behind by crashed processes would otherwise hold capacity forever.
+        now = time.time()
+        conn.execute(
+            "DELETE FROM leases WHERE (kind = ? AND created < ?) OR (kind = ? AND created < ?)",
+            (LEASE_WAITING, now - self.max_wait - 60, LEASE_RUNNING, now - self.lease_timeout),
+        )
+
+    def _refill(self, conn) -> float:
+        now = time.time()
+        tokens, updated = conn.execute("SELECT tokens, updated FROM bucket WHERE id = 1").fetchone()
+        if self.rate > 0:
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        conn.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+        return tokens
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, kind TEXT, created REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO bucket (id, tokens, updated) VALUES (1, ?, ?)",
+                (float(self.burst), time.time()),
+            )
+            self._local.conn = conn
+        return conn
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> Optional[AdmissionController]:
+    """
+    Return the process-wide controller built from settings, or None when admission control is off.
+    """
+    global _controller
+    if not getattr(settings, 'ADMISSION_CONTROL_ENABLED', True):
+        return None
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                path=getattr(settings, 'ADMISSION_STATE_PATH', settings.BASE_DIR / 'admission.sqlite3'),
+                max_concurrency=getattr(settings, 'ADMISSION_MAX_CONCURRENCY', 8),
+                rate=getattr(settings, 'ADMISSION_RATE_PER_SECOND', 5.0),
+                burst=getattr(settings, 'ADMISSION_BURST', 10),
+                max_queue=getattr(settings, 'ADMISSION_MAX_QUEUE', 50),
+                max_wait=getattr(settings, 'ADMISSION_MAX_WAIT', 30),
+                lease_timeout=getattr(settings, 'ADMISSION_LEASE_TIMEOUT', 300),
+            )
+        return _controller
+
+
+def reset_controller() -> None:
+    global _controller
+    with _controller_lock:
+        _controller = None
+
+
+@contextmanager
+def admit():
+    """
+    Admit one model call under the shared limits (no-op when admission control is disabled).
+
+    Raises:
+        AdmissionRejected: If the wait queue is full or the wait exceeds ``ADMISSION_MAX_WAIT``.
+    """
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    with controller.admit():
+        yield
+
+
+@asynccontextmanager
+async def aadmit():
+    """
+    Async variant of ``admit``.
+    """
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    async with controller.aadmit():
+        yield
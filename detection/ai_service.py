@@ -1,71 +1,373 @@
+import base64
+import io
 import logging
 import json
+import os
 import re
-from typing import Dict, Optional, Union
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from pathlib import Path
 from PIL import Image
+import requests
+from requests.adapters import HTTPAdapter
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 import google.generativeai as genai
+from . import admission, circuit, metrics, payload, result_cache, triage
+from .admission import AdmissionRejected
+from .circuit import CircuitOpenError
+from .payload import Payload
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever _build_prompt changes so cached results from older prompts are not reused.
+PROMPT_VERSION = "1"
+
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+
+# Diagnosis fields of a result, in the order the prompt asks the model for them.
+RESULT_FIELDS = ('plant_type', 'disease_name', 'confidence', 'explanation', 'treatment')
+
 class GlobalCropAnalyzer:
-    def __init__(self, language: str = "en") -> None:
+    def __init__(self, language: str = "en", model_name: Optional[str] = None) -> None:
         """
         Initialize GlobalCropAnalyzer with Gemini API for crop disease analysis worldwide.
 
+        The underlying Gemini client is shared per process (see ``get_generative_model``),
+        so prefer ``get_analyzer`` over constructing analyzers per request.
+
         Args:
-            language (str): Language for prompts and responses (e.g., 'en' for English, 'es' for Spanish).
+            language (str): Default language for prompts and responses (e.g., 'en' for English, 'es' for Spanish).
+            model_name (str, optional): Gemini model to use; defaults to ``GEMINI_MODEL_NAME``.
         """
-        self.model = None
         self.language = language
-        api_key = getattr(settings, "GEMINI_API_KEY", None)
-        if api_key:
-            try:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                logger.info("Global crop analyzer initialized successfully.")
-            except Exception as e:
-                logger.error(f"Failed to initialize Gemini AI model: {e}", exc_info=True)
-                self.model = None
-        else:
-            logger.warning("Gemini API key not configured; using mock responses.")
+        self.model_name = model_name or getattr(settings, 'GEMINI_MODEL_NAME', DEFAULT_MODEL_NAME)
+        self.model = get_generative_model(self.model_name)
 
-    def analyze_crop_image(self, image_path: str) -> Dict[str, Union[str, float, bool]]:
+    def analyze_crop_image(self, image_path: str, image: Optional[Image.Image] = None,
+                           language: Optional[str] = None,
+                           on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Union[str, float, bool]]:
         """
         Analyze crop image for diseases, suitable for global crops and conditions.
 
+        Results are looked up in the content-hash cache first; a hit is returned without
+        calling the model and carries ``cached=True``. Next the local triage model (see
+        ``detection.triage``) may answer confidently on CPU, flagged ``local=True``. Model calls go through the circuit
+        breaker and admission control (see ``detection.circuit`` and ``detection.admission``).
+
         Args:
             image_path (str): Path to the image file.
+            image (Image.Image, optional): Already-decoded image (e.g. from ingest); when given,
+                the file at ``image_path`` is not reopened.
+            language (str, optional): Language for this call; defaults to the analyzer's language.
+            on_field (callable, optional): ``on_field(name, value)`` is called for each result
+                field (``RESULT_FIELDS``) as soon as it is known. The model response is then
+                streamed and parsed incrementally (see ``detection.streaming.FieldParser``);
+                cached, triaged and mock results report all fields at once.
 
         Returns:
             dict: Contains disease analysis results including plant type, disease name,
                   confidence score, explanation, treatment advice, and success status.
-        """
-        if not Path(image_path).is_file():
-            return self._get_error_response("Invalid image path provided.")
 
-        if not self.model:
-            return self._get_mock_response()
+        Raises:
+            AdmissionRejected: If the call could not be admitted; callers should retry later
+                rather than record a failed analysis.
+            CircuitOpenError: If the circuit breaker is open; callers should degrade or retry later.
+        """
+        language = language or self.language
+        if image is None and not Path(image_path).is_file():
+            return self._get_error_response("Invalid image path provided.", language)
 
         try:
+            if image is not None:
+                return self._analyze_image(image, language, on_field)
             with Image.open(image_path) as img:
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
+                return self._analyze_image(img, language, on_field)
+        except (AdmissionRejected, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Gemini API error: {e}", exc_info=True)
+            return self._get_error_response(str(e), language)
+
+    async def analyze_crop_image_async(self, image_path: str, image: Optional[Image.Image] = None,
+                                       language: Optional[str] = None) -> Dict[str, Union[str, float, bool]]:
+        """
+        Async variant of ``analyze_crop_image`` that awaits the Gemini call.
 
-                prompt = self._build_prompt()
+        Cache lookups, hashing and response parsing run in worker threads so the event
+        loop is only held for the network round trip.
 
-                response = self.model.generate_content([prompt, img])
-                return self._parse_gemini_response(response.text)
+        Args:
+            image_path (str): Path to the image file.
+            image (Image.Image, optional): Already-decoded image (e.g. from ingest).
+            language (str, optional): Language for this call; defaults to the analyzer's language.
+
+        Returns:
+            dict: Same result format as ``analyze_crop_image``.
+        """
+        language = language or self.language
+        if image is None and not Path(image_path).is_file():
+            return self._get_error_response("Invalid image path provided.", language)
+
+        try:
+            if image is None:
+                image = await sync_to_async(load_image, thread_sensitive=False)(image_path)
+            img, cache_key, cached = await sync_to_async(self._prepare)(image, language)
+            if cached is not None:
+                return cached
+            if not self.model:
+                return self._get_mock_response()
+            image_part = await sync_to_async(self._image_part, thread_sensitive=False)(img, language)
 
+            circuit.check()
+            async with admission.aadmit():
+                with metrics.span('model_call', language), circuit.guard():
+                    self.model.record_call()
+                    response = await self.model.generate_content_async([self._build_prompt(language), image_part])
+            return await sync_to_async(self._finish)(response.text, cache_key, language)
+        except (AdmissionRejected, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Gemini API error: {e}", exc_info=True)
-            return self._get_error_response(str(e))
+            return self._get_error_response(str(e), language)
+
+    def analyze_crop_images(self, images: List[Image.Image], language: Optional[str] = None,
+                            batch_size: Optional[int] = None) -> List[Any]:
+        """
+        Analyze several images, packing up to ``batch_size`` of them into each model call.
+
+        Cache hits and confident triage answers are returned without a call. The remaining
+        images are sent in groups under one indexed prompt, and the model answers with a
+        JSON array. This saves the per-request overhead and the repeated prompt tokens of
+        one call per image. An image whose entry is missing or does not parse, or whose
+        whole batch failed, is analyzed again on its own.
+
+        Args:
+            images (list): Decoded images, e.g. from ingest.
+            language (str, optional): Language for this call; defaults to the analyzer's language.
+            batch_size (int, optional): Images per call; defaults to ``ANALYSIS_BATCH_SIZE``.
+
+        Returns:
+            list: One result per image, in input order. When admission control or the circuit
+                breaker refuses the call for an image, its entry is that ``AdmissionRejected``
+                or ``CircuitOpenError`` instead of a result.
+        """
+        language = language or self.language
+        batch_size = max(1, batch_size or getattr(settings, 'ANALYSIS_BATCH_SIZE', 1))
+        results: List[Any] = [None] * len(images)
+        misses = []
+        for index, image in enumerate(images):
+            try:
+                img, cache_key, cached = self._prepare(image, language)
+            except Exception as e:
+                logger.error(f"Preparing image for analysis failed: {e}", exc_info=True)
+                results[index] = self._get_error_response(str(e), language)
+                continue
+            if cached is not None:
+                results[index] = cached
+            else:
+                misses.append((index, img, cache_key))
+
+        for start in range(0, len(misses), batch_size):
+            group = misses[start:start + batch_size]
+            answers = [None]
+            if len(group) > 1:
+                try:
+                    answers = self._analyze_batch([img for _index, img, _cache_key in group], language)
+                except (AdmissionRejected, CircuitOpenError) as e:
+                    for index, _img, _cache_key in group:
+                        results[index] = e
+                    continue
+            for (index, img, cache_key), answer in zip(group, answers):
+                if answer is not None:
+                    if cache_key:
+                        result_cache.set(cache_key, answer, language, PROMPT_VERSION)
+                    results[index] = answer
+                    continue
+                if len(group) > 1:
+                    metrics.incr('analysis_batch_fallbacks_total')
+                try:
+                    results[index] = self._analyze_prepared(img, cache_key, language)
+                except (AdmissionRejected, CircuitOpenError) as e:
+                    results[index] = e
+                except Exception as e:
+                    logger.error(f"Gemini API error: {e}", exc_info=True)
+                    results[index] = self._get_error_response(str(e), language)
+        return results
+
+    def _analyze_batch(self, images: List[Image.Image], language: str) -> List[Optional[Dict[str, Union[str, float, bool]]]]:
+        """
+        Diagnose several images with one model call.
+
+        Returns:
+            list: A successful result per image, or None where it must be analyzed alone.
+
+        Raises:
+            AdmissionRejected: If the call could not be admitted.
+            CircuitOpenError: If the circuit breaker is open.
+        """
+        if not self.model:
+            return [self._get_mock_response() for _image in images]
+        contents = [self._build_batch_prompt(len(images), language)]
+        for number, img in enumerate(images, start=1):
+            contents.extend([self._batch_label(number, language), self._image_part(img, language)])
+
+        circuit.check()
+        try:
+            with admission.admit():
+                with metrics.span('model_call', language), circuit.guard():
+                    self.model.record_call()
+                    response = self.model.generate_content(contents)
+        except (AdmissionRejected, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Batch Gemini call failed, analyzing images one by one: {e}", exc_info=True)
+            return [None] * len(images)
+        metrics.incr('analysis_batches_total')
+        metrics.incr('analysis_batch_images_total', len(images))
+        with metrics.span('parse_response', language):
+            return self._parse_batch_response(response.text, len(images))
+
+    def _analyze_image(self, img: Image.Image, language: str,
+                       on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Union[str, float, bool]]:
+        """
+        Run the cache lookup and model call for a decoded image.
 
-    def _build_prompt(self) -> str:
+        Args:
+            img (Image.Image): Image to analyze.
+            language (str): Language for the prompt and response.
+            on_field (callable, optional): Field callback; streams the model response when given.
+
+        Returns:
+            dict: Analysis result.
+        """
+        img, cache_key, cached = self._prepare(img, language)
+        if cached is not None:
+            return report_fields(cached, on_field)
+        return self._analyze_prepared(img, cache_key, language, on_field)
+
+    def _analyze_prepared(self, img: Image.Image, cache_key: Optional[str], language: str,
+                          on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Union[str, float, bool]]:
+        """
+        Make the model call for an image that missed the cache and triage (see ``_prepare``).
+        """
+        if not self.model:
+            return report_fields(self._get_mock_response(), on_field)
+
+        prompt = self._build_prompt(language)
+        image_part = self._image_part(img, language)
+
+        circuit.check()
+        with admission.admit():
+            with metrics.span('model_call', language), circuit.guard():
+                self.model.record_call()
+                if on_field is None:
+                    response_text = self.model.generate_content([prompt, image_part]).text
+                else:
+                    response_text = self._stream_response(
+                        self.model.generate_content([prompt, image_part], stream=True), on_field
+                    )
+        return self._finish(response_text, cache_key, language)
+
+    def _stream_response(self, response, on_field: Callable[[str, Any], None]) -> str:
+        """
+        Consume a streamed model response, reporting each field once its value is complete.
+
+        Backends without streaming return a single response object, which is treated as one chunk.
+
+        Returns:
+            str: The full response text.
+        """
+        from .streaming import FieldParser
+
+        parser = FieldParser()
+        parts = []
+        for chunk in response if hasattr(response, '__iter__') else [response]:
+            parts.append(chunk.text)
+            for name, value in parser.feed(chunk.text):
+                _report_field(name, value, on_field)
+        return ''.join(parts)
+
+    def analyze_payload(self, encoded: Payload, language: Optional[str] = None) -> Dict[str, Union[str, float, bool]]:
+        """
+        Diagnose an already-encoded payload with one model call, bypassing the result
+        cache and triage, e.g. to compare payload settings (``evaluate_payloads``).
+
+        Args:
+            encoded (Payload): Encoded image (see ``detection.payload.encode``).
+            language (str, optional): Language for this call; defaults to the analyzer's language.
+
+        Returns:
+            dict: Analysis result; mock results when no model is configured.
+
+        Raises:
+            AdmissionRejected: If the call could not be admitted.
+            CircuitOpenError: If the circuit breaker is open.
+        """
+        language = language or self.language
+        if not self.model:
+            return self._get_mock_response()
+        circuit.check()
+        with admission.admit():
+            with metrics.span('model_call', language), circuit.guard():
+                self.model.record_call()
+                response = self.model.generate_content([self._build_prompt(language), encoded.as_part()])
+        with metrics.span('parse_response', language):
+            return self._parse_gemini_response(response.text)
+
+    def _image_part(self, img: Image.Image, language: str):
+        """
+        The image as sent to the model: the budgeted payload (see ``detection.payload``), or
+        the image itself for the backend to encode when ``ANALYSIS_PAYLOAD_ENABLED`` is off.
+        """
+        if not payload.is_enabled():
+            return img
+        with metrics.span('encode_payload', language):
+            return payload.get_payload(img).as_part()
+
+    def _prepare(self, img: Image.Image, language: str) -> Tuple[Image.Image, Optional[str], Optional[Dict]]:
+        """
+        Normalize the image mode and consult the result cache and the local triage
+        model before a model call.
+
+        Returns:
+            tuple: (RGB image, cache key or None, cached or locally triaged result or None).
+        """
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        cache_key = None
+        if result_cache.is_enabled():
+            with metrics.span('cache_lookup', language) as span:
+                cache_key = result_cache.make_key(img, language, PROMPT_VERSION)
+                cached = result_cache.get(cache_key)
+                span.outcome = 'miss' if cached is None else 'hit'
+            if cached is not None:
+                return img, cache_key, cached
+        with metrics.span('triage', language) as span:
+            local = triage.classify(img, language)
+            span.outcome = 'escalated' if local is None else 'local'
+        return img, cache_key, local
+
+    def _finish(self, response_text: str, cache_key: Optional[str], language: str) -> Dict[str, Union[str, float, bool]]:
+        """
+        Parse a model response and store successful results in the cache.
+        """
+        with metrics.span('parse_response', language):
+            result = self._parse_gemini_response(response_text)
+        if cache_key and result.get('success'):
+            result_cache.set(cache_key, result, language, PROMPT_VERSION)
+        return result
+
+    def _build_prompt(self, language: Optional[str] = None) -> str:
         """
         Build a detailed prompt for crop analysis, applicable to global agricultural contexts.
 
+        Args:
+            language (str, optional): Prompt language; defaults to the analyzer's language.
+
         Returns:
             str: The prompt string in the specified language.
         """
@@ -105,7 +407,90 @@ class GlobalCropAnalyzer:
                 "5. Si no se detecta ninguna enfermedad, indicar estado 'Sano' con consejos preventivos\n"
             )
         }
-        return prompt_templates.get(self.language, prompt_templates["en"])
+        return prompt_templates.get(language or self.language, prompt_templates["en"])
+
+    def _build_batch_prompt(self, count: int, language: Optional[str] = None) -> str:
+        """
+        Extend the single-image prompt to ``count`` labelled images answered with a JSON array.
+
+        Args:
+            count (int): Number of images in the request.
+            language (str, optional): Prompt language; defaults to the analyzer's language.
+
+        Returns:
+            str: The prompt string in the specified language.
+        """
+        batch_templates = {
+            "en": (
+                "\nYou will receive {count} images, each preceded by its label (\"Image 1\", \"Image 2\", ...). "
+                "Diagnose each image independently and respond with a JSON array of {count} objects in the "
+                "format above, in the same order, each with an added \"image\" field holding the image number.\n"
+            ),
+            "es": (
+                "\nRecibirás {count} imágenes, cada una precedida por su etiqueta (\"Imagen 1\", \"Imagen 2\", ...). "
+                "Diagnostica cada imagen de forma independiente y responde con un arreglo JSON de {count} objetos "
+                "en el formato anterior, en el mismo orden, cada uno con un campo adicional \"image\" con el "
+                "número de la imagen.\n"
+            ),
+        }
+        template = batch_templates.get(language or self.language, batch_templates["en"])
+        return self._build_prompt(language) + template.format(count=count)
+
+    def _batch_label(self, number: int, language: Optional[str] = None) -> str:
+        labels = {"en": "Image {number}:", "es": "Imagen {number}:"}
+        return labels.get(language or self.language, labels["en"]).format(number=number)
+
+    def _parse_batch_response(self, response_text: str, count: int) -> List[Optional[Dict[str, Union[str, float, bool]]]]:
+        """
+        Parse a JSON array answer to a batch prompt into one result per image.
+
+        Entries are matched by their ``image`` number, or by position when it is missing.
+
+        Args:
+            response_text (str): Raw text response from Gemini AI.
+            count (int): Number of images in the request.
+
+        Returns:
+            list: Parsed result per image, or None for images without a usable entry.
+        """
+        results: List[Optional[Dict[str, Union[str, float, bool]]]] = [None] * count
+        match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        if not match:
+            logger.warning("No JSON array found in batch response.")
+            return results
+        try:
+            items = json.loads(match.group())
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decoding of batch response failed: {e}")
+            return results
+        if not isinstance(items, list):
+            return results
+        for position, item in enumerate(items):
+            if not isinstance(item, dict) or 'disease_name' not in item:
+                continue
+            try:
+                index = int(item.get('image', position + 1)) - 1
+                if 0 <= index < count and results[index] is None:
+                    results[index] = self._result_from_data(item)
+            except (TypeError, ValueError):
+                continue
+        return results
+
+    def _result_from_data(self, data: Dict[str, Any]) -> Dict[str, Union[str, float, bool]]:
+        """
+        Build a successful result from a decoded JSON answer.
+
+        Raises:
+            ValueError: If the confidence is not a number.
+        """
+        return {
+            'plant_type': data.get('plant_type', 'Unknown'),
+            'disease_name': data.get('disease_name', 'Unknown'),
+            'confidence': float(data.get('confidence', 0)),
+            'explanation': data.get('explanation', 'No explanation provided'),
+            'treatment': data.get('treatment', 'No treatment information available'),
+            'success': True
+        }
 
     def _parse_gemini_response(self, response_text: str) -> Dict[str, Union[str, float, bool]]:
         """
@@ -126,14 +511,7 @@ class GlobalCropAnalyzer:
             json_str = json_match.group()
             data = json.loads(json_str)
 
-            return {
-                'plant_type': data.get('plant_type', 'Unknown'),
-                'disease_name': data.get('disease_name', 'Unknown'),
-                'confidence': float(data.get('confidence', 0)),
-                'explanation': data.get('explanation', 'No explanation provided'),
-                'treatment': data.get('treatment', 'No treatment information available'),
-                'success': True
-            }
+            return self._result_from_data(data)
         except json.JSONDecodeError as e:
             logger.error(f"JSON decoding failed: {e}")
             return self._parse_text_response(response_text)
@@ -186,12 +564,13 @@ class GlobalCropAnalyzer:
             'success': True
         }
 
-    def _get_error_response(self, error_message: str) -> Dict[str, Union[str, float, bool]]:
+    def _get_error_response(self, error_message: str, language: Optional[str] = None) -> Dict[str, Union[str, float, bool]]:
         """
         Format the error response.
 
         Args:
             error_message (str): Description of the error.
+            language (str, optional): Message language; defaults to the analyzer's language.
 
         Returns:
             dict: Standardized error response.
@@ -204,10 +583,303 @@ class GlobalCropAnalyzer:
             'plant_type': 'Unknown',
             'disease_name': 'Analysis Failed',
             'confidence': 0.0,
-            'explanation': error_messages.get(self.language, error_messages["en"]),
+            'explanation': error_messages.get(language or self.language, error_messages["en"]),
             'treatment': (
                 'Please try uploading the image again or consult a local agricultural expert for assistance.'
             ),
             'success': False,
             'error': error_message
-        }
\ No newline at end of file
+        }
+
+
+def report_fields(result: Dict[str, Any], on_field: Optional[Callable[[str, Any], None]]) -> Dict[str, Any]:
+    """
+    Pass every field of a complete successful result to ``on_field`` and return the result.
+    """
+    if on_field is not None and result.get('success', True):
+        for name in RESULT_FIELDS:
+            if name in result:
+                _report_field(name, result[name], on_field)
+    return result
+
+
+def _report_field(name: str, value: Any, on_field: Callable[[str, Any], None]) -> None:
+    if name not in RESULT_FIELDS:
+        return
+    if name == 'confidence':
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+    try:
+        on_field(name, value)
+    except Exception as e:
+        logger.error(f"Reporting field '{name}' failed: {e}", exc_info=True)
+
+
+def load_image(image_path: str) -> Image.Image:
+    """
+    Fully decode an image file so it can be used after the file is closed.
+    """
+    with Image.open(image_path) as img:
+        img.load()
+        return img
+
+
+class _ModelHandle:
+    """
+    Process-wide Gemini model wrapper that counts the calls made through it.
+
+    The first call in a process is labelled ``client='cold'`` (it pays for client setup and
+    the first connection); later ones are ``'warm'``. Whether the transport actually reused
+    a connection is not visible here.
+    """
+
+    def __init__(self, model) -> None:
+        self._model = model
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            warm = self._calls > 0
+            self._calls += 1
+        metrics.incr('gemini_requests_total', client='warm' if warm else 'cold')
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+_state_lock = threading.Lock()
+_state_pid: Optional[int] = None
+_models: Dict[str, Optional[_ModelHandle]] = {}
+_analyzers: Dict[Tuple[str, str], GlobalCropAnalyzer] = {}
+_setup_seconds: Dict[str, float] = {}
+
+
+def _reset_if_forked() -> None:
+    """
+    Drop clients inherited from a parent process; gRPC channels are not fork-safe.
+    """
+    global _state_pid
+    pid = os.getpid()
+    if _state_pid != pid:
+        _models.clear()
+        _analyzers.clear()
+        _state_pid = pid
+
+
+def get_generative_model(model_name: str) -> Optional[_ModelHandle]:
+    """
+    Return the process-wide model for ``model_name`` from the configured backend, building it once.
+
+    The backend is chosen by ``ANALYZER_BACKEND`` (see ``register_backend``). Clients are
+    built once per process (and again after a fork) so pooled keep-alive connections
+    are reused across requests.
+
+    Args:
+        model_name (str): Gemini model name, e.g. 'gemini-1.5-flash'.
+
+    Returns:
+        _ModelHandle: Shared model, or None when the backend serves mock responses.
+
+    Raises:
+        ImproperlyConfigured: If ``ANALYZER_BACKEND`` names an unknown backend.
+    """
+    with _state_lock:
+        _reset_if_forked()
+        if model_name in _models:
+            return _models[model_name]
+
+        backend = getattr(settings, 'ANALYZER_BACKEND', 'gemini')
+        factory = _backends.get(backend)
+        if factory is None:
+            raise ImproperlyConfigured(
+                f"Unknown ANALYZER_BACKEND '{backend}'; choose one of: {', '.join(sorted(_backends))}."
+            )
+        started = time.perf_counter()
+        try:
+            model = factory(model_name)
+        except Exception as e:
+            logger.error(f"Failed to initialize '{backend}' analyzer backend: {e}", exc_info=True)
+            model = None
+        handle = _ModelHandle(model) if model is not None else None
+        if handle is not None:
+            elapsed = time.perf_counter() - started
+            _setup_seconds[model_name] = elapsed
+            metrics.incr('analyzer_setup_seconds_total', elapsed)
+        _models[model_name] = handle
+        return handle
+
+
+def register_backend(name: str, factory: Callable[[str], Any]) -> None:
+    """
+    Make an analyzer backend selectable through ``ANALYZER_BACKEND``.
+
+    Args:
+        name (str): Backend name used in settings.
+        factory (callable): Called with the model name; returns an object with
+            ``generate_content``/``generate_content_async`` (returning objects with
+            ``.text``), or None to serve mock responses. ``generate_content(contents,
+            stream=True)`` should return an iterable of such objects, one per chunk.
+    """
+    _backends[name] = factory
+
+
+def _gemini_backend(model_name: str):
+    """
+    Google Gemini through ``google-generativeai``; mock responses when no API key is set.
+
+    ``genai.configure`` resets the library's cached transport, so it runs only once per process.
+    """
+    global _genai_configured
+    api_key = getattr(settings, "GEMINI_API_KEY", None)
+    if not api_key:
+        logger.warning("Gemini API key not configured; using mock responses.")
+        return None
+    if not _genai_configured:
+        genai.configure(api_key=api_key, transport=getattr(settings, 'GEMINI_TRANSPORT', None))
+        _genai_configured = True
+    model = genai.GenerativeModel(model_name)
+    logger.info("Global crop analyzer initialized successfully.")
+    return model
+
+
+def _mock_backend(model_name: str):
+    """
+    Canned ``_get_mock_response`` results without any network access.
+    """
+    return None
+
+
+def _http_backend(model_name: str):
+    """
+    Any Gemini-compatible REST endpoint at ``ANALYZER_HTTP_URL``, e.g. ``manage.py run_fake_gemini``.
+    """
+    return HTTPGenerativeModel(
+        model_name,
+        base_url=getattr(settings, 'ANALYZER_HTTP_URL', 'http://127.0.0.1:8765'),
+        timeout=getattr(settings, 'ANALYZER_HTTP_TIMEOUT', 60),
+        api_key=getattr(settings, 'GEMINI_API_KEY', ''),
+    )
+
+
+class HTTPGenerativeModel:
+    """
+    Minimal client for the Gemini ``generateContent`` REST API over a pooled session.
+    """
+
+    def __init__(self, model_name: str, base_url: str, timeout: float, api_key: str = '') -> None:
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.stream_url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:streamGenerateContent?alt=sse"
+        self.timeout = timeout
+        self.session = requests.Session()
+        pool_size = getattr(settings, 'ADMISSION_MAX_CONCURRENCY', 8) * 2
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if api_key:
+            self.session.headers['x-goog-api-key'] = api_key
+
+    def generate_content(self, contents, stream: bool = False):
+        payload = {'contents': [{'role': 'user', 'parts': [_to_part(item) for item in contents]}]}
+        if stream:
+            return self._stream(payload)
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return _HTTPResponse(_candidate_text(response.json()))
+
+    def _stream(self, payload):
+        # ``streamGenerateContent`` with ``alt=sse`` sends one ``data:`` line per partial response.
+        with self.session.post(self.stream_url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith('data:'):
+                    yield _HTTPResponse(_candidate_text(json.loads(line[5:])))
+
+    async def generate_content_async(self, contents):
+        return await sync_to_async(self.generate_content, thread_sensitive=False)(contents)
+
+
+class _HTTPResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+def _candidate_text(body: Dict[str, Any]) -> str:
+    candidates = body.get('candidates') or []
+    if not candidates:
+        raise ValueError("Response contained no candidates.")
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts)
+
+
+def _to_part(item) -> Dict[str, Any]:
+    if isinstance(item, dict):
+        # Inline data such as ``Payload.as_part()``.
+        return {'inline_data': {'mime_type': item['mime_type'], 'data': base64.b64encode(item['data']).decode('ascii')}}
+    if isinstance(item, Image.Image):
+        buffer = io.BytesIO()
+        item.save(buffer, format='JPEG', quality=90)
+        return {'inline_data': {'mime_type': 'image/jpeg', 'data': base64.b64encode(buffer.getvalue()).decode('ascii')}}
+    return {'text': str(item)}
+
+
+_backends: Dict[str, Callable[[str], Any]] = {}
+_genai_configured = False
+register_backend('gemini', _gemini_backend)
+register_backend('mock', _mock_backend)
+register_backend('http', _http_backend)
+
+
+def get_analyzer(language: str = "en", model_name: Optional[str] = None) -> GlobalCropAnalyzer:
+    """
+    Return the process-wide analyzer for a model and language, building it on first use.
+
+    Args:
+        language (str): Default analysis language.
+        model_name (str, optional): Gemini model; defaults to ``GEMINI_MODEL_NAME``.
+
+    Returns:
+        GlobalCropAnalyzer: Shared, thread-safe analyzer instance.
+    """
+    model_name = model_name or getattr(settings, 'GEMINI_MODEL_NAME', DEFAULT_MODEL_NAME)
+    key = (model_name, language)
+    with _state_lock:
+        _reset_if_forked()
+        analyzer = _analyzers.get(key)
+    if analyzer is not None:
+        metrics.incr('analyzer_registry_reuses_total')
+        metrics.incr('analyzer_setup_seconds_saved_total', _setup_seconds.get(model_name, 0.0))
+        return analyzer
+
+    analyzer = GlobalCropAnalyzer(language=language, model_name=model_name)
+    with _state_lock:
+        analyzer = _analyzers.setdefault(key, analyzer)
+    metrics.incr('analyzer_registry_builds_total')
+    return analyzer
+
+
+def install_model(model, model_name: Optional[str] = None) -> None:
+    """
+    Use ``model`` (anything with ``generate_content``/``generate_content_async``) for
+    ``model_name`` in this process, e.g. a latency simulator in benchmarks.
+    """
+    model_name = model_name or getattr(settings, 'GEMINI_MODEL_NAME', DEFAULT_MODEL_NAME)
+    with _state_lock:
+        _reset_if_forked()
+        _models[model_name] = _ModelHandle(model) if model is not None else None
+        for key, analyzer in _analyzers.items():
+            if key[0] == model_name:
+                analyzer.model = _models[model_name]
+
+
+def reset_analyzers() -> None:
+    """
+    Forget all shared clients and analyzers (e.g. after settings change in tests or benchmarks).
+    """
+    global _state_pid
+    with _state_lock:
+        _models.clear()
+        _analyzers.clear()
+        _setup_seconds.clear()
+        _state_pid = None
@@ -0,0 +1,137 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image
+
+from . import metrics
+from .ai_service import get_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'ANALYSIS_BATCH_SIZE', 1) > 1
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-image analyses into multi-image model calls.
+
+    The first request waits at most ``max_wait`` seconds for others in the same language
+    to join it; a batch is sent as soon as it holds ``max_size`` images. Batches run on
+    their own threads (see ``GlobalCropAnalyzer.analyze_crop_images``), so collection goes
+    on while earlier batches wait for the model.
+
+    Args:
+        max_size (int): Images per model call.
+        max_wait (float): Seconds the oldest queued image waits for a batch to fill.
+        workers (int): Batches in flight at once.
+    """
+
+    def __init__(self, max_size: int, max_wait: float, workers: int) -> None:
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self._queue: "queue.Queue[Tuple[str, Image.Image, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, image: Image.Image, language: str) -> Future:
+        """
+        Queue an image for analysis.
+
+        Returns:
+            Future: Resolves to the analyzer result, or raises ``AdmissionRejected`` or
+                ``CircuitOpenError`` like ``GlobalCropAnalyzer.analyze_crop_image``.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((language, image, future))
+        return future
+
+    def analyze(self, image: Image.Image, language: str) -> dict:
+        """
+        Analyze an image as part of a batch, blocking until its result is ready.
+        """
+        return self.submit(image, language).result()
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive a fork; start them again in the child.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analysis-batch')
+            threading.Thread(target=self._collect, name='analysis-batcher', daemon=True).start()
+
+    def _collect(self) -> None:
+        pending: Dict[str, List[Tuple[Image.Image, Future]]] = {}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                language, image, future = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                for language, items in pending.items():
+                    self._dispatch(language, items)
+                pending, deadline = {}, None
+                continue
+            items = pending.setdefault(language, [])
+            items.append((image, future))
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+            if len(items) >= self.max_size:
+                self._dispatch(language, pending.pop(language))
+                if not pending:
+                    deadline = None
+
+    def _dispatch(self, language: str, items: List[Tuple[Image.Image, Future]]) -> None:
+        metrics.incr('analysis_micro_batches_total', size=len(items))
+        self._executor.submit(self._run, language, items)
+
+    def _run(self, language: str, items: List[Tuple[Image.Image, Future]]) -> None:
+        close_old_connections()
+        try:
+            with metrics.bind(endpoint='batch', language=language):
+                results = get_analyzer(language).analyze_crop_images(
+                    [image for image, _future in items], language, batch_size=self.max_size
+                )
+            for (_image, future), result in zip(items, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            logger.error(f"Batched analysis crashed: {str(e)}", exc_info=True)
+            for _image, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            close_old_connections()
+
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher:
+    """
+    Return the process-wide micro-batcher configured by the ``ANALYSIS_BATCH_*`` settings.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                max_size=getattr(settings, 'ANALYSIS_BATCH_SIZE', 1),
+                max_wait=getattr(settings, 'ANALYSIS_BATCH_MAX_WAIT', 0.2),
+                workers=getattr(settings, 'ADMISSION_MAX_CONCURRENCY', 8),
+            )
+        return _batcher
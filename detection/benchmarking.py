@@ -0,0 +1,108 @@
+import asyncio
+import io
+import json
+import math
+import random
+import resource
+import sys
+import threading
+import time
+from typing import Dict, Sequence
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+MOCK_RESPONSE = json.dumps({
+    'plant_type': 'Tomato',
+    'disease_name': 'Early Blight',
+    'confidence': 85.0,
+    'explanation': 'Simulated response.',
+    'treatment': 'Simulated treatment.',
+})
+
+
+class SimulatedModel:
+    """
+    Stand-in for the Gemini model that only sleeps for a fixed latency and tracks concurrency.
+    """
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def generate_content(self, contents, **kwargs):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._exit()
+        return _Response(MOCK_RESPONSE)
+
+    async def generate_content_async(self, contents, **kwargs):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._exit()
+        return _Response(MOCK_RESPONSE)
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+def make_upload(seed: int) -> SimpleUploadedFile:
+    rnd = random.Random(seed)
+    img = Image.new('RGB', (16, 16))
+    img.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(256)])
+    buffer = io.BytesIO()
+    img.resize((320, 240)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(f'bench_{seed}.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of ``values`` (0 for an empty sequence).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(seconds: Sequence[float], elapsed: float) -> Dict[str, float]:
+    """
+    Throughput and p50/p95/p99 latency (in milliseconds) for one benchmark scenario.
+    """
+    return {
+        'requests': len(seconds),
+        'seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(seconds) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(seconds, 50) * 1000, 2),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 2),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 2),
+        'max_ms': round(max(seconds, default=0) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process so far, in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere.
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
@@ -0,0 +1,195 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_HALF_OPEN = 'half_open'
+STATE_OPEN = 'open'
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the model while the circuit is open.
+    """
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        self.name = name
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"AI service unavailable (circuit '{name}' open); retry after {self.retry_after}s.")
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker around a remote call.
+
+    The circuit opens after ``failure_threshold`` consecutive failures, where a call
+    slower than ``slow_call_seconds`` also counts as a failure. While open, calls fail
+    fast with ``CircuitOpenError``. After ``reset_timeout`` seconds a limited number of
+    half-open probe calls are let through; a successful probe closes the circuit and a
+    failed one opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 20,
+                 reset_timeout: float = 30, half_open_max_calls: int = 1) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def check(self) -> None:
+        """
+        Fail fast while the circuit is open, without taking a half-open probe slot.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state != STATE_OPEN:
+                return
+            retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+        metrics.incr('circuit_short_circuited_total', circuit=self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    @contextmanager
+    def guard(self):
+        """
+        Wrap one remote call: fail fast while open and record the call's outcome and latency.
+
+        Raises:
+            CircuitOpenError: If the circuit is open or its half-open probes are in use.
+        """
+        probe = self._before_call()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self._record(success=False, probe=probe)
+            raise
+        elapsed = time.perf_counter() - started
+        slow = elapsed > self.slow_call_seconds
+        if slow:
+            metrics.incr('circuit_slow_calls_total', circuit=self.name)
+        self._record(success=not slow, probe=probe)
+
+    def _before_call(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == STATE_CLOSED:
+                return False
+            if self._state == STATE_HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+        metrics.incr('circuit_short_circuited_total', circuit=self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _record(self, success: bool, probe: bool) -> None:
+        with self._lock:
+            if probe:
+                self._probes -= 1
+            if success:
+                if self._state != STATE_CLOSED:
+                    logger.info(f"Circuit '{self.name}' closed after a successful probe.")
+                self._state = STATE_CLOSED
+                self._failures = 0
+            else:
+                self._failures += 1
+                if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._open()
+            self._publish()
+
+    def _open(self) -> None:
+        if self._state != STATE_OPEN:
+            logger.warning(f"Circuit '{self.name}' opened after {self._failures} failure(s).")
+            metrics.incr('circuit_opened_total', circuit=self.name)
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+
+    def _maybe_half_open(self) -> None:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = STATE_HALF_OPEN
+            self._probes = 0
+            self._publish()
+
+    def _publish(self) -> None:
+        metrics.set_gauge('circuit_state', STATE_VALUES[self._state], circuit=self.name)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str = 'gemini') -> CircuitBreaker:
+    """
+    Return the process-wide breaker for ``name``, configured from settings.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                failure_threshold=getattr(settings, 'CIRCUIT_FAILURE_THRESHOLD', 5),
+                slow_call_seconds=getattr(settings, 'CIRCUIT_SLOW_CALL_SECONDS', 20),
+                reset_timeout=getattr(settings, 'CIRCUIT_RESET_TIMEOUT', 30),
+                half_open_max_calls=getattr(settings, 'CIRCUIT_HALF_OPEN_MAX_CALLS', 1),
+            )
+            _breakers[name] = breaker
+        return breaker
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'CIRCUIT_BREAKER_ENABLED', True)
+
+
+def check(name: Optional[str] = None) -> None:
+    """
+    Raise ``CircuitOpenError`` if the named circuit is open (no-op when ``CIRCUIT_BREAKER_ENABLED`` is off).
+
+    Call this before queueing for admission so an open circuit fails immediately.
+    """
+    if is_enabled():
+        get_breaker(name or 'gemini').check()
+
+
+def guard(name: Optional[str] = None):
+    """
+    Guard a model call with the named breaker (no-op when ``CIRCUIT_BREAKER_ENABLED`` is off).
+    """
+    if not is_enabled():
+        return _noop()
+    return get_breaker(name or 'gemini').guard()
+
+
+@contextmanager
+def _noop():
+    yield
@@ -0,0 +1,151 @@
+import csv
+import datetime
+import json
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from django.db.models import QuerySet
+
+from .models import CropImage, DetectionHistory
+from .storage import image_storage
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+# Rows fetched per database round trip (a server-side cursor on PostgreSQL).
+CHUNK_SIZE = 2000
+# Rows encoded into each chunk handed to the response or file.
+ROWS_PER_CHUNK = 500
+
+
+class Export:
+    """
+    Column layout of one exportable model.
+
+    Args:
+        name (str): Export name, also the default file name stem.
+        columns (list): (header, ``values()`` lookup) pairs, in output order.
+        convert (dict, optional): header -> function applied to that column's raw value.
+    """
+
+    def __init__(self, name: str, columns: List[Tuple[str, str]], convert: Dict[str, Callable] = None) -> None:
+        self.name = name
+        self.headers = [header for header, _lookup in columns]
+        self.lookups = [lookup for _header, lookup in columns]
+        self.convert = convert or {}
+
+    def rows(self, queryset: QuerySet, chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+        """
+        Yield one list of column values per row, in constant memory.
+
+        Values come straight from ``values_list`` with joins done in SQL, so no
+        model instances are built and related rows are not fetched one by one.
+        """
+        converters = [self.convert.get(header) for header in self.headers]
+        for values in queryset.order_by('pk').values_list(*self.lookups).iterator(chunk_size=chunk_size):
+            yield [convert(value) if convert else value for convert, value in zip(converters, values)]
+
+
+def _username(value):
+    return value or 'Anonymous'
+
+
+def _image_url(name):
+    return image_storage().url(name) if name else ''
+
+
+EXPORTS = {
+    'crop_images': Export('crop_images', [
+        ('ID', 'id'),
+        ('User', 'user__username'),
+        ('Plant Type', 'plant_type'),
+        ('Disease Name', 'disease_name'),
+        ('Confidence', 'confidence'),
+        ('Explanation', 'explanation'),
+        ('Treatment', 'treatment'),
+        ('Language', 'language'),
+        ('Uploaded At', 'uploaded_at'),
+        ('Processed', 'is_processed'),
+        ('Image URL', 'image'),
+    ], convert={'User': _username, 'Image URL': _image_url}),
+    'detection_history': Export('detection_history', [
+        ('ID', 'id'),
+        ('User', 'user__username'),
+        ('Crop Image ID', 'crop_image_id'),
+        ('Plant Type', 'crop_image__plant_type'),
+        ('Disease Name', 'crop_image__disease_name'),
+        ('Session ID', 'session_id'),
+        ('IP Address', 'ip_address'),
+        ('User Agent', 'user_agent'),
+        ('Created At', 'created_at'),
+    ], convert={'User': _username}),
+}
+EXPORT_MODELS = {'crop_images': CropImage, 'detection_history': DetectionHistory}
+
+
+class _Echo:
+    # csv.writer target that hands back each formatted line instead of storing it.
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(export: Export, rows: Iterable[list], fmt: str) -> Iterator[bytes]:
+    """
+    Encode rows as CSV (with a header line) or JSON Lines, ``ROWS_PER_CHUNK`` rows per chunk.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(export.headers).encode('utf-8')
+        line = writer.writerow
+    else:
+        headers = export.headers
+
+        def line(row):
+            return json.dumps(dict(zip(headers, row)), default=_json_default, ensure_ascii=False) + '\n'
+
+    lines = []
+    for row in rows:
+        lines.append(line(row))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip a byte stream incrementally.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(name: str, queryset: QuerySet, fmt: str = 'csv', compress: bool = False) -> Iterator[bytes]:
+    """
+    Stream an export of ``queryset`` as encoded (and optionally gzipped) byte chunks.
+
+    Args:
+        name (str): Key of ``EXPORTS``.
+        queryset (QuerySet): Rows of the matching model to export.
+        fmt (str): 'csv' or 'jsonl'.
+        compress (bool): Gzip the output.
+    """
+    export = EXPORTS[name]
+    chunks = encode(export, export.rows(queryset), fmt)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def filename(name: str, fmt: str, compress: bool = False) -> str:
+    return f"{name}_export.{fmt}" + ('.gz' if compress else '')
@@ -0,0 +1,210 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (plant types, disease name, explanation, treatment) the fake server answers with.
+DIAGNOSES = [
+    (('Rice', 'Wheat', 'Tomato', 'Maize'), 'Healthy',
+     'Leaves are uniformly green with no visible lesions, spots or wilting.',
+     'No treatment needed. Keep regular irrigation and scout weekly.'),
+    (('Rice',), 'Bacterial Blight',
+     'Water-soaked streaks along the leaf margins turning yellow to white.',
+     'Use resistant varieties, avoid excess nitrogen and drain fields periodically.'),
+    (('Rice',), 'Brown Spot',
+     'Oval brown lesions with grey centres scattered across the leaf blade.',
+     'Apply balanced fertiliser and a mancozeb or propiconazole spray.'),
+    (('Rice',), 'Leaf Blast',
+     'Diamond-shaped lesions with grey centres and brown margins.',
+     'Apply tricyclazole at early symptoms and avoid late nitrogen top-dressing.'),
+    (('Tomato', 'Potato'), 'Early Blight',
+     'Dark concentric rings on older leaves surrounded by yellow halos.',
+     'Remove infected leaves, rotate crops and apply copper-based fungicide.'),
+    (('Wheat', 'Grape', 'Cucumber'), 'Powdery Mildew',
+     'White powdery growth on the upper leaf surface.',
+     'Apply sulphur or potassium bicarbonate sprays and improve air flow.'),
+    (('Grape', 'Cucumber'), 'Downy Mildew',
+     'Yellow angular patches above with grey downy growth beneath.',
+     'Apply metalaxyl or copper fungicide and avoid overhead irrigation.'),
+    (('Tomato', 'Cucumber', 'Tobacco'), 'Mosaic Virus',
+     'Mottled light and dark green mosaic pattern with leaf distortion.',
+     'Remove infected plants, control aphids and disinfect tools.'),
+]
+
+# Streamed answers are split into this many chunks; the first arrives after this share of the latency.
+STREAM_CHUNKS = 8
+STREAM_FIRST_CHUNK_SHARE = 0.3
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Build a latency sampler from a spec such as 'fixed:1.5', 'uniform:0.5,3',
+    'lognormal:2,0.6' (median, sigma) or 'exponential:1.5' (mean).
+
+    Raises:
+        ValueError: If the spec is malformed or names an unknown distribution.
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value.strip()]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rnd: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rnd: rnd.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rnd: rnd.lognormvariate(mu, values[1])
+    if kind == 'exponential' and len(values) == 1:
+        return lambda rnd: rnd.expovariate(1 / values[0])
+    raise ValueError(f"Invalid latency spec '{spec}'.")
+
+
+class FakeGeminiBehavior:
+    """
+    Decides the latency and outcome of each fake ``generateContent`` call.
+
+    Args:
+        latency (str): Latency spec for ``parse_latency``.
+        tail_rate (float): Fraction of calls that take ``tail_latency`` seconds instead.
+        error_rate (float): Fraction of calls answered with HTTP 500/503.
+        rate_limit_rate (float): Fraction of calls answered with HTTP 429.
+        malformed_rate (float): Fraction of calls whose text is not JSON.
+        seed (int, optional): Seed for reproducible runs.
+    """
+
+    def __init__(self, latency: str = 'lognormal:1.5,0.5', tail_rate: float = 0.0, tail_latency: float = 30.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, malformed_rate: float = 0.0,
+                 seed: Optional[int] = None) -> None:
+        self.sample_latency = parse_latency(latency)
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def next_call(self, images: int = 1) -> Tuple[float, int, dict]:
+        """
+        Args:
+            images (int): Images in the request; several are answered with a JSON array.
+
+        Returns:
+            tuple: (seconds to sleep, HTTP status, JSON body).
+        """
+        with self._lock:
+            rnd = self._random
+            latency = self.tail_latency if rnd.random() < self.tail_rate else self.sample_latency(rnd)
+            roll = rnd.random()
+            if roll < self.rate_limit_rate:
+                outcome = 'rate_limited'
+                status, body = 429, _error_body(429, 'RESOURCE_EXHAUSTED', 'Quota exceeded.')
+            elif roll < self.rate_limit_rate + self.error_rate:
+                outcome = 'error'
+                status = rnd.choice([500, 503])
+                body = _error_body(status, 'UNAVAILABLE' if status == 503 else 'INTERNAL', 'Simulated failure.')
+            elif roll < self.rate_limit_rate + self.error_rate + self.malformed_rate:
+                outcome = 'malformed'
+                status, body = 200, _text_body('The leaf appears to show some discoloration; consult an expert.')
+            else:
+                outcome = 'ok'
+                if images > 1:
+                    answer = [dict(_diagnosis(rnd), image=number) for number in range(1, images + 1)]
+                else:
+                    answer = _diagnosis(rnd)
+                status, body = 200, _text_body(json.dumps(answer))
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        return max(0.0, latency), status, body
+
+
+def _diagnosis(rnd: random.Random) -> dict:
+    plants, disease, explanation, treatment = rnd.choice(DIAGNOSES)
+    return {
+        'plant_type': rnd.choice(plants),
+        'disease_name': disease,
+        'confidence': round(rnd.uniform(55, 99), 1),
+        'explanation': explanation,
+        'treatment': treatment,
+    }
+
+
+def _count_images(request: bytes) -> int:
+    try:
+        contents = json.loads(request or b'{}').get('contents') or [{}]
+        return sum('inline_data' in part for part in contents[0].get('parts', [])) or 1
+    except (ValueError, AttributeError):
+        return 1
+
+
+def _text_body(text: str) -> dict:
+    return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+
+def _error_body(code: int, status: str, message: str) -> dict:
+    return {'error': {'code': code, 'status': status, 'message': message}}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        method = self.path.split('?', 1)[0]
+        if not method.endswith((':generateContent', ':streamGenerateContent')):
+            self._send(404, _error_body(404, 'NOT_FOUND', 'Unknown method.'))
+            return
+        latency, status, body = self.server.behavior.next_call(images=_count_images(request))
+        if method.endswith(':streamGenerateContent') and status == 200:
+            self._send_stream(latency, body)
+            return
+        time.sleep(latency)
+        self._send(status, body)
+
+    def do_GET(self):
+        self._send(200, {'status': 'ok', 'counts': self.server.behavior.counts})
+
+    def _send(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, latency: float, body: dict) -> None:
+        # Like the real API: the first chunk arrives after part of the latency, the rest trickles in.
+        text = body['candidates'][0]['content']['parts'][0]['text']
+        size = max(1, -(-len(text) // STREAM_CHUNKS))
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        time.sleep(latency * STREAM_FIRST_CHUNK_SHARE)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(_text_body(chunk))}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(latency * (1 - STREAM_FIRST_CHUNK_SHARE) / len(chunks))
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(host: str, port: int, behavior: FakeGeminiBehavior) -> ThreadingHTTPServer:
+    """
+    Build a threaded HTTP server speaking the Gemini ``generateContent`` and
+    ``streamGenerateContent`` (``alt=sse``) REST APIs.
+    """
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.behavior = behavior
+    return server
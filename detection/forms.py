@@ -2,13 +2,24 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from .models import CropImage
-from PIL import Image
-import io
+from .ingest import ingest_image
+from . import metrics
 
 class ImageUploadForm(forms.ModelForm):
     """
     Form for uploading crop images with validation and language selection.
     """
+    # A plain FileField: the image is decoded once in clean_image rather than
+    # also being verified by forms.ImageField.
+    image = forms.FileField(
+        label=_("Crop Image"),
+        help_text=_("Upload an image of the crop for disease analysis (JPEG, PNG, max 10MB)."),
+        widget=forms.FileInput(attrs={
+            'class': 'form-control',
+            'accept': 'image/*',
+            'id': 'imageUpload'
+        })
+    )
     language = forms.ChoiceField(
         choices=lambda: [(code, name) for code, name in settings.SUPPORTED_LANGUAGES.items()],
         label=_("Language"),
@@ -23,19 +34,10 @@ class ImageUploadForm(forms.ModelForm):
     class Meta:
         model = CropImage
         fields = ['image', 'language']
-        widgets = {
-            'image': forms.FileInput(attrs={
-                'class': 'form-control',
-                'accept': 'image/*',
-                'id': 'imageUpload'
-            }),
-        }
-        labels = {
-            'image': _("Crop Image"),
-        }
-        help_texts = {
-            'image': _("Upload an image of the crop for disease analysis (JPEG, PNG, max 10MB)."),
-        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ingested = None
 
     def clean_image(self):
         """
@@ -56,37 +58,34 @@ class ImageUploadForm(forms.ModelForm):
         if not image.content_type.startswith('image/'):
             raise forms.ValidationError(_("File must be an image (e.g., JPEG, PNG)."))
 
-        # Validate image dimensions and format
+        # Decode once: validates the data and produces the normalized file and image
         try:
-            with Image.open(image.file) as img:
-                # Ensure image is readable
-                img.verify()
-
-                # Reopen image for further checks since verify() closes the file
-                image.file.seek(0)
-                with Image.open(image.file) as img:
-                    # Check minimum dimensions (e.g., 100x100 pixels)
-                    min_dimensions = getattr(settings, 'MIN_IMAGE_DIMENSIONS', (100, 100))
-                    if img.size[0] < min_dimensions[0] or img.size[1] < min_dimensions[1]:
-                        raise forms.ValidationError(
-                            _("Image dimensions too small (minimum %(width)dx%(height)d pixels).") % {
-                                'width': min_dimensions[0],
-                                'height': min_dimensions[1]
-                            }
-                        )
-
-                    # Ensure image format is supported
-                    supported_formats = getattr(settings, 'SUPPORTED_IMAGE_FORMATS', ['JPEG', 'PNG', 'GIF'])
-                    if img.format not in supported_formats:
-                        raise forms.ValidationError(
-                            _("Unsupported image format. Supported formats: %(formats)s.") % {
-                                'formats': ', '.join(supported_formats)
-                            }
-                        )
+            with metrics.span('ingest'):
+                ingested = ingest_image(image.file, name=image.name)
         except Exception as e:
             raise forms.ValidationError(_("Invalid image file: %(error)s") % {'error': str(e)})
 
-        return image
+        # Check minimum dimensions (e.g., 100x100 pixels)
+        min_dimensions = getattr(settings, 'MIN_IMAGE_DIMENSIONS', (100, 100))
+        if ingested.original_size[0] < min_dimensions[0] or ingested.original_size[1] < min_dimensions[1]:
+            raise forms.ValidationError(
+                _("Image dimensions too small (minimum %(width)dx%(height)d pixels).") % {
+                    'width': min_dimensions[0],
+                    'height': min_dimensions[1]
+                }
+            )
+
+        # Ensure image format is supported
+        supported_formats = getattr(settings, 'SUPPORTED_IMAGE_FORMATS', ['JPEG', 'PNG', 'GIF'])
+        if ingested.source_format not in supported_formats:
+            raise forms.ValidationError(
+                _("Unsupported image format. Supported formats: %(formats)s.") % {
+                    'formats': ', '.join(supported_formats)
+                }
+            )
+
+        self.ingested = ingested
+        return ingested.content
 
     def clean_language(self):
         """
@@ -103,4 +102,16 @@ class ImageUploadForm(forms.ModelForm):
         """
         cleaned_data = super().clean()
         # Add any cross-field validation if needed in the future
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+    def save(self, commit=True):
+        """
+        Save the normalized image, carrying over what ingest already computed.
+        """
+        crop_image = super().save(commit=False)
+        if self.ingested is not None:
+            crop_image.image_hash = self.ingested.image_hash
+            crop_image.ingested_image = self.ingested.image
+        if commit:
+            crop_image.save()
+        return crop_image
\ No newline at end of file
@@ -0,0 +1,353 @@
+import contextvars
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from . import batching, metrics
+from .admission import AdmissionRejected
+from .ai_service import get_analyzer, load_image, report_fields
+from .circuit import CircuitOpenError
+from .models import AnalysisJob, CropImage
+from .phash import find_near_duplicate
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """
+    Build an identifier for the current worker process.
+
+    Returns:
+        str: Hostname and process id, e.g. 'web-1:4242'.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_analysis(crop_image: CropImage) -> AnalysisJob:
+    """
+    Queue a crop image for background analysis.
+
+    Args:
+        crop_image (CropImage): Saved crop image awaiting analysis.
+
+    Returns:
+        AnalysisJob: The newly created pending job.
+    """
+    return AnalysisJob.objects.create(crop_image=crop_image)
+
+
+def claim_jobs(limit: int, worker_id: Optional[str] = None) -> List[AnalysisJob]:
+    """
+    Atomically claim up to ``limit`` pending jobs for this worker.
+
+    Each candidate is claimed with a conditional UPDATE, so concurrent workers
+    never run the same job even on databases without SELECT ... FOR UPDATE.
+
+    Args:
+        limit (int): Maximum number of jobs to claim.
+        worker_id (str, optional): Identifier recorded on claimed jobs.
+
+    Returns:
+        list: Claimed jobs, already marked as running.
+    """
+    if limit <= 0:
+        return []
+    worker_id = worker_id or default_worker_id()
+    candidates = AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_PENDING
+    ).order_by('created_at').values_list('pk', flat=True)[:limit * 2]
+
+    claimed = []
+    for pk in candidates:
+        if _claim(pk, worker_id):
+            claimed.append(pk)
+        if len(claimed) >= limit:
+            break
+    return list(AnalysisJob.objects.filter(pk__in=claimed).select_related('crop_image').order_by('created_at'))
+
+
+def _claim(pk: int, worker_id: str) -> bool:
+    return AnalysisJob.objects.filter(pk=pk, status=AnalysisJob.STATUS_PENDING).update(
+        status=AnalysisJob.STATUS_RUNNING,
+        worker=worker_id,
+        started_at=timezone.now(),
+        progress={},
+    ) > 0
+
+
+def requeue_stale_jobs(stale_after: Optional[int] = None) -> int:
+    """
+    Return jobs stuck in the running state (e.g. after a worker crash) to the queue.
+
+    Args:
+        stale_after (int, optional): Seconds after which a running job is considered abandoned.
+
+    Returns:
+        int: Number of jobs requeued.
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'ANALYSIS_JOB_STALE_SECONDS', 300)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=AnalysisJob.STATUS_PENDING, worker='')
+
+
+def analyze_crop(crop_image: CropImage, degrade: bool = True, on_field: Optional[Callable] = None,
+                 batch: bool = False) -> dict:
+    """
+    Produce a diagnosis for a crop image, reusing a near-duplicate's when available.
+
+    While the circuit breaker is open the model is not called; the result is then a
+    degraded one (see ``degraded_result``).
+
+    Args:
+        crop_image (CropImage): Saved crop image awaiting analysis.
+        degrade (bool): Whether to fall back to a looser near-duplicate match while the
+            circuit is open; when False the result is simply ``pending``.
+        on_field (callable, optional): ``on_field(name, value)`` for each diagnosis field as
+            soon as it is known (see ``GlobalCropAnalyzer.analyze_crop_image``).
+        batch (bool): Whether the model call may be shared with concurrent analyses
+            (see ``detection.batching``); only used when ``ANALYSIS_BATCH_SIZE`` > 1.
+
+    Returns:
+        dict: Analyzer-format result; reused diagnoses carry ``cached`` and ``duplicate_of``.
+    """
+    with metrics.span('near_duplicate_search', crop_image.language) as span:
+        duplicate = find_near_duplicate(crop_image)
+        span.outcome = 'miss' if duplicate is None else 'hit'
+    if duplicate is not None:
+        return report_fields(_duplicate_result(crop_image, duplicate), on_field)
+
+    analyzer = get_analyzer(crop_image.language)
+    image = getattr(crop_image, 'ingested_image', None)
+    try:
+        if batch and on_field is None and batching.is_enabled():
+            if image is None:
+                image = load_image(crop_image.image.path)
+            return batching.get_batcher().analyze(image, crop_image.language)
+        return analyzer.analyze_crop_image(crop_image.image.path, image=image, on_field=on_field)
+    except CircuitOpenError as e:
+        if not degrade:
+            return pending_result(str(e), e.retry_after)
+        return report_fields(degraded_result(crop_image, e), on_field)
+
+
+async def aanalyze_crop(crop_image: CropImage) -> dict:
+    """
+    Async variant of ``analyze_crop`` that awaits the model call instead of blocking a thread.
+    """
+    with metrics.span('near_duplicate_search', crop_image.language) as span:
+        duplicate = await sync_to_async(find_near_duplicate)(crop_image)
+        span.outcome = 'miss' if duplicate is None else 'hit'
+    if duplicate is not None:
+        return _duplicate_result(crop_image, duplicate)
+
+    analyzer = get_analyzer(crop_image.language)
+    try:
+        return await analyzer.analyze_crop_image_async(
+            crop_image.image.path, image=getattr(crop_image, 'ingested_image', None)
+        )
+    except CircuitOpenError as e:
+        return await sync_to_async(degraded_result)(crop_image, e)
+
+
+def _duplicate_result(crop_image: CropImage, duplicate: CropImage) -> dict:
+    logger.info(f"Reusing diagnosis of image {duplicate.pk} for near-duplicate {crop_image.pk}.")
+    metrics.incr('near_duplicate_reuses_total')
+    result = duplicate.as_analysis_result()
+    result.update({'cached': True, 'duplicate_of': duplicate.pk})
+    return result
+
+
+def degraded_result(crop_image: CropImage, error: CircuitOpenError) -> dict:
+    """
+    Build the result served while the AI service is unavailable.
+
+    A near-duplicate is searched again with the looser ``CIRCUIT_DEGRADED_MAX_DISTANCE``;
+    its diagnosis is returned flagged with ``degraded=True``. Otherwise the result is a
+    ``pending`` placeholder that callers must queue for reprocessing instead of saving.
+
+    Args:
+        crop_image (CropImage): Saved crop image awaiting analysis.
+        error (CircuitOpenError): The breaker error that short-circuited the model call.
+
+    Returns:
+        dict: Degraded diagnosis, or a pending result carrying ``retry_after``.
+    """
+    metrics.incr('degraded_results_total')
+    max_distance = getattr(settings, 'CIRCUIT_DEGRADED_MAX_DISTANCE', 12)
+    duplicate = find_near_duplicate(crop_image, max_distance=max_distance)
+    if duplicate is not None:
+        result = _duplicate_result(crop_image, duplicate)
+        result['degraded'] = True
+        return result
+    return pending_result(str(error), error.retry_after, degraded=True)
+
+
+def pending_result(message: str, retry_after: int, degraded: bool = False) -> dict:
+    """
+    Build a result for an analysis that was not performed and must be retried later.
+    """
+    return {
+        'success': False,
+        'pending': True,
+        'degraded': degraded,
+        'error': message,
+        'retry_after': retry_after,
+    }
+
+
+def analyze_crops(crop_images: List[CropImage], concurrency: Optional[int] = None) -> List[dict]:
+    """
+    Analyze several crop images on a bounded thread pool.
+
+    Args:
+        crop_images (list): Saved crop images awaiting analysis.
+        concurrency (int, optional): Maximum simultaneous analyses (``BATCH_ANALYSIS_CONCURRENCY``).
+
+    Returns:
+        list: One analyzer-format result per image, in input order. Images refused by
+              admission control, or left undiagnosed while the circuit is open, get
+              ``pending=True`` and ``retry_after`` instead.
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'BATCH_ANALYSIS_CONCURRENCY', 4)
+    if not crop_images:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(crop_images)))) as pool:
+        # Run each analysis in a copy of this context so its spans keep the request's labels.
+        futures = [pool.submit(contextvars.copy_context().run, _analyze_crop_in_thread, crop_image)
+                   for crop_image in crop_images]
+        return [future.result() for future in futures]
+
+
+def _analyze_crop_in_thread(crop_image: CropImage) -> dict:
+    close_old_connections()
+    try:
+        return analyze_crop(crop_image, batch=True)
+    except AdmissionRejected as e:
+        return pending_result(str(e), e.retry_after)
+    except Exception as e:
+        logger.error(f"Analysis of image {crop_image.pk} crashed: {str(e)}", exc_info=True)
+        return crash_result(str(e))
+    finally:
+        connection.close()
+
+
+def crash_result(message: str) -> dict:
+    """
+    Build a failed result for errors raised outside the analyzer.
+    """
+    return {
+        'plant_type': 'Unknown',
+        'disease_name': 'Analysis Failed',
+        'confidence': 0.0,
+        'success': False,
+        'error': message,
+    }
+
+
+def run_job(job: AnalysisJob, on_field: Optional[Callable] = None) -> AnalysisJob:
+    """
+    Analyze the job's crop image and store the outcome.
+
+    Failed analyses are retried until ``ANALYSIS_JOB_MAX_ATTEMPTS`` is reached;
+    the final failure is saved on the crop image like a synchronous upload would.
+    Jobs refused by admission control, or left pending while the circuit breaker is
+    open, go back to the queue without using an attempt.
+
+    Args:
+        job (AnalysisJob): A job previously returned by ``claim_jobs``.
+        on_field (callable, optional): Receives diagnosis fields as they stream in (see ``analyze_crop``).
+
+    Returns:
+        AnalysisJob: The updated job.
+    """
+    max_attempts = getattr(settings, 'ANALYSIS_JOB_MAX_ATTEMPTS', 3)
+    crop_image = job.crop_image
+    with metrics.bind(endpoint='worker', language=crop_image.language), metrics.span('analysis_job'):
+        return _run_job(job, crop_image, max_attempts, on_field)
+
+
+def _run_job(job: AnalysisJob, crop_image: CropImage, max_attempts: int,
+             on_field: Optional[Callable] = None) -> AnalysisJob:
+    try:
+        # Queued jobs already have a page to show, so hold out for a real diagnosis.
+        result = analyze_crop(crop_image, degrade=False, on_field=on_field, batch=True)
+    except AdmissionRejected as e:
+        result = pending_result(str(e), e.retry_after)
+    except Exception as e:
+        logger.error(f"Analysis job {job.pk} crashed: {str(e)}", exc_info=True)
+        result = crash_result(str(e))
+
+    if result.get('pending'):
+        return _defer_job(job, result)
+
+    job.attempts += 1
+    if result.get('success', True) or job.attempts >= max_attempts:
+        with metrics.span('apply_result'):
+            crop_image.apply_analysis_result(result)
+        job.status = AnalysisJob.STATUS_DONE if result.get('success', True) else AnalysisJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+    else:
+        job.status = AnalysisJob.STATUS_PENDING
+    job.error = '' if result.get('success', True) else result.get('error', 'Unknown error')
+    job.save(update_fields=['status', 'attempts', 'error', 'finished_at'])
+    return job
+
+
+def _defer_job(job: AnalysisJob, result: dict) -> AnalysisJob:
+    logger.warning(f"Analysis job {job.pk} deferred: {result['error']}")
+    job.status = AnalysisJob.STATUS_PENDING
+    job.error = result['error']
+    job.save(update_fields=['status', 'error'])
+    # Hold this worker slot briefly so the worker does not spin on an unavailable service.
+    time.sleep(min(result['retry_after'], getattr(settings, 'ANALYSIS_JOB_BACKOFF_MAX', 10)))
+    return job
+
+
+def run_job_in_thread(job: AnalysisJob) -> AnalysisJob:
+    """
+    Run a job from a worker thread, releasing the thread's DB connection afterwards.
+    """
+    close_old_connections()
+    try:
+        return run_job(job, on_field=progress_recorder(job))
+    finally:
+        close_old_connections()
+
+
+def progress_recorder(job: AnalysisJob) -> Optional[Callable]:
+    """
+    Build an ``on_field`` callback that saves streamed diagnosis fields on the job.
+
+    Result streams (see ``detection.streaming``) relay the saved fields to browsers
+    while the job runs. Micro-batched model calls are not streamed, so no callback is
+    returned while ``ANALYSIS_BATCH_SIZE`` > 1.
+
+    Args:
+        job (AnalysisJob): A claimed job.
+
+    Returns:
+        callable: ``on_field(name, value)``, or None when fields cannot be streamed.
+    """
+    if batching.is_enabled():
+        return None
+    progress = {}
+
+    def on_field(name, value):
+        progress[name] = value
+        AnalysisJob.objects.filter(pk=job.pk).update(progress=dict(progress))
+
+    return on_field
+
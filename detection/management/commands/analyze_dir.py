@@ -0,0 +1,252 @@
+import contextvars
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.forms import ImageUploadForm
+from detection import response_cache, rollups
+from detection.jobs import analyze_crops
+from detection.models import AnalysisJob, CropImage
+from detection.phash import near_duplicates
+from detection.signals import crop_images_saved
+
+CHECKPOINT_DIR = '.analyze_dir'
+
+
+def default_checkpoint_path(directory):
+    """
+    Checkpoint file for ``directory`` under the working directory, one per input directory.
+
+    Kept out of the input directory, which may be read-only, shared or rescanned.
+    """
+    digest = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16]
+    return os.path.join(CHECKPOINT_DIR, f"{digest}.checkpoint")
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyze every image under a directory with the same validation and ingest rules as "
+        "web uploads, writing rows in batches. Progress is checkpointed so an interrupted run "
+        "resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', help="Directory to walk (not used with --failed-only).")
+        parser.add_argument('--language', default='en', help="Language of the diagnoses.")
+        parser.add_argument('--user', help="Username the images are attributed to.")
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'BATCH_ANALYSIS_CONCURRENCY', 4),
+            help="Images validated and analyzed concurrently.",
+        )
+        parser.add_argument('--batch-size', type=int, default=50, help="Images written per bulk insert.")
+        parser.add_argument('--limit', type=int, help="Process at most this many images.")
+        parser.add_argument('--output', '-o', help="Append one JSON line per image to this file.")
+        parser.add_argument(
+            '--checkpoint',
+            help=f"File recording finished images (defaults to a file under {CHECKPOINT_DIR}/ in the working directory).",
+        )
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over.")
+        parser.add_argument(
+            '--failed-only', action='store_true',
+            help="Instead of walking a directory, reanalyze stored images whose processing_error is set.",
+        )
+
+    def handle(self, *args, **options):
+        self.workers = max(1, options['workers'])
+        self.batch_size = max(1, options['batch_size'])
+        self.counts = {'analyzed': 0, 'failed': 0, 'invalid': 0, 'queued': 0}
+        self.output = open(options['output'], 'w' if options['restart'] else 'a') if options['output'] else None
+        started = time.perf_counter()
+        near_duplicates.rebuild()
+        try:
+            if options['failed_only']:
+                total = self._reanalyze_failed(options)
+            else:
+                total = self._analyze_directory(options)
+        finally:
+            if self.output:
+                self.output.close()
+        elapsed = time.perf_counter() - started
+        counts = self.counts
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total} image(s) in {elapsed:.1f}s: {counts['analyzed']} analyzed, "
+            f"{counts['failed']} failed, {counts['invalid']} invalid, {counts['queued']} queued for the worker."
+        ))
+
+    def _analyze_directory(self, options):
+        directory = options['directory']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError("A directory is required (or use --failed-only).")
+        if options['language'] not in dict(settings.SUPPORTED_LANGUAGES):
+            raise CommandError(f"Unsupported language '{options['language']}'.")
+        self.language = options['language']
+        self.user = None
+        if options['user']:
+            try:
+                self.user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        checkpoint_path = options['checkpoint'] or default_checkpoint_path(directory)
+        try:
+            if os.path.dirname(checkpoint_path):
+                os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+            if options['restart'] and os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            # Fail before any image is analyzed rather than after the first batch.
+            open(checkpoint_path, 'a').close()
+        except OSError as e:
+            raise CommandError(f"Cannot write checkpoint {checkpoint_path}: {str(e)} (choose another with --checkpoint).")
+        done = set()
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                done = {line.rstrip('\n') for line in f if line.strip()}
+            if done:
+                self.stdout.write(f"Resuming: {len(done)} image(s) already processed.")
+
+        paths = [path for path in self._walk(directory) if path not in done]
+        if options['limit']:
+            paths = paths[:options['limit']]
+        with open(checkpoint_path, 'a') as checkpoint, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, len(paths), self.batch_size):
+                batch = paths[start:start + self.batch_size]
+                self._analyze_batch(pool, directory, batch)
+                if self.output:
+                    self.output.flush()
+                # Only after the batch is written, so a crash reprocesses it rather than losing it.
+                checkpoint.write(''.join(f"{path}\n" for path in batch))
+                checkpoint.flush()
+                self.stdout.write(f"{start + len(batch)}/{len(paths)} processed")
+        return len(paths)
+
+    def _walk(self, directory):
+        """
+        Relative paths of the image files under ``directory``, sorted, skipping hidden entries.
+        """
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(files):
+                content_type = mimetypes.guess_type(name)[0] or ''
+                if not name.startswith('.') and content_type.startswith('image/'):
+                    paths.append(os.path.relpath(os.path.join(root, name), directory))
+        return paths
+
+    def _analyze_batch(self, pool, directory, batch):
+        # Decoding, resizing and variant encoding release the GIL, so validation runs on the pool too.
+        # Each item runs in a copy of this thread's context, so its spans keep the caller's labels.
+        context = contextvars.copy_context()
+        validated = list(pool.map(
+            lambda path: context.copy().run(self._validate, os.path.join(directory, path)), batch
+        ))
+        crop_images = []
+        for path, (crop_image, errors) in zip(batch, validated):
+            if crop_image is None:
+                self.counts['invalid'] += 1
+                self._emit({'path': path, 'success': False, 'errors': errors})
+            else:
+                crop_images.append((path, crop_image))
+        if not crop_images:
+            return
+
+        # Analyze before inserting so each row is written once, results included.
+        results = analyze_crops([crop_image for _path, crop_image in crop_images], concurrency=self.workers)
+        pending = []
+        for (_path, crop_image), result in zip(crop_images, results):
+            if result.get('pending'):
+                pending.append(crop_image)
+            else:
+                crop_image.apply_analysis_result(result, save=False)
+        CropImage.objects.bulk_create([crop_image for _path, crop_image in crop_images])
+        rollups.record([crop_image for _path, crop_image in crop_images])
+        crop_images_saved.send(sender=CropImage, crop_images=[crop_image for _path, crop_image in crop_images])
+        # Over capacity, circuit open or degraded: the background worker finishes these.
+        queued = pending + [crop_image for _path, crop_image in crop_images if crop_image.degraded]
+        AnalysisJob.objects.bulk_create([AnalysisJob(crop_image=crop_image) for crop_image in queued])
+        for (path, crop_image), result in zip(crop_images, results):
+            if crop_image.is_reusable:
+                near_duplicates.add(crop_image)
+            self._record(crop_image, result, path=path, queued=crop_image in queued)
+
+    def _validate(self, full_path):
+        """
+        Run ``ImageUploadForm`` validation and ingest on a file and store it.
+
+        Returns:
+            tuple: (unsaved CropImage, None), or (None, {field: [messages]}) when the file is rejected.
+        """
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        try:
+            with open(full_path, 'rb') as f:
+                upload = UploadedFile(f, os.path.basename(full_path), content_type, os.path.getsize(full_path))
+                form = ImageUploadForm({'language': self.language}, {'image': upload})
+                if not form.is_valid():
+                    return None, {field: [str(e) for e in errors] for field, errors in form.errors.items()}
+            crop_image = form.save(commit=False)
+            crop_image.user = self.user
+            crop_image.language = self.language
+            crop_image.store_image()
+        except OSError as e:
+            return None, {'image': [str(e)]}
+        return crop_image, None
+
+    def _reanalyze_failed(self, options):
+        # Reanalyzed rows drop out of this filter, so an interrupted run simply resumes.
+        queryset = CropImage.objects.exclude(processing_error='').exclude(image='').order_by('pk')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+        pks = list(queryset.values_list('pk', flat=True))
+        for start in range(0, len(pks), self.batch_size):
+            batch = list(CropImage.objects.filter(pk__in=pks[start:start + self.batch_size]).order_by('pk'))
+            results = analyze_crops(batch, concurrency=self.workers)
+            analyzed = []
+            for crop_image, result in zip(batch, results):
+                if result.get('pending'):
+                    # Still failed; picked up again by the next --failed-only run.
+                    self.counts['failed'] += 1
+                    self._emit({'id': crop_image.pk, 'success': False, 'pending': True, 'error': result.get('error', '')})
+                    continue
+                crop_image.apply_analysis_result(result, save=False)
+                analyzed.append(crop_image)
+                if crop_image.is_reusable:
+                    near_duplicates.add(crop_image)
+                self._record(crop_image, result)
+            CropImage.objects.bulk_update(analyzed, CropImage.ANALYSIS_RESULT_FIELDS)
+            rollups.record(analyzed)
+            response_cache.invalidate(crop_image.pk for crop_image in analyzed)
+            crop_images_saved.send(sender=CropImage, crop_images=analyzed)
+            self.stdout.write(f"{start + len(batch)}/{len(pks)} processed")
+        return len(pks)
+
+    def _record(self, crop_image, result, path=None, queued=False):
+        if queued:
+            self.counts['queued'] += 1
+        elif crop_image.processing_error:
+            self.counts['failed'] += 1
+        else:
+            self.counts['analyzed'] += 1
+        line = {'path': path} if path is not None else {}
+        line.update({
+            'id': crop_image.pk,
+            'success': not crop_image.processing_error and crop_image.is_processed,
+            'queued': queued,
+            'plant_type': crop_image.plant_type,
+            'disease_name': crop_image.disease_name,
+            'confidence': crop_image.confidence,
+            'error': crop_image.processing_error or ('' if result.get('success', True) else result.get('error', '')),
+            'image': crop_image.image.name,
+        })
+        self._emit(line)
+
+    def _emit(self, line):
+        if self.output:
+            self.output.write(json.dumps(line, ensure_ascii=False) + '\n')
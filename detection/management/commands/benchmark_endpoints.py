@@ -0,0 +1,228 @@
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from detection.ai_service import install_model, reset_analyzers
+from detection.benchmarking import SimulatedModel, latency_summary, make_upload, peak_rss_mb
+from detection.jobs import claim_jobs, run_job_in_thread
+from detection.models import AnalysisJob, CropImage, DetectionHistory
+from detection.pagination import encode_cursor
+
+SCENARIOS = ('home', 'history', 'api_result', 'api_upload', 'upload')
+
+# Per-scenario ceilings checked with --check. Query budgets are the current worst single
+# request, so any added query fails; latency budgets leave headroom for noisy machines.
+DEFAULT_BUDGETS = {
+    'home': {'max_queries': 1, 'p95_ms': 250},
+    'history': {'max_queries': 3, 'p95_ms': 300},
+    'api_result': {'max_queries': 1, 'p95_ms': 100},
+    'api_upload': {'max_queries': 4, 'p95_ms': 500},
+    'upload': {'max_queries': 4, 'p95_ms': 500},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed crop images and benchmark the home, history, result and upload endpoints concurrently, "
+        "reporting throughput, latency percentiles, queries per request and peak RSS as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-rows', type=int, default=500, help="CropImage/DetectionHistory rows to seed.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client threads.")
+        parser.add_argument('--latency', type=float, default=1.0, help="Simulated analyzer latency in seconds.")
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f"Comma-separated scenarios to run (from: {', '.join(SCENARIOS)}).",
+        )
+        parser.add_argument('--no-worker', action='store_true', help="Skip draining queued analyses afterwards.")
+        parser.add_argument('--budgets', help="JSON file overriding DEFAULT_BUDGETS per scenario.")
+        parser.add_argument('--check', action='store_true', help="Fail when a scenario exceeds its budget.")
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+        parser.add_argument('--keep', action='store_true', help="Keep seeded and uploaded rows and files.")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}.")
+        if options['seed_rows'] < 1:
+            raise CommandError("--seed-rows must be at least 1.")
+        budgets = {name: dict(budget) for name, budget in DEFAULT_BUDGETS.items()}
+        if options['budgets']:
+            with open(options['budgets']) as f:
+                for name, budget in json.load(f).items():
+                    budgets.setdefault(name, {}).update(budget)
+
+        media_root = settings.MEDIA_ROOT if options['keep'] else tempfile.mkdtemp(prefix='agricare-bench-')
+        last_pk = CropImage.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        report = {
+            'seed_rows': options['seed_rows'],
+            'concurrency': options['concurrency'],
+            'latency': options['latency'],
+            'scenarios': {},
+        }
+
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            MEDIA_ROOT=media_root,
+            ADMISSION_CONTROL_ENABLED=False,
+            ANALYSIS_CACHE_ENABLED=False,
+            TRIAGE_ENABLED=False,
+        ):
+            model = SimulatedModel(options['latency'])
+            install_model(model)
+            session = SessionStore()
+            session.create()
+            try:
+                seeded = self._seed(options['seed_rows'], session.session_key)
+                for name in scenarios:
+                    report['scenarios'][name] = self._run(name, options, session.session_key, seeded)
+                if not options['no_worker']:
+                    report['worker'] = self._drain(options['concurrency'], model)
+            finally:
+                reset_analyzers()
+                if not options['keep']:
+                    AnalysisJob.objects.filter(crop_image__pk__gt=last_pk).delete()
+                    CropImage.objects.filter(pk__gt=last_pk).delete()
+                    session.delete()
+                    shutil.rmtree(media_root, ignore_errors=True)
+
+        report['peak_rss_mb'] = peak_rss_mb()
+        report['budget_violations'] = self._check_budgets(report['scenarios'], budgets)
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        if options['check'] and report['budget_violations']:
+            raise CommandError("Benchmark budgets exceeded:\n" + "\n".join(report['budget_violations']))
+
+    def _seed(self, count, session_key):
+        """
+        Create ``count`` processed crop images sharing one stored file, all in one anonymous session.
+
+        Returns:
+            list: Seeded CropImage instances.
+        """
+        image_name = default_storage.save('uploads/bench/seed.jpg', ContentFile(make_upload(0).read()))
+        diseases = [code for code, _label in CropImage.DISEASE_CHOICES]
+        rnd = random.Random(0)
+        crop_images = CropImage.objects.bulk_create([
+            CropImage(
+                image=image_name,
+                session_key=session_key,
+                language='en',
+                plant_type='Rice',
+                disease_name=rnd.choice(diseases),
+                confidence=round(rnd.uniform(50, 99), 2),
+                explanation='Seeded benchmark row.',
+                treatment='Seeded benchmark row.',
+                is_processed=True,
+            )
+            for _ in range(count)
+        ], batch_size=500)
+        DetectionHistory.objects.bulk_create([
+            DetectionHistory(crop_image=crop_image, session_id=session_key, ip_address='127.0.0.1')
+            for crop_image in crop_images
+        ], batch_size=500)
+        return crop_images
+
+    def _run(self, name, options, session_key, seeded):
+        local = threading.local()
+        rnd = random.Random(name)
+
+        def build(i):
+            if name == 'home':
+                return 'get', reverse('crop_detection:home'), None
+            if name == 'history':
+                # Random cursors reach arbitrarily deep pages.
+                return 'get', f"{reverse('crop_detection:history')}?after={encode_cursor(rnd.choice(seeded))}", None
+            if name == 'api_result':
+                return 'get', reverse('crop_detection:api_result', args=[rnd.choice(seeded).pk]), None
+            # Distinct images per scenario so uploads are never near-duplicates of each other.
+            seed = (SCENARIOS.index(name) + 1) * 1000000 + i
+            return 'post', reverse(f'crop_detection:{name}'), {'image': make_upload(seed), 'language': 'en'}
+
+        requests = [build(i) for i in range(options['requests'])]
+
+        def issue(request):
+            method, url, data = request
+            client = getattr(local, 'client', None)
+            if client is None:
+                close_old_connections()
+                client = local.client = Client()
+                client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+                elapsed = time.perf_counter() - started
+            return elapsed, len(queries), response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as pool:
+            results = list(pool.map(issue, requests))
+            # Release the per-thread connections opened by the clients.
+            list(pool.map(lambda _: connection.close(), range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        summary = latency_summary([seconds for seconds, _queries, _status in results], elapsed)
+        query_counts = [queries for _seconds, queries, _status in results]
+        summary.update({
+            'queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+            'max_queries': max(query_counts, default=0),
+            'errors': sum(1 for _seconds, _queries, status in results if status >= 400),
+            'peak_rss_mb': peak_rss_mb(),
+        })
+        return summary
+
+    def _drain(self, concurrency, model):
+        """
+        Run the analyses queued by the upload scenarios through the simulated model.
+        """
+        durations = []
+        lock = threading.Lock()
+
+        def run(job):
+            started = time.perf_counter()
+            run_job_in_thread(job)
+            with lock:
+                durations.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            while True:
+                jobs = claim_jobs(concurrency)
+                if not jobs:
+                    break
+                list(pool.map(run, jobs))
+        summary = latency_summary(durations, time.perf_counter() - started)
+        summary['peak_in_flight'] = model.peak_in_flight
+        return summary
+
+    def _check_budgets(self, scenarios, budgets):
+        violations = []
+        for name, summary in scenarios.items():
+            budget = budgets.get(name, {})
+            if 'max_queries' in budget and summary['max_queries'] > budget['max_queries']:
+                violations.append(f"{name}: {summary['max_queries']} queries > budget {budget['max_queries']}")
+            if 'p95_ms' in budget and summary['p95_ms'] > budget['p95_ms']:
+                violations.append(f"{name}: p95 {summary['p95_ms']}ms > budget {budget['p95_ms']}ms")
+            if summary['errors']:
+                violations.append(f"{name}: {summary['errors']} error response(s)")
+        return violations
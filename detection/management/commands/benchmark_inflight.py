@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from detection.ai_service import install_model, reset_analyzers
+from detection.benchmarking import SimulatedModel, make_upload
+from detection.models import CropImage
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many analyses one worker keeps in flight with the async upload view "
+        "versus a thread-per-request (WSGI) worker, using a simulated Gemini latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Uploads per mode.")
+        parser.add_argument('--latency', type=float, default=2.0, help="Simulated model latency in seconds.")
+        parser.add_argument('--threads', type=int, default=4, help="Threads of the simulated WSGI worker.")
+        parser.add_argument('--keep', action='store_true', help="Keep the CropImage rows created by the run.")
+
+    def handle(self, *args, **options):
+        url = reverse('crop_detection:async_api_upload')
+        count = options['requests']
+        created_before = CropImage.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        report = {'requests': count, 'latency': options['latency']}
+
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ADMISSION_CONTROL_ENABLED=False,
+            ANALYSIS_CACHE_ENABLED=False,
+            NEAR_DUPLICATE_ENABLED=False,
+            TRIAGE_ENABLED=False,
+        ):
+            try:
+                report['sync'] = self._run_sync(url, count, options['latency'], options['threads'])
+                report['async'] = self._run_async(url, count, options['latency'])
+            finally:
+                reset_analyzers()
+                if not options['keep']:
+                    for crop_image in CropImage.objects.filter(pk__gt=created_before):
+                        crop_image.delete()
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _run_sync(self, url, count, latency, threads):
+        model = SimulatedModel(latency)
+        install_model(model)
+
+        def upload(seed):
+            response = Client().post(url, {'image': make_upload(seed), 'language': 'en'})
+            return response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = list(pool.map(upload, range(count)))
+        return self._summary(statuses, time.perf_counter() - started, model)
+
+    def _run_async(self, url, count, latency):
+        model = SimulatedModel(latency)
+        install_model(model)
+
+        async def run():
+            client = AsyncClient()
+            responses = await asyncio.gather(*[
+                client.post(url, {'image': make_upload(count + seed), 'language': 'en'})
+                for seed in range(count)
+            ])
+            return [response.status_code for response in responses]
+
+        started = time.perf_counter()
+        statuses = asyncio.run(run())
+        return self._summary(statuses, time.perf_counter() - started, model)
+
+    def _summary(self, statuses, elapsed, model):
+        return {
+            'ok': sum(1 for status in statuses if status == 200),
+            'errors': sum(1 for status in statuses if status != 200),
+            'seconds': round(elapsed, 3),
+            'throughput_per_second': round(len(statuses) / elapsed, 2) if elapsed else None,
+            'peak_in_flight': model.peak_in_flight,
+        }
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from detection import response_cache
+from detection.models import CropImage
+from detection.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move crop images stored under legacy upload names into content-addressed storage, "
+        "merging identical files into one blob and removing the old copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Migrate at most this many distinct files.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how much space would be freed.")
+
+    def handle(self, *args, **options):
+        storage = image_storage()
+        names = CropImage.objects.exclude(image='').values_list('image', flat=True).distinct().order_by('image')
+        legacy = [name for name in names.iterator() if not storage.is_blob_name(name)]
+        if options['limit']:
+            legacy = legacy[:options['limit']]
+
+        report = {'legacy_files': len(legacy), 'missing': 0, 'blobs': 0, 'bytes_before': 0, 'bytes_after': 0}
+        digests = set()
+        for old_name in legacy:
+            if not storage.exists(old_name):
+                report['missing'] += 1
+                continue
+            size = storage.size(old_name)
+            report['bytes_before'] += size
+            if options['dry_run']:
+                digest = self._digest(storage.path(old_name))
+            else:
+                with storage.open(old_name, 'rb') as f:
+                    new_name = storage.save(old_name, f)
+                digest = Path(new_name).stem
+                self._relink(old_name, new_name)
+                storage.delete(old_name)
+            if digest not in digests:
+                digests.add(digest)
+                report['bytes_after'] += size
+
+        report['blobs'] = len(digests)
+        report['bytes_freed'] = report['bytes_before'] - report['bytes_after']
+        report['dry_run'] = options['dry_run']
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _relink(self, old_name, new_name):
+        """
+        Point every row using ``old_name`` at the blob, moving its variants next to the blob.
+        """
+        rows = CropImage.objects.filter(image=old_name)
+        variants = next((v for v in rows.values_list('variants', flat=True) if v), {})
+        path = Path(new_name)
+        moved = {}
+        for variant, formats in variants.items():
+            moved[variant] = {}
+            for key, name in formats.items():
+                target = str(path.with_name(f"{path.stem}.{variant}{Path(name).suffix}"))
+                if default_storage.exists(name):
+                    if default_storage.exists(target):
+                        # An identical upload already has this variant.
+                        default_storage.delete(name)
+                    else:
+                        os.replace(default_storage.path(name), default_storage.path(target))
+                moved[variant][key] = target
+        pks = list(rows.values_list('pk', flat=True))
+        changes = {'image': new_name, 'version': F('version') + 1, 'updated_at': timezone.now()}
+        if moved:
+            changes['variants'] = moved
+        rows.update(**changes)
+        response_cache.invalidate(pks)
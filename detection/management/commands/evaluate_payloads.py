@@ -0,0 +1,161 @@
+import itertools
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from PIL import Image
+
+from detection import payload, triage
+from detection.admission import AdmissionRejected
+from detection.ai_service import get_analyzer
+from detection.circuit import CircuitOpenError
+from detection.models import CropImage
+
+DEFAULT_BUDGETS = '409600,204800,102400,51200'
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-diagnose stored images with payloads encoded under different byte budgets, formats and "
+        "colour modes, and report payload size against agreement with the stored diagnosis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budgets', default=DEFAULT_BUDGETS, help="Comma-separated byte budgets to compare.")
+        parser.add_argument('--formats', default='jpeg', help=f"Comma-separated formats: {', '.join(payload.FORMATS)}.")
+        parser.add_argument('--colours', default='full', help=f"Comma-separated colour modes: {', '.join(payload.COLOURS)}.")
+        parser.add_argument('--limit', type=int, default=20, help="Evaluate at most this many of the newest images.")
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'BATCH_ANALYSIS_CONCURRENCY', 4),
+                            help="Model calls in flight at once.")
+        parser.add_argument('--dry-run', action='store_true', help="Only encode and report payload sizes; no model calls.")
+
+    def handle(self, *args, **options):
+        try:
+            budgets = [int(value) for value in options['budgets'].split(',') if value.strip()]
+            policies = [
+                payload.PayloadPolicy(
+                    max_bytes=budget,
+                    sizes=getattr(settings, 'ANALYSIS_PAYLOAD_SIZES', payload.DEFAULT_SIZES),
+                    qualities=getattr(settings, 'ANALYSIS_PAYLOAD_QUALITIES', payload.DEFAULT_QUALITIES),
+                    image_format=image_format,
+                    colour=colour,
+                )
+                for image_format, colour, budget in itertools.product(
+                    self._split(options['formats']), self._split(options['colours']), budgets
+                )
+            ]
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not policies:
+            raise CommandError("Nothing to evaluate: give at least one budget, format and colour mode.")
+
+        # Reference diagnoses: made by the model itself, not reused, triaged or degraded.
+        crop_images = list(CropImage.objects.filter(
+            is_processed=True, processing_error='', degraded=False, triaged_locally=False, from_cache=False
+        ).only(
+            'image', 'language', 'plant_type', 'disease_name'
+        ).order_by('-uploaded_at')[:max(1, options['limit'])])
+        if not crop_images:
+            raise CommandError("No diagnosed images to evaluate against.")
+
+        images, skipped = [], 0
+        for crop_image in crop_images:
+            try:
+                with Image.open(crop_image.image.path) as img:
+                    images.append((crop_image, img.convert('RGB')))
+            except Exception as e:
+                self.stderr.write(f"Skipping image {crop_image.pk}: {str(e)}")
+                skipped += 1
+        if not images:
+            raise CommandError("None of the selected images could be opened.")
+
+        started = time.perf_counter()
+        cases = [(policy, crop_image, img) for policy in policies for crop_image, img in images]
+        if options['dry_run']:
+            outcomes = [self._encode(*case)[0] for case in cases]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+                outcomes = list(pool.map(lambda case: self._evaluate(*case), cases))
+
+        report = {
+            'images': len(images),
+            'skipped': skipped,
+            'stored_bytes_mean': round(statistics.mean(crop_image.image.size for crop_image, _img in images)),
+            'model_calls': 0 if options['dry_run'] else len(cases),
+            'seconds': round(time.perf_counter() - started, 1),
+            'policies': [self._summarize(policy, [o for o in outcomes if o['policy'] is policy], options['dry_run'])
+                         for policy in policies],
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _split(self, value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def _encode(self, policy, crop_image, img):
+        started = time.perf_counter()
+        encoded = payload.encode(img, policy)
+        return {
+            'policy': policy,
+            'bytes': len(encoded),
+            'edge': max(encoded.size),
+            'encode_seconds': time.perf_counter() - started,
+        }, encoded
+
+    def _evaluate(self, policy, crop_image, img):
+        close_old_connections()
+        outcome, encoded = self._encode(policy, crop_image, img)
+        started = time.perf_counter()
+        try:
+            result = get_analyzer(crop_image.language).analyze_payload(encoded, crop_image.language)
+        except (AdmissionRejected, CircuitOpenError) as e:
+            result = {'success': False, 'error': str(e)}
+        except Exception as e:
+            self.stderr.write(f"Analysis of image {crop_image.pk} failed: {str(e)}")
+            result = {'success': False, 'error': str(e)}
+        outcome['model_seconds'] = time.perf_counter() - started
+        outcome['success'] = bool(result.get('success'))
+        outcome['plant_match'] = outcome['success'] and _same(result.get('plant_type'), crop_image.plant_type)
+        outcome['disease_match'] = outcome['success'] and _same_disease(result.get('disease_name'), crop_image.disease_name)
+        return outcome
+
+    def _summarize(self, policy, outcomes, dry_run):
+        sizes = [outcome['bytes'] for outcome in outcomes]
+        summary = {
+            'format': policy.image_format,
+            'colour': policy.colour,
+            'max_bytes': policy.max_bytes,
+            'bytes_mean': round(statistics.mean(sizes)),
+            'bytes_max': max(sizes),
+            'over_budget': sum(size > policy.max_bytes for size in sizes),
+            'edge_mean': round(statistics.mean(outcome['edge'] for outcome in outcomes)),
+            'encode_ms_mean': round(1000 * statistics.mean(outcome['encode_seconds'] for outcome in outcomes), 1),
+        }
+        if not dry_run:
+            answered = [outcome for outcome in outcomes if outcome['success']]
+            summary.update({
+                'failed': len(outcomes) - len(answered),
+                'plant_accuracy': _share(answered, 'plant_match'),
+                'disease_accuracy': _share(answered, 'disease_match'),
+                'model_seconds_mean': round(statistics.mean(outcome['model_seconds'] for outcome in outcomes), 2),
+            })
+        return summary
+
+
+def _same(a, b):
+    return (a or '').strip().lower() == (b or '').strip().lower()
+
+
+def _same_disease(a, b):
+    # Compare canonical codes so 'Early blight' and 'early_blight' agree.
+    code_a, code_b = triage.canonical_disease(a), triage.canonical_disease(b)
+    if code_a is not None and code_b is not None:
+        return code_a == code_b
+    return _same(a, b)
+
+
+def _share(outcomes, key):
+    return round(sum(outcome[key] for outcome in outcomes) / len(outcomes), 3) if outcomes else None
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from detection import response_cache
+from detection.ingest import save_variants
+from detection.models import CropImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the thumb/card/preview WebP and JPEG variants for stored crop images that "
+        "do not have them yet, decoding and encoding images in parallel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Images processed concurrently.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Rows loaded and updated per batch.")
+        parser.add_argument('--limit', type=int, help="Process at most this many images.")
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist.")
+
+    def handle(self, *args, **options):
+        queryset = CropImage.objects.exclude(image='').order_by('pk')
+        if not options['force']:
+            queryset = queryset.filter(variants={})
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+        # Collect the pks up front; rows are updated while the work proceeds.
+        pks = list(queryset.values_list('pk', flat=True))
+
+        done = failed = 0
+        started = time.perf_counter()
+        batch_size = max(1, options['batch_size'])
+        # PIL releases the GIL while decoding, resizing and encoding, so threads scale.
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for start in range(0, len(pks), batch_size):
+                batch = list(CropImage.objects.filter(pk__in=pks[start:start + batch_size]).only('image', 'variants', 'version'))
+                updated = [crop_image for crop_image in pool.map(self._render, batch) if crop_image is not None]
+                CropImage.objects.bulk_update(updated, ['variants', 'version', 'updated_at'])
+                response_cache.invalidate(crop_image.pk for crop_image in updated)
+                done += len(updated)
+                failed += len(batch) - len(updated)
+                self.stdout.write(f"{done + failed}/{len(pks)} processed")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {done} image(s) in {elapsed:.1f}s; {failed} failed."
+        ))
+
+    def _render(self, crop_image):
+        """
+        Decode one stored image and write its variants, replacing any existing ones.
+
+        Returns:
+            CropImage: The instance with ``variants`` set, or None if the image could not be read.
+        """
+        try:
+            with Image.open(crop_image.image.path) as img:
+                img = ImageOps.exif_transpose(img)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                # Only --force reaches images that already have variants; drop them so they are re-rendered.
+                for formats in crop_image.variants.values():
+                    for name in formats.values():
+                        default_storage.delete(name)
+                crop_image.variants = save_variants(img, crop_image.image.name)
+                crop_image.bump_version()
+        except Exception as e:
+            self.stderr.write(f"Skipping image {crop_image.pk}: {str(e)}")
+            return None
+        return crop_image
@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from detection.models import CropImage
+from detection.phash import dhash, to_hex
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the perceptual hash of stored crop images that were uploaded before "
+        "near-duplicate detection, so later uploads can reuse their diagnoses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Images decoded concurrently.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows loaded and updated per batch.")
+        parser.add_argument('--limit', type=int, help="Hash at most this many images.")
+
+    def handle(self, *args, **options):
+        queryset = CropImage.objects.filter(image_hash='').exclude(image='').order_by('pk')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+        pks = list(queryset.values_list('pk', flat=True))
+
+        done = failed = 0
+        started = time.perf_counter()
+        batch_size = max(1, options['batch_size'])
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for start in range(0, len(pks), batch_size):
+                batch = list(CropImage.objects.filter(pk__in=pks[start:start + batch_size]).only('image', 'image_hash'))
+                updated = [crop_image for crop_image in pool.map(self._hash, batch) if crop_image is not None]
+                CropImage.objects.bulk_update(updated, ['image_hash'])
+                done += len(updated)
+                failed += len(batch) - len(updated)
+                self.stdout.write(f"{done + failed}/{len(pks)} processed")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Hashed {done} image(s) in {elapsed:.1f}s; {failed} failed."
+        ))
+
+    def _hash(self, crop_image):
+        """
+        Hash one stored image the way ingest does for new uploads.
+
+        Returns:
+            CropImage: The instance with ``image_hash`` set, or None if the image could not be read.
+        """
+        try:
+            with Image.open(crop_image.image.path) as img:
+                crop_image.image_hash = to_hex(dhash(ImageOps.exif_transpose(img)))
+        except Exception as e:
+            self.stderr.write(f"Skipping image {crop_image.pk}: {str(e)}")
+            return None
+        return crop_image
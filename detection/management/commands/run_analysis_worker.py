@@ -0,0 +1,98 @@
+import logging
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from detection import result_cache
+from detection.jobs import claim_jobs, default_worker_id, requeue_stale_jobs, run_job_in_thread
+from detection.models import AnalysisJob
+from detection.phash import near_duplicates
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Process queued crop image analyses with a pool of concurrent workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'ANALYSIS_WORKER_CONCURRENCY', 4),
+            help="Number of analyses to run at the same time.",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'ANALYSIS_WORKER_POLL_INTERVAL', 1.0),
+            help="Seconds to wait between queue polls when idle.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is empty (or the AI service defers a job) instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker_id = default_worker_id()
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale analysis job(s).")
+        near_duplicates.rebuild()
+        self.stdout.write(f"Analysis worker {worker_id} started with concurrency {concurrency}.")
+
+        processed = 0
+        deferred = False
+        running = set()
+        next_prune = 0.0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='analysis') as pool:
+            while not self.stopping:
+                if time.monotonic() >= next_prune:
+                    self._prune_cache()
+                    next_prune = time.monotonic() + getattr(settings, 'ANALYSIS_CACHE_PRUNE_INTERVAL', 3600)
+                free_slots = concurrency - len(running)
+                # Deferred jobs go straight back to the queue; a one-shot run must not keep reclaiming them.
+                claimable = free_slots and not (options['once'] and deferred)
+                jobs = claim_jobs(free_slots, worker_id) if claimable else []
+                for job in jobs:
+                    running.add(pool.submit(run_job_in_thread, job))
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        job = future.result()
+                        processed += 1
+                        deferred = deferred or job.status == AnalysisJob.STATUS_PENDING
+                        logger.info(f"Analysis job {job.pk} finished with status {job.status}.")
+                    except Exception as e:
+                        logger.error(f"Analysis worker error: {str(e)}", exc_info=True)
+
+            # Let in-flight analyses finish before exiting.
+            for future in wait(running).done:
+                if future.exception() is None:
+                    processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Analysis worker stopped after {processed} job(s)."))
+
+    def _prune_cache(self):
+        try:
+            pruned = result_cache.prune_expired()
+            if pruned:
+                logger.info(f"Pruned {pruned} expired analysis cache entries.")
+        except Exception as e:
+            logger.error(f"Analysis cache pruning failed: {str(e)}", exc_info=True)
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
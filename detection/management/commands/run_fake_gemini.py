@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.fake_gemini import FakeGeminiBehavior, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake Gemini generateContent API with configurable latency, errors and answers, "
+        "for offline load tests with ANALYZER_BACKEND=http."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on.")
+        parser.add_argument('--port', type=int, default=8765, help="Port to listen on.")
+        parser.add_argument(
+            '--latency', default='lognormal:1.5,0.5',
+            help="Latency distribution: fixed:S, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or exponential:MEAN.",
+        )
+        parser.add_argument('--tail-rate', type=float, default=0.0, help="Fraction of calls that take --tail-latency.")
+        parser.add_argument('--tail-latency', type=float, default=30.0, help="Seconds taken by tail calls.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls failing with 500/503.")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of calls failing with 429.")
+        parser.add_argument('--malformed-rate', type=float, default=0.0, help="Fraction of calls answering non-JSON text.")
+        parser.add_argument('--seed', type=int, help="Random seed for reproducible runs.")
+
+    def handle(self, *args, **options):
+        try:
+            behavior = FakeGeminiBehavior(
+                latency=options['latency'],
+                tail_rate=options['tail_rate'],
+                tail_latency=options['tail_latency'],
+                error_rate=options['error_rate'],
+                rate_limit_rate=options['rate_limit_rate'],
+                malformed_rate=options['malformed_rate'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        server = make_server(options['host'], options['port'], behavior)
+        self.stdout.write(
+            f"Fake Gemini listening on http://{options['host']}:{options['port']} "
+            f"(set ANALYZER_BACKEND=http and ANALYZER_HTTP_URL to use it)."
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(self.style.SUCCESS(f"Fake Gemini stopped; calls served: {behavior.counts}"))
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from detection.models import CropImage
+from detection.storage import image_storage
+
+# '<digest>.<ext>' is a blob, '<digest>.<variant>.<ext>' one of its variants.
+FILE_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})(?P<variant>\.[a-z0-9_]+)?\.[a-z0-9]+$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete content-addressed crop image blobs, and their variants, that no crop image "
+        "references any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help="Keep files modified in the last this many seconds (uploads in flight).")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        storage = image_storage()
+        root = storage.path(storage.prefix)
+        cutoff = time.time() - max(0, options['grace'])
+
+        # Taken before listing files: a row saved later references a blob touched after the cutoff.
+        referenced = {
+            os.path.basename(name).split('.', 1)[0]
+            for name in CropImage.objects.exclude(image='').values_list('image', flat=True).iterator(chunk_size=10000)
+            if storage.is_blob_name(name)
+        }
+
+        report = {'blobs': 0, 'referenced': 0, 'recent': 0, 'deleted': 0, 'files_deleted': 0, 'bytes_freed': 0}
+        for directory, _dirs, files in os.walk(root):
+            groups = {}
+            for filename in files:
+                path = os.path.join(directory, filename)
+                match = FILE_RE.match(filename)
+                if match is None:
+                    if filename.startswith(('.incoming-', '.sweep-')) and self._older(path, cutoff):
+                        # Left behind by a writer or a sweep that crashed.
+                        report['files_deleted'] += self._remove([path], options['dry_run'])
+                    continue
+                group = groups.setdefault(match['digest'], {'blob': None, 'variants': []})
+                if match['variant']:
+                    group['variants'].append(path)
+                else:
+                    group['blob'] = path
+            for digest, group in groups.items():
+                report['blobs'] += group['blob'] is not None
+                if digest in referenced:
+                    report['referenced'] += 1
+                elif not all(self._older(path, cutoff) for path in [group['blob'], *group['variants']] if path):
+                    report['recent'] += 1
+                else:
+                    freed = self._collect(group['blob'], group['variants'], cutoff, options['dry_run'])
+                    if freed is not None:
+                        report['deleted'] += 1
+                        report['files_deleted'] += bool(group['blob']) + len(group['variants'])
+                        report['bytes_freed'] += freed
+
+        report['dry_run'] = options['dry_run']
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _collect(self, blob, variants, cutoff, dry_run):
+        """
+        Delete an unreferenced blob and its variants unless an upload reuses it meanwhile.
+
+        Files are first renamed aside. An upload that reused the blob before the rename has
+        touched it, so it is put back; an upload after the rename no longer finds the blob
+        and writes it, and its variants, again.
+
+        Returns:
+            int: Bytes freed, or None when the blob was kept.
+        """
+        paths = [blob, *variants] if blob else variants
+        size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        if dry_run:
+            return size
+        aside = []
+        for path in paths:
+            try:
+                os.replace(path, self._aside(path))
+                aside.append(path)
+            except FileNotFoundError:
+                pass
+        if blob in aside and not self._older(self._aside(blob), cutoff):
+            # Reused just before it was renamed.
+            self._restore(aside)
+            return None
+        if blob and os.path.exists(blob):
+            # Written again by an upload that may have found the old variants in place.
+            self._restore([path for path in aside if path != blob])
+            self._remove([self._aside(blob)] if blob in aside else [], False)
+            return None
+        self._remove([self._aside(path) for path in aside], False)
+        return size
+
+    def _aside(self, path):
+        directory, filename = os.path.split(path)
+        return os.path.join(directory, f".sweep-{filename}")
+
+    def _restore(self, paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(self._aside(path))
+            else:
+                os.replace(self._aside(path), path)
+
+    def _older(self, path, cutoff):
+        try:
+            return os.path.getmtime(path) < cutoff
+        except FileNotFoundError:
+            return True
+
+    def _remove(self, paths, dry_run):
+        removed = 0
+        for path in paths:
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+        return removed
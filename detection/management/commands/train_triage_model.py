@@ -0,0 +1,134 @@
+import json
+import random
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from detection import triage
+from detection.models import CropImage
+
+DEFAULT_THRESHOLDS = '0.6,0.7,0.8,0.9,0.95'
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local triage classifier on already-diagnosed crop images, report how many "
+        "Gemini calls it would avoid on a held-out split, and save it for the analyzer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Model file to write (defaults to TRIAGE_MODEL_PATH).")
+        parser.add_argument('--test-size', type=float, default=0.2, help="Fraction of images held out for evaluation.")
+        parser.add_argument('--epochs', type=int, default=500, help="Gradient descent steps.")
+        parser.add_argument('--learning-rate', type=float, default=0.5, help="Gradient descent step size.")
+        parser.add_argument('--min-samples', type=int, default=5, help="Skip plant/disease classes with fewer labelled images.")
+        parser.add_argument('--limit', type=int, help="Use at most this many of the newest images.")
+        parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help="Comma-separated confidence thresholds to report.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the train/test split.")
+        parser.add_argument('--no-save', action='store_true', help="Only evaluate; do not write the model file.")
+
+    def handle(self, *args, **options):
+        if not triage.is_available():
+            raise CommandError("NumPy is required for the triage model (pip install numpy).")
+        try:
+            thresholds = [float(value) for value in options['thresholds'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError("--thresholds must be a comma-separated list of numbers.")
+
+        import numpy as np
+
+        features, labels, templates, skipped = self._load_dataset(options['limit'])
+        counts = Counter(labels)
+        kept = {label for label, count in counts.items() if count >= options['min_samples']}
+        if len(kept) < 2:
+            raise CommandError(
+                f"Need at least two plant/disease classes with {options['min_samples']}+ labelled images; found {dict(counts)}."
+            )
+        rows = [i for i, label in enumerate(labels) if label in kept]
+        features = np.stack([features[i] for i in rows])
+        labels = [labels[i] for i in rows]
+
+        train, test = self._split(labels, options['test_size'], options['seed'])
+        fit_options = {'epochs': options['epochs'], 'learning_rate': options['learning_rate']}
+        report = {
+            'images': len(labels),
+            'skipped': skipped,
+            'classes': {label: counts[label] for label in sorted(kept)},
+            'train': len(train),
+            'test': len(test),
+        }
+        if test:
+            model = triage.TriageModel.fit(features[train], [labels[i] for i in train], **fit_options)
+            report['evaluation'] = triage.evaluate(model, features[test], [labels[i] for i in test], thresholds)
+
+        # The saved model learns from every image; the held-out numbers above estimate its behaviour.
+        model = triage.TriageModel.fit(features, labels, templates=templates, **fit_options)
+        if not options['no_save']:
+            path = options['output'] or triage.get_model_path()
+            model.save(path)
+            triage.reset_model()
+            report['saved_to'] = str(path)
+
+        processed = CropImage.objects.filter(is_processed=True, processing_error='')
+        report['production'] = {
+            'processed': processed.count(),
+            'triaged_locally': processed.filter(triaged_locally=True).count(),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _load_dataset(self, limit):
+        """
+        Extract features from every Gemini-diagnosed image with a known plant and a disease
+        that maps to a canonical code.
+
+        Returns:
+            tuple: (feature list, label list, per-class/language templates, skipped count).
+        """
+        queryset = CropImage.objects.filter(
+            is_processed=True, processing_error='', degraded=False, triaged_locally=False
+        ).only(
+            'image', 'language', 'plant_type', 'disease_name', 'explanation', 'treatment'
+        ).order_by('-uploaded_at')
+        if limit:
+            queryset = queryset[:limit]
+
+        features, labels, templates = [], [], {}
+        skipped = 0
+        for crop_image in queryset.iterator(chunk_size=500):
+            label = triage.class_label(crop_image.plant_type, crop_image.disease_name)
+            if label is None:
+                skipped += 1
+                continue
+            try:
+                with Image.open(crop_image.image.path) as img:
+                    features.append(triage.extract_features(img))
+            except Exception as e:
+                self.stderr.write(f"Skipping image {crop_image.pk}: {str(e)}")
+                skipped += 1
+                continue
+            labels.append(label)
+            # Rows are newest first, so each class keeps its latest wording per language.
+            templates.setdefault(label, {}).setdefault(crop_image.language, {
+                'plant_type': crop_image.plant_type,
+                'disease_name': crop_image.disease_name,
+                'explanation': crop_image.explanation,
+                'treatment': crop_image.treatment,
+            })
+        return features, labels, templates, skipped
+
+    def _split(self, labels, test_size, seed):
+        """
+        Stratified train/test split so rare classes appear on both sides.
+        """
+        rnd = random.Random(seed)
+        by_class = {}
+        for i, label in enumerate(labels):
+            by_class.setdefault(label, []).append(i)
+        train, test = [], []
+        for indexes in by_class.values():
+            rnd.shuffle(indexes)
+            cut = int(round(len(indexes) * test_size))
+            test.extend(indexes[:cut])
+            train.extend(indexes[cut:])
+        return sorted(train), sorted(test)
@@ -0,0 +1,162 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from pathlib import PurePosixPath
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Uploaded files are never overwritten (storage picks a new name on collision), so they can be cached forever.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def resolve(path: str) -> Optional[Tuple[str, str, os.stat_result]]:
+    """
+    Map a media URL path to a regular file under ``MEDIA_ROOT``.
+
+    Returns:
+        tuple: (storage name, filesystem path, stat result), or None if the path is
+        hidden, escapes ``MEDIA_ROOT`` or is not a regular file.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    if any(part.startswith('.') for part in PurePosixPath(name).parts):
+        return None
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return name, full_path, st
+
+
+def image_lookup(name: str) -> Q:
+    """
+    Q matching the CropImage that stores ``name``, either as its image or as one of its variants.
+    """
+    path = PurePosixPath(name)
+    lookup = Q(image=name)
+    if len(path.suffixes) >= 2:
+        # Variants are stored as '<stem>.<variant>.<ext>' next to the original.
+        stem = path.name[:-len(''.join(path.suffixes[-2:]))]
+        lookup |= Q(image__startswith=f"{path.parent.as_posix()}/{stem}.")
+    return lookup
+
+
+def file_etag(st: os.stat_result) -> str:
+    """
+    Strong validator from a file's size and modification time.
+    """
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def cache_control(name: str) -> str:
+    scope = 'private' if getattr(settings, 'MEDIA_PRIVATE', False) else 'public'
+    if name.startswith('uploads/'):
+        return f"{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"{scope}, max-age=3600"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range`` header.
+
+    Returns:
+        tuple: Inclusive (start, end) byte positions, None when the header should be
+        ignored (malformed or multi-range), or (size, size) when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            return (size, size) if start >= size else None
+    else:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return size, size
+        start, end = max(0, size - length), size - 1
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, name: str, full_path: str, st: os.stat_result) -> HttpResponse:
+    """
+    Answer a media request for an already access-checked file.
+
+    Conditional requests get a 304 without opening the file. Otherwise the
+    transfer is handed to the front proxy when ``MEDIA_ACCEL_REDIRECT`` (nginx) or
+    ``MEDIA_SENDFILE`` (Apache/lighttpd) is set, or streamed with ``FileResponse``,
+    which uses the server's ``wsgi.file_wrapper`` (sendfile) when available.
+    A single byte range is answered with 206.
+    """
+    etag = file_etag(st)
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        response = _file_response(request, name, full_path, st.st_size, etag)
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(st.st_mtime)
+    response.headers['Cache-Control'] = cache_control(name)
+    return response
+
+
+def _file_response(request, name: str, full_path: str, size: int, etag: str) -> HttpResponse:
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    if accel_prefix:
+        # nginx streams the bytes (and handles Range) from an internal location.
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{name}"
+        return response
+    if getattr(settings, 'MEDIA_SENDFILE', False):
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Sendfile'] = full_path
+        return response
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = byte_range
+    if start >= size:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f"bytes */{size}"
+        return response
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(full_path, start, length), status=206, content_type=content_type)
+    response.headers['Content-Length'] = str(length)
+    response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,214 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+_gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+
+# Upper bounds in seconds; wide enough for both DB queries and multi-second model calls.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Labels (e.g. the endpoint) bound to the current request or job, picked up by ``span``.
+_context: contextvars.ContextVar = contextvars.ContextVar('metrics_context', default=None)
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    """
+    Increment a process-wide counter.
+
+    Args:
+        name (str): Counter name, e.g. 'analysis_cache_hits_total'.
+        value (float): Amount to add.
+        **labels: Optional label values distinguishing series of the same counter.
+    """
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """
+    Record the current value of a gauge (e.g. a queue depth).
+    """
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Record one observation in a histogram with ``DEFAULT_BUCKETS``.
+
+    The series stores per-bucket counts followed by the sum and the count of observations.
+    """
+    index = bisect_left(DEFAULT_BUCKETS, value)
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0.0] * (len(DEFAULT_BUCKETS) + 2)
+        if index < len(DEFAULT_BUCKETS):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def get_counter(name: str, **labels) -> float:
+    """
+    Read the current value of a counter series (0 if never incremented).
+    """
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+@contextmanager
+def bind(**labels):
+    """
+    Bind labels (e.g. ``endpoint``, ``language``) for spans recorded inside the ``with`` block.
+    """
+    current = _context.get()
+    token = _context.set({**(current or {}), **labels})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def label(**labels) -> None:
+    """
+    Add labels to the innermost ``bind`` block, e.g. once a view knows the request language.
+    """
+    current = _context.get()
+    if current is not None:
+        current.update(labels)
+
+
+def context_labels() -> Dict[str, str]:
+    """
+    Return the mutable label dict bound to the current context (empty outside ``bind``).
+    """
+    return _context.get() or {}
+
+
+class Span:
+    """
+    Handle yielded by ``span``; set ``outcome`` to label an observation other than 'ok'/'error'.
+    """
+
+    __slots__ = ('outcome',)
+
+    def __init__(self) -> None:
+        self.outcome = 'ok'
+
+
+@contextmanager
+def span(stage: str, language: str = None):
+    """
+    Time one stage of the upload/analysis path into ``stage_duration_seconds``.
+
+    The observation is labelled with the stage, the bound ``endpoint`` and
+    ``language`` (``language`` may also be given explicitly) and the outcome:
+    'error' when the block raises, otherwise 'ok' or whatever the block set on
+    the yielded ``Span``.
+    """
+    handle = Span()
+    started = time.perf_counter()
+    try:
+        yield handle
+    except BaseException:
+        handle.outcome = 'error'
+        raise
+    finally:
+        labels = context_labels()
+        observe(
+            'stage_duration_seconds',
+            time.perf_counter() - started,
+            stage=stage,
+            endpoint=labels.get('endpoint', 'none'),
+            language=language or labels.get('language', 'none'),
+            outcome=handle.outcome,
+        )
+
+
+def snapshot() -> Dict[str, float]:
+    """
+    Return all counters and gauges as a flat dict keyed by 'name{label="value"}'.
+
+    Histograms are included as their ``_count`` and ``_sum`` series.
+    """
+    with _lock:
+        items = list(_counters.items()) + list(_gauges.items())
+        for (name, labels), series in _histograms.items():
+            items.append(((f'{name}_count', labels), series[-1]))
+            items.append(((f'{name}_sum', labels), series[-2]))
+    result = {}
+    for (name, labels), value in sorted(items):
+        result[_series_name(name, labels)] = value
+    return result
+
+
+def render_prometheus() -> str:
+    """
+    Render every metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, list(series)) for key, series in _histograms.items())
+
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in counters:
+        declare(name, 'counter')
+        lines.append(f'{_series_name(name, labels)} {_format(value)}')
+    for (name, labels), value in gauges:
+        declare(name, 'gauge')
+        lines.append(f'{_series_name(name, labels)} {_format(value)}')
+    for (name, labels), series in histograms:
+        declare(name, 'histogram')
+        cumulative = 0.0
+        for bound, count in zip(DEFAULT_BUCKETS, series):
+            cumulative += count
+            lines.append(f"{_series_name(name + '_bucket', labels + (('le', _format(bound)),))} {_format(cumulative)}")
+        lines.append(f"{_series_name(name + '_bucket', labels + (('le', '+Inf'),))} {_format(series[-1])}")
+        lines.append(f"{_series_name(name + '_sum', labels)} {_format(series[-2])}")
+        lines.append(f"{_series_name(name + '_count', labels)} {_format(series[-1])}")
+    return '\n'.join(lines) + '\n'
+
+
+def _series_name(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def reset() -> None:
+    """
+    Clear all counters, gauges and histograms (used by management commands between benchmark runs).
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
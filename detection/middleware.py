@@ -0,0 +1,92 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+# Per-request [query count, seconds] accumulator filled by the connection wrapper below.
+_request_queries: contextvars.ContextVar = contextvars.ContextVar('request_queries', default=None)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # One wrapper per connection; it only records while a request is being timed.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _time_query(execute, sql, params, many, context):
+    totals = _request_queries.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    """
+    Record request duration, DB query count and DB time per endpoint.
+
+    The endpoint (URL name) is bound for the whole request so stage spans recorded
+    by views, forms and the analyzer carry the same ``endpoint`` label.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(sender=None, connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = None
+        with metrics.bind(endpoint='unmatched'):
+            token = _request_queries.set([0, 0.0])
+            started = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                self._record(request, response, started)
+                _request_queries.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        response = None
+        with metrics.bind(endpoint='unmatched'):
+            token = _request_queries.set([0, 0.0])
+            started = time.perf_counter()
+            try:
+                response = await self.get_response(request)
+            finally:
+                self._record(request, response, started)
+                _request_queries.reset(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is not None:
+            metrics.label(endpoint=match.view_name)
+
+    def _record(self, request, response, started):
+        elapsed = time.perf_counter() - started
+        endpoint = metrics.context_labels().get('endpoint', 'unmatched')
+        status = f"{response.status_code // 100}xx" if response is not None else '5xx'
+        queries, query_seconds = _request_queries.get()
+        metrics.observe('http_request_duration_seconds', elapsed,
+                        endpoint=endpoint, method=request.method, status=status)
+        metrics.observe('http_request_db_seconds', query_seconds, endpoint=endpoint)
+        metrics.incr('http_requests_total', endpoint=endpoint, method=request.method, status=status)
+        metrics.incr('db_queries_total', queries, endpoint=endpoint)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0002_alter_cropimage_language'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', help_text='Current state of the analysis job.', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Number of times a worker has started this job.', verbose_name='Attempts')),
+                ('worker', models.CharField(blank=True, help_text='Identifier of the worker that last claimed the job.', max_length=100, verbose_name='Worker')),
+                ('error', models.TextField(blank=True, help_text='Error message from the last failed attempt.', verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Timestamp when the job was queued.', verbose_name='Created At')),
+                ('started_at', models.DateTimeField(blank=True, help_text='Timestamp when the last attempt started.', null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Timestamp when the job reached a final state.', null=True, verbose_name='Finished At')),
+                ('crop_image', models.ForeignKey(help_text='The crop image to analyze.', on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='detection.cropimage', verbose_name='Crop Image')),
+            ],
+            options={
+                'verbose_name': 'Analysis Job',
+                'verbose_name_plural': 'Analysis Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='detection_a_status_60f67c_idx')],
+            },
+        ),
+    ]
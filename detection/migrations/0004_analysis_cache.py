@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0003_analysisjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of the normalized image, language and prompt version.', max_length=64, unique=True, verbose_name='Key')),
+                ('language', models.CharField(help_text='Language of the cached analysis.', max_length=10, verbose_name='Language')),
+                ('prompt_version', models.CharField(help_text='Version of the prompt that produced the result.', max_length=20, verbose_name='Prompt Version')),
+                ('result', models.JSONField(help_text='Analyzer result returned on a cache hit.', verbose_name='Result')),
+                ('hit_count', models.PositiveIntegerField(default=0, help_text='Number of times the entry was served from the database tier.', verbose_name='Hit Count')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Timestamp when the result was cached.', verbose_name='Created At')),
+                ('last_hit_at', models.DateTimeField(blank=True, help_text='Timestamp of the most recent cache hit.', null=True, verbose_name='Last Hit At')),
+            ],
+            options={
+                'verbose_name': 'Analysis Cache Entry',
+                'verbose_name_plural': 'Analysis Cache Entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='from_cache',
+            field=models.BooleanField(default=False, help_text='Indicates the result was reused from an identical earlier analysis.', verbose_name='Served From Cache'),
+        ),
+    ]
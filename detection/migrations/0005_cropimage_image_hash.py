@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0004_analysis_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropimage',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier image whose diagnosis was reused for this near-duplicate upload.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='detection.cropimage', verbose_name='Duplicate Of'),
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='image_hash',
+            field=models.CharField(blank=True, help_text='64-bit difference hash used to find near-duplicate uploads.', max_length=16, verbose_name='Perceptual Hash'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_cropimage_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropimage',
+            name='degraded',
+            field=models.BooleanField(default=False, help_text='Indicates a looser near-duplicate diagnosis was served while the AI service was unavailable.', verbose_name='Degraded Result'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_cropimage_degraded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropimage',
+            name='triaged_locally',
+            field=models.BooleanField(default=False, help_text='Indicates the diagnosis came from the local triage classifier without calling Gemini.', verbose_name='Triaged Locally'),
+        ),
+    ]
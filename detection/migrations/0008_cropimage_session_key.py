@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_session_keys(apps, schema_editor):
+    # Copy the uploader's session from the first history row so history no longer needs the join.
+    CropImage = apps.get_model('detection', 'CropImage')
+    DetectionHistory = apps.get_model('detection', 'DetectionHistory')
+    first_session = DetectionHistory.objects.filter(
+        crop_image=OuterRef('pk')
+    ).exclude(session_id='').order_by('created_at').values('session_id')[:1]
+    CropImage.objects.filter(session_key='').update(session_key=Coalesce(Subquery(first_session), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_cropimage_triaged_locally'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cropimage',
+            name='detection_c_user_id_f0a6a4_idx',
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='session_key',
+            field=models.CharField(blank=True, help_text='Session of the uploader, used to list history for anonymous users.', max_length=40, verbose_name='Session Key'),
+        ),
+        migrations.RunPython(backfill_session_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cropimage',
+            index=models.Index(condition=models.Q(('is_processed', True)), fields=['user', '-uploaded_at', '-id'], name='cropimage_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cropimage',
+            index=models.Index(condition=models.Q(('is_processed', True)), fields=['session_key', '-uploaded_at', '-id'], name='cropimage_session_history_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0008_cropimage_session_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Storage names of the resized WebP/JPEG copies, keyed by size then format.', verbose_name='Image Variants'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+import detection.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0009_cropimage_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cropimage',
+            name='image',
+            field=models.ImageField(db_index=True, help_text='Uploaded crop image for analysis.', storage=detection.storage.image_storage, upload_to='uploads/', verbose_name='Image'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:54
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    # Same grouping as detection.rollups.rebuild, on the historical models.
+    CropImage = apps.get_model('detection', 'CropImage')
+    DailyDiseaseStat = apps.get_model('detection', 'DailyDiseaseStat')
+    rows = (
+        CropImage.objects.filter(is_processed=True, processing_error='', degraded=False)
+        .annotate(day=TruncDate('uploaded_at'))
+        .values('day', 'plant_type', 'disease_name', 'language')
+        .annotate(count=Count('id'), confidence_sum=Sum(Coalesce('confidence', Value(0.0), output_field=FloatField())))
+        .order_by()
+    )
+    DailyDiseaseStat.objects.bulk_create([DailyDiseaseStat(**row) for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0010_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDiseaseStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Upload date of the counted images.', verbose_name='Day')),
+                ('plant_type', models.CharField(blank=True, help_text='Plant or crop identified.', max_length=100, verbose_name='Plant Type')),
+                ('disease_name', models.CharField(blank=True, help_text="Disease identified, or 'Healthy'.", max_length=100, verbose_name='Disease Name')),
+                ('language', models.CharField(help_text='Language of the analyses.', max_length=10, verbose_name='Language')),
+                ('count', models.IntegerField(default=0, help_text='Number of successful diagnoses.', verbose_name='Count')),
+                ('confidence_sum', models.FloatField(default=0.0, help_text="Sum of the diagnoses' confidence; divided by count for the average.", verbose_name='Confidence Sum')),
+            ],
+            options={
+                'verbose_name': 'Daily Disease Statistic',
+                'verbose_name_plural': 'Daily Disease Statistics',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'plant_type', 'disease_name', 'language'), name='dailydiseasestat_unique_key')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:01
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Rows predate change tracking; their upload time is the best known modification time.
+    CropImage = apps.get_model('detection', 'CropImage')
+    CropImage.objects.update(updated_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0011_dailydiseasestat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Timestamp of the last change; sent as Last-Modified on result pages.', verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text="Incremented on every change; part of the result pages' ETag.", verbose_name='Version'),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0012_cropimage_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict, help_text='Diagnosis fields received so far by the running attempt, relayed to result streams.', verbose_name='Progress'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0013_analysisjob_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysiscacheentry',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, help_text='Timestamp when the result was cached; the entry expires ANALYSIS_CACHE_DB_TTL later.', verbose_name='Created At'),
+        ),
+    ]
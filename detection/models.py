@@ -1,10 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
-from PIL import Image
-import os
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 import logging
+from .ingest import get_variant_sizes, ingest_image, save_variants
+from .phash import near_duplicates
+from .storage import image_storage
+from . import metrics, response_cache, rollups
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +17,13 @@ class CropImage(models.Model):
     """
     Model to store uploaded crop images and their AI analysis results.
     """
+    # Fields written by apply_analysis_result (e.g. for bulk_update)
+    ANALYSIS_RESULT_FIELDS = [
+        'plant_type', 'disease_name', 'confidence', 'explanation', 'treatment',
+        'is_processed', 'from_cache', 'duplicate_of', 'degraded', 'triaged_locally', 'processing_error',
+        'version', 'updated_at',
+    ]
+
     # Expanded disease choices for global relevance
     DISEASE_CHOICES = [
         ('healthy', _('Healthy')),
@@ -36,8 +48,16 @@ class CropImage(models.Model):
         verbose_name=_("User"),
         help_text=_("The user who uploaded the image, if authenticated.")
     )
+    session_key = models.CharField(
+        max_length=40,
+        blank=True,
+        verbose_name=_("Session Key"),
+        help_text=_("Session of the uploader, used to list history for anonymous users.")
+    )
     image = models.ImageField(
-        upload_to='uploads/%Y/%m/%d/',
+        upload_to='uploads/',
+        storage=image_storage,
+        db_index=True,
         verbose_name=_("Image"),
         help_text=_("Uploaded crop image for analysis.")
     )
@@ -46,6 +66,16 @@ class CropImage(models.Model):
         verbose_name=_("Uploaded At"),
         help_text=_("Timestamp when the image was uploaded.")
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Updated At"),
+        help_text=_("Timestamp of the last change; sent as Last-Modified on result pages.")
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        verbose_name=_("Version"),
+        help_text=_("Incremented on every change; part of the result pages' ETag.")
+    )
     language = models.CharField(
         max_length=10,
         default='en',
@@ -96,6 +126,42 @@ class CropImage(models.Model):
         verbose_name=_("Processing Error"),
         help_text=_("Error message if AI processing failed.")
     )
+    from_cache = models.BooleanField(
+        default=False,
+        verbose_name=_("Served From Cache"),
+        help_text=_("Indicates the result was reused from an identical earlier analysis.")
+    )
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_("Image Variants"),
+        help_text=_("Storage names of the resized WebP/JPEG copies, keyed by size then format.")
+    )
+    image_hash = models.CharField(
+        max_length=16,
+        blank=True,
+        verbose_name=_("Perceptual Hash"),
+        help_text=_("64-bit difference hash used to find near-duplicate uploads.")
+    )
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates',
+        verbose_name=_("Duplicate Of"),
+        help_text=_("Earlier image whose diagnosis was reused for this near-duplicate upload.")
+    )
+    degraded = models.BooleanField(
+        default=False,
+        verbose_name=_("Degraded Result"),
+        help_text=_("Indicates a looser near-duplicate diagnosis was served while the AI service was unavailable.")
+    )
+    triaged_locally = models.BooleanField(
+        default=False,
+        verbose_name=_("Triaged Locally"),
+        help_text=_("Indicates the diagnosis came from the local triage classifier without calling Gemini.")
+    )
 
     class Meta:
         ordering = ['-uploaded_at']
@@ -103,7 +169,17 @@ class CropImage(models.Model):
         verbose_name_plural = _("Crop Images")
         indexes = [
             models.Index(fields=['uploaded_at']),
-            models.Index(fields=['user', 'is_processed']),
+            # History pages: processed rows per owner in (uploaded_at, id) keyset order
+            models.Index(
+                fields=['user', '-uploaded_at', '-id'],
+                condition=models.Q(is_processed=True),
+                name='cropimage_user_history_idx',
+            ),
+            models.Index(
+                fields=['session_key', '-uploaded_at', '-id'],
+                condition=models.Q(is_processed=True),
+                name='cropimage_session_history_idx',
+            ),
         ]
 
     def __str__(self):
@@ -111,35 +187,168 @@ class CropImage(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Override save to resize large images and optimize storage.
+        Override save to normalize newly attached image files exactly once.
+
+        Uploads from ImageUploadForm arrive already ingested (with ``image_hash``
+        set); files attached any other way, e.g. through the admin, are ingested
+        here before they are first written. Later saves never touch the file.
+        Every update bumps ``version`` and drops the cached result pages.
         """
+        if not self._state.adding:
+            self.bump_version()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        if self.image and not self.image._committed and not self.image_hash:
+            try:
+                ingested = ingest_image(self.image.file, name=self.image.name)
+                self.image = ingested.content
+                self.image_hash = ingested.image_hash
+                self.ingested_image = ingested.image
+            except Exception as e:
+                logger.error(f"Image ingest error for {self.image.name}: {str(e)}", exc_info=True)
+        self.store_image()
         super().save(*args, **kwargs)
+        pk = self.pk
+        transaction.on_commit(lambda: response_cache.invalidate([pk]))
 
-        if self.image:
+    def bump_version(self):
+        """
+        Mark the row as changed for result-page validators.
+
+        ``save`` calls this itself; callers writing with ``bulk_update`` call it and
+        include ``version`` and ``updated_at`` (part of ``ANALYSIS_RESULT_FIELDS``),
+        then pass the pks to ``response_cache.invalidate``.
+        """
+        self.version = (self.version or 0) + 1
+        self.updated_at = timezone.now()
+
+    def store_image(self):
+        """
+        Write a newly attached image file and its size variants to storage.
+
+        Runs before the row is written (also call it before ``bulk_create``) so the
+        variant names are saved with the same INSERT. Variants are rendered from the
+        in-memory ingested image; without one they are left to ``generate_variants``.
+        """
+        if not self.image or self.image._committed:
+            return
+        self.image.save(self.image.name, self.image.file, save=False)
+        ingested_image = getattr(self, 'ingested_image', None)
+        if ingested_image is not None:
             try:
-                img = Image.open(self.image.path)
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                # Resize image if too large (max 1024x1024)
-                max_size = getattr(settings, 'MAX_IMAGE_SIZE', (1024, 1024))
-                if img.height > max_size[0] or img.width > max_size[1]:
-                    img.thumbnail(max_size)
-                    img.save(self.image.path, quality=85, optimize=True)
+                with metrics.span('variants'):
+                    self.variants = save_variants(ingested_image, self.image.name)
             except Exception as e:
-                logger.error(f"Image resizing error for {self.image.path}: {str(e)}", exc_info=True)
+                logger.error(f"Variant generation error for {self.image.name}: {str(e)}", exc_info=True)
+
+    def variant_url(self, variant, fmt='jpeg'):
+        """
+        URL of a resized copy of the image, or None if it has not been generated.
+        """
+        name = self.variants.get(variant, {}).get(fmt)
+        return self.image.storage.url(name) if name else None
+
+    @property
+    def variant_urls(self):
+        """
+        {variant: {'webp': url or None, 'jpeg': url}} for templates; JPEG falls back to the original.
+        """
+        urls = {}
+        for variant in get_variant_sizes():
+            jpeg_url = self.variant_url(variant)
+            urls[variant] = {
+                'webp': self.variant_url(variant, 'webp'),
+                'jpeg': jpeg_url or (self.image.url if self.image else ''),
+            }
+        return urls
+
+    def apply_analysis_result(self, result, save=True):
+        """
+        Copy an analyzer result dict onto this instance and mark it processed.
+
+        Without ``save`` the caller saves the row (with ``ANALYSIS_RESULT_FIELDS``), then
+        passes it to ``rollups.record`` and its pk to ``response_cache.invalidate``.
+        """
+        # What the row counted for in the rollups before this result.
+        self._rollup_previous = rollups.entry(self)
+        self.plant_type = result.get('plant_type', 'Unknown')
+        self.disease_name = result.get('disease_name', 'Unknown')
+        self.confidence = result.get('confidence', 0.0)
+        self.explanation = result.get('explanation', '')
+        self.treatment = result.get('treatment', '')
+        self.is_processed = True
+        self.from_cache = result.get('cached', False)
+        self.duplicate_of_id = result.get('duplicate_of')
+        self.degraded = result.get('degraded', False)
+        self.triaged_locally = result.get('local', False)
+        self.processing_error = '' if result.get('success', True) else result.get('error', 'Unknown error')
+        if not save and not self._state.adding:
+            self.bump_version()
+        if save:
+            self.save()
+            rollups.record([self])
+            if self.is_reusable:
+                near_duplicates.add(self)
+
+    async def aapply_analysis_result(self, result):
+        """
+        Async variant of ``apply_analysis_result`` that saves through the async ORM.
+        """
+        self.apply_analysis_result(result, save=False)
+        await self.asave()
+        await sync_to_async(rollups.record)([self])
+        if self.is_reusable:
+            near_duplicates.add(self)
+
+    @property
+    def is_reusable(self):
+        """
+        Whether this diagnosis may be reused for near-duplicate uploads.
+        """
+        return self.is_processed and not self.processing_error and not self.degraded
+
+    def as_analysis_result(self):
+        """
+        Return this image's diagnosis in the analyzer's result format.
+        """
+        return {
+            'plant_type': self.plant_type,
+            'disease_name': self.disease_name,
+            'confidence': self.confidence,
+            'explanation': self.explanation,
+            'treatment': self.treatment,
+            'success': True,
+        }
 
     def delete(self, *args, **kwargs):
         """
-        Override delete to remove associated image file from storage.
+        Override delete to remove an image file stored under a legacy upload name, with its variants.
+
+        Content-addressed blobs are shared by identical uploads, so they are left for
+        ``manage.py sweep_blobs`` to collect once no row references them: deleting one
+        here could race with an upload of the same content.
         """
-        if self.image:
-            if os.path.isfile(self.image.path):
-                try:
-                    os.remove(self.image.path)
-                except Exception as e:
-                    logger.error(f"Error deleting image file {self.image.path}: {str(e)}", exc_info=True)
-        super().delete(*args, **kwargs)
+        near_duplicates.remove(self)
+        image_name = self.image.name
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        rollups.discard(self)
+        response_cache.invalidate([pk])
+        if image_name and not self.image.storage.is_blob_name(image_name):
+            self._delete_files(image_name)
+        return result
+
+    def _delete_files(self, image_name):
+        """
+        Remove an image file and its variants from storage.
+        """
+        names = [image_name] + [name for formats in self.variants.values() for name in formats.values()]
+        for name in names:
+            try:
+                storage = self.image.storage if name == image_name else default_storage
+                storage.delete(name)
+            except Exception as e:
+                logger.error(f"Error deleting image file {name}: {str(e)}", exc_info=True)
 
 class DetectionHistory(models.Model):
     """
@@ -193,4 +402,192 @@ class DetectionHistory(models.Model):
         ]
 
     def __str__(self):
-        return f"{_('Detection')} {self.id} - {self.crop_image} ({self.created_at})"
\ No newline at end of file
+        return f"{_('Detection')} {self.id} - {self.crop_image} ({self.created_at})"
+
+class AnalysisJob(models.Model):
+    """
+    Queued AI analysis of a CropImage, picked up by the analysis worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+
+    crop_image = models.ForeignKey(
+        CropImage,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name=_("Crop Image"),
+        help_text=_("The crop image to analyze.")
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_("Status"),
+        help_text=_("Current state of the analysis job.")
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_("Attempts"),
+        help_text=_("Number of times a worker has started this job.")
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("Worker"),
+        help_text=_("Identifier of the worker that last claimed the job.")
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name=_("Error"),
+        help_text=_("Error message from the last failed attempt.")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Created At"),
+        help_text=_("Timestamp when the job was queued.")
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_("Started At"),
+        help_text=_("Timestamp when the last attempt started.")
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_("Finished At"),
+        help_text=_("Timestamp when the job reached a final state.")
+    )
+    progress = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_("Progress"),
+        help_text=_("Diagnosis fields received so far by the running attempt, relayed to result streams.")
+    )
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = _("Analysis Job")
+        verbose_name_plural = _("Analysis Jobs")
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{_('Job')} {self.id} - {self.crop_image_id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class AnalysisCacheEntry(models.Model):
+    """
+    Persistent tier of the analysis result cache, keyed by image content hash.
+    """
+    key = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name=_("Key"),
+        help_text=_("SHA-256 of the normalized image, language and prompt version.")
+    )
+    language = models.CharField(
+        max_length=10,
+        verbose_name=_("Language"),
+        help_text=_("Language of the cached analysis.")
+    )
+    prompt_version = models.CharField(
+        max_length=20,
+        verbose_name=_("Prompt Version"),
+        help_text=_("Version of the prompt that produced the result.")
+    )
+    result = models.JSONField(
+        verbose_name=_("Result"),
+        help_text=_("Analyzer result returned on a cache hit.")
+    )
+    hit_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Hit Count"),
+        help_text=_("Number of times the entry was served from the database tier.")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name=_("Created At"),
+        help_text=_("Timestamp when the result was cached; the entry expires ANALYSIS_CACHE_DB_TTL later.")
+    )
+    last_hit_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_("Last Hit At"),
+        help_text=_("Timestamp of the most recent cache hit.")
+    )
+
+    class Meta:
+        verbose_name = _("Analysis Cache Entry")
+        verbose_name_plural = _("Analysis Cache Entries")
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.language}, v{self.prompt_version})"
+
+class DailyDiseaseStat(models.Model):
+    """
+    Daily rollup of diagnoses per plant, disease and language, maintained by ``detection.rollups``.
+    """
+    day = models.DateField(
+        verbose_name=_("Day"),
+        help_text=_("Upload date of the counted images.")
+    )
+    plant_type = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("Plant Type"),
+        help_text=_("Plant or crop identified.")
+    )
+    disease_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("Disease Name"),
+        help_text=_("Disease identified, or 'Healthy'.")
+    )
+    language = models.CharField(
+        max_length=10,
+        verbose_name=_("Language"),
+        help_text=_("Language of the analyses.")
+    )
+    count = models.IntegerField(
+        default=0,
+        verbose_name=_("Count"),
+        help_text=_("Number of successful diagnoses.")
+    )
+    confidence_sum = models.FloatField(
+        default=0.0,
+        verbose_name=_("Confidence Sum"),
+        help_text=_("Sum of the diagnoses' confidence; divided by count for the average.")
+    )
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = _("Daily Disease Statistic")
+        verbose_name_plural = _("Daily Disease Statistics")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'plant_type', 'disease_name', 'language'],
+                name='dailydiseasestat_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.plant_type} / {self.disease_name} ({self.language}): {self.count}"
+
+    @property
+    def average_confidence(self):
+        return self.confidence_sum / self.count if self.count else None
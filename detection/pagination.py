@@ -0,0 +1,90 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(crop_image) -> str:
+    """
+    Encode a row's (uploaded_at, id) position as an opaque, URL-safe cursor.
+    """
+    raw = f"{crop_image.uploaded_at.isoformat()}|{crop_image.pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """
+    Decode a cursor from ``encode_cursor``.
+
+    Returns:
+        tuple: (uploaded_at, id), or None if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        uploaded_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of rows ordered newest first, linked to its neighbours by cursors.
+
+    Unlike ``Paginator`` pages, fetching a page never counts or skips rows, so
+    deep pages cost the same as the first one.
+    """
+
+    def __init__(self, object_list: List, has_next: bool, has_previous: bool) -> None:
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = encode_cursor(object_list[-1]) if has_next and object_list else None
+        self.previous_cursor = encode_cursor(object_list[0]) if has_previous and object_list else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+
+def keyset_page(queryset: QuerySet, per_page: int, after: Optional[str] = None,
+                before: Optional[str] = None) -> KeysetPage:
+    """
+    Fetch one page of ``queryset`` in (-uploaded_at, -id) order.
+
+    Args:
+        queryset (QuerySet): Rows to page through; any ordering is replaced.
+        per_page (int): Rows per page.
+        after (str, optional): Cursor of the last row of the previous page; returns older rows.
+        before (str, optional): Cursor of the first row of the next page; returns newer rows.
+
+    Returns:
+        KeysetPage: The page. Malformed cursors fall back to the first page.
+    """
+    before_key = decode_cursor(before) if before else None
+    if before_key is not None:
+        uploaded_at, pk = before_key
+        rows = list(queryset.filter(
+            Q(uploaded_at__gte=uploaded_at) & (Q(uploaded_at__gt=uploaded_at) | Q(id__gt=pk))
+        ).order_by('uploaded_at', 'id')[:per_page + 1])
+        if rows:
+            return KeysetPage(rows[:per_page][::-1], has_next=True, has_previous=len(rows) > per_page)
+        # Nothing newer is left; show the first page instead.
+        after = None
+
+    after_key = decode_cursor(after) if after else None
+    if after_key is not None:
+        uploaded_at, pk = after_key
+        # The leading range on uploaded_at lets the (owner, uploaded_at, id) index seek.
+        queryset = queryset.filter(
+            Q(uploaded_at__lte=uploaded_at) & (Q(uploaded_at__lt=uploaded_at) | Q(id__lt=pk))
+        )
+    rows = list(queryset.order_by('-uploaded_at', '-id')[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after_key is not None)
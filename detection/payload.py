@@ -0,0 +1,206 @@
+import hashlib
+import io
+from typing import Dict, Optional, Sequence, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+from . import metrics
+from .result_cache import LRUTTLCache
+
+# Encoders the payload stage can use: name -> (MIME type, PIL format).
+FORMATS = {
+    'jpeg': ('image/jpeg', 'JPEG'),
+    'webp': ('image/webp', 'WEBP'),
+}
+# 'full' keeps every chroma sample, 'subsampled' halves chroma resolution (JPEG 4:2:0;
+# WebP always subsamples), 'grayscale' drops colour entirely.
+COLOURS = ('full', 'subsampled', 'grayscale')
+
+DEFAULT_MAX_BYTES = 200 * 1024
+DEFAULT_SIZES = (1024, 768, 512, 384)
+DEFAULT_QUALITIES = (85, 75, 65)
+
+_cache = LRUTTLCache(
+    max_entries=getattr(settings, 'ANALYSIS_PAYLOAD_CACHE_ENTRIES', 256),
+    ttl=getattr(settings, 'ANALYSIS_PAYLOAD_CACHE_TTL', 60 * 60),
+)
+
+
+class PayloadPolicy:
+    """
+    How images are encoded for model calls: the byte budget and the settings tried to meet it.
+
+    Args:
+        max_bytes (int): Largest acceptable payload.
+        sizes (sequence): Candidate longest edges in pixels, tried largest first.
+        qualities (sequence): Candidate encoder qualities, tried highest first at each size.
+        image_format (str): Key of ``FORMATS``.
+        colour (str): One of ``COLOURS``.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, sizes: Sequence[int] = DEFAULT_SIZES,
+                 qualities: Sequence[int] = DEFAULT_QUALITIES, image_format: str = 'jpeg',
+                 colour: str = 'full') -> None:
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown payload format '{image_format}'; choose one of: {', '.join(FORMATS)}.")
+        if colour not in COLOURS:
+            raise ValueError(f"Unknown payload colour mode '{colour}'; choose one of: {', '.join(COLOURS)}.")
+        if not sizes or not qualities:
+            raise ValueError("Payload sizes and qualities must not be empty.")
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.qualities = tuple(sorted(qualities, reverse=True))
+        self.image_format = image_format
+        self.colour = colour
+
+    @classmethod
+    def from_settings(cls) -> 'PayloadPolicy':
+        """
+        Build the policy configured by the ``ANALYSIS_PAYLOAD_*`` settings.
+        """
+        return cls(
+            max_bytes=getattr(settings, 'ANALYSIS_PAYLOAD_MAX_BYTES', DEFAULT_MAX_BYTES),
+            sizes=getattr(settings, 'ANALYSIS_PAYLOAD_SIZES', DEFAULT_SIZES),
+            qualities=getattr(settings, 'ANALYSIS_PAYLOAD_QUALITIES', DEFAULT_QUALITIES),
+            image_format=getattr(settings, 'ANALYSIS_PAYLOAD_FORMAT', 'jpeg'),
+            colour=getattr(settings, 'ANALYSIS_PAYLOAD_COLOUR', 'full'),
+        )
+
+    @property
+    def signature(self) -> str:
+        sizes = ','.join(str(size) for size in self.sizes)
+        qualities = ','.join(str(quality) for quality in self.qualities)
+        return f"{self.image_format}:{self.colour}:{self.max_bytes}:{sizes}:{qualities}"
+
+    def __repr__(self) -> str:
+        return f"PayloadPolicy({self.signature})"
+
+
+class Payload:
+    """
+    An encoded image ready to send to the model, with the settings that produced it.
+    """
+
+    def __init__(self, data: bytes, mime_type: str, size: Tuple[int, int], quality: int, colour: str) -> None:
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.quality = quality
+        self.colour = colour
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def as_part(self) -> Dict[str, object]:
+        """
+        The payload as an inline-data content part, accepted by every analyzer backend.
+        """
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'ANALYSIS_PAYLOAD_ENABLED', True)
+
+
+def get_payload(img: Image.Image, policy: Optional[PayloadPolicy] = None) -> Payload:
+    """
+    Encoded payload for an image under ``policy``, cached per image and policy.
+
+    Retries, reanalyses and analyses of the same photo in another language send the
+    same bytes, so they are encoded once per process.
+
+    Args:
+        img (Image.Image): RGB image to send.
+        policy (PayloadPolicy, optional): Defaults to ``PayloadPolicy.from_settings()``.
+
+    Returns:
+        Payload: The encoded image.
+    """
+    policy = policy or PayloadPolicy.from_settings()
+    digest = hashlib.sha256(f"{img.width}x{img.height}|".encode())
+    digest.update(img.tobytes())
+    key = f"{digest.hexdigest()}|{policy.signature}"
+    payload = _cache.get(key)
+    if payload is not None:
+        metrics.incr('analysis_payloads_total', cache='hit')
+        return payload
+    payload = encode(img, policy)
+    _cache.set(key, payload)
+    metrics.incr('analysis_payloads_total', cache='miss')
+    metrics.incr('analysis_payload_bytes_total', len(payload))
+    metrics.incr('analysis_payload_source_pixels_total', img.width * img.height)
+    return payload
+
+
+def encode(img: Image.Image, policy: PayloadPolicy) -> Payload:
+    """
+    Encode an image at the largest size, then the highest quality, that fits the byte budget.
+
+    Sizes whose payload is predicted (from the last encode, scaling with pixel count)
+    to exceed the budget even at the lowest quality are skipped without encoding.
+    When nothing fits, the smallest encoding tried is returned.
+
+    Args:
+        img (Image.Image): RGB image to encode.
+        policy (PayloadPolicy): Budget and candidate settings.
+
+    Returns:
+        Payload: The chosen encoding.
+    """
+    if policy.colour == 'grayscale':
+        img = img.convert('L')
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    mime_type, pil_format = FORMATS[policy.image_format]
+    smallest = None
+    previous = None  # (bytes at the lowest quality, pixel count) of the last size encoded
+    tried = set()
+    for edge in policy.sizes:
+        resized = _fit(img, edge)
+        if resized.size in tried:
+            # The image is already smaller than this edge.
+            continue
+        tried.add(resized.size)
+        pixels = resized.width * resized.height
+        if previous is not None and edge != policy.sizes[-1]:
+            if previous[0] * pixels / previous[1] > policy.max_bytes * 1.2:
+                continue
+        for quality in policy.qualities:
+            data = _encode(resized, pil_format, quality, policy.colour)
+            payload = Payload(data, mime_type, resized.size, quality, policy.colour)
+            if len(data) <= policy.max_bytes:
+                return payload
+            if smallest is None or len(data) < len(smallest):
+                smallest = payload
+        previous = (len(data), pixels)
+    metrics.incr('analysis_payload_over_budget_total')
+    return smallest
+
+
+def _fit(img: Image.Image, edge: int) -> Image.Image:
+    scale = edge / max(img.size)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def _encode(img: Image.Image, pil_format: str, quality: int, colour: str) -> bytes:
+    buffer = io.BytesIO()
+    if pil_format == 'JPEG':
+        subsampling = 0 if colour == 'full' else 2
+        try:
+            img.save(buffer, format='JPEG', quality=quality, optimize=True, subsampling=subsampling)
+        except OSError:
+            # Pillow sizes the optimizing encoder's buffer at one byte per pixel, which
+            # detailed images at high quality (notably 4:4:4) overflow.
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=quality, subsampling=subsampling)
+    else:
+        img.save(buffer, format=pil_format, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def clear_cache() -> None:
+    _cache.clear()
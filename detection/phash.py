@@ -0,0 +1,272 @@
+import logging
+import threading
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# Three blocks of ~21 bits keep buckets small even with millions of hashes indexed.
+BLOCK_WIDTHS = (22, 21, 21)
+BLOCK_SHIFTS = (0, 22, 43)
+BLOCK_COUNT = len(BLOCK_WIDTHS)
+
+
+def dhash(img: Image.Image) -> int:
+    """
+    Compute a 64-bit difference hash of an image.
+
+    The image is reduced to 9x8 grayscale and each bit records whether a pixel is
+    brighter than its right-hand neighbour, which survives resizing, recompression
+    and small crops done by messaging apps.
+
+    Args:
+        img (Image.Image): Image to hash.
+
+    Returns:
+        int: Unsigned 64-bit hash.
+    """
+    small = img.convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes for fast radius queries.
+
+    Hashes are split into three ~21-bit blocks, each with its own lookup table. By
+    the pigeonhole principle any hash within distance ``r`` of a query matches it
+    within ``r // 3`` bits in at least one block, so a query only probes a few
+    hundred table slots instead of scanning every stored hash.
+    """
+
+    def __init__(self) -> None:
+        self._hashes: Dict[int, int] = {}
+        self._tables: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in range(BLOCK_COUNT)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, item_id: int, value: int) -> None:
+        with self._lock:
+            if item_id in self._hashes:
+                self._discard(item_id)
+            self._hashes[item_id] = value
+            for table, block in zip(self._tables, _blocks(value)):
+                table.setdefault(block, []).append((item_id, value))
+
+    def remove(self, item_id: int) -> None:
+        with self._lock:
+            self._discard(item_id)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Find stored items within ``max_distance`` bits of ``value``.
+
+        Returns:
+            list: (distance, item_id) pairs, closest first and newest first on ties.
+        """
+        sub_radius = max_distance // BLOCK_COUNT
+        matches = {}
+        with self._lock:
+            for table, block, width in zip(self._tables, _blocks(value), BLOCK_WIDTHS):
+                for mask in _flip_masks(sub_radius, width):
+                    bucket = table.get(block ^ mask)
+                    if not bucket:
+                        continue
+                    for item_id, stored in bucket:
+                        distance = (value ^ stored).bit_count()
+                        if distance <= max_distance:
+                            matches[item_id] = distance
+        return sorted(((distance, item_id) for item_id, distance in matches.items()),
+                      key=lambda match: (match[0], -match[1]))
+
+    def _discard(self, item_id: int) -> None:
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, block in zip(self._tables, _blocks(value)):
+            bucket = table.get(block)
+            if bucket:
+                bucket[:] = [entry for entry in bucket if entry[0] != item_id]
+                if not bucket:
+                    del table[block]
+
+
+def _blocks(value: int) -> List[int]:
+    return [(value >> shift) & ((1 << width) - 1) for shift, width in zip(BLOCK_SHIFTS, BLOCK_WIDTHS)]
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int, width: int) -> Tuple[int, ...]:
+    """
+    All XOR masks that flip at most ``radius`` bits of a ``width``-bit block.
+    """
+    masks = [0]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(width), flips):
+            masks.append(sum(1 << bit for bit in bits))
+    return tuple(masks)
+
+
+class NearDuplicateIndex:
+    """
+    Per-language Hamming indexes of already-diagnosed images, built from the database.
+
+    Server entrypoints call ``warm_up`` so the first upload does not pay for the build;
+    otherwise the first search builds it.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: Dict[str, HammingIndex] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Held for a whole build, so concurrent first searches wait for one build.
+        self._build_lock = threading.Lock()
+        # Images saved while a build reads the table, added once it is swapped in.
+        self._pending: Optional[List[Tuple[int, str, str]]] = None
+
+    def rebuild(self) -> int:
+        """
+        Load every successfully processed image hash from the database.
+
+        Returns:
+            int: Number of hashes indexed.
+        """
+        with self._build_lock:
+            return self._build()
+
+    def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._build_lock:
+            if not self._loaded:
+                self._build()
+
+    def warm_up(self) -> Optional[threading.Thread]:
+        """
+        Build the index on a background thread (``NEAR_DUPLICATE_WARM_UP``).
+
+        Searches arriving meanwhile wait for this build instead of starting their own.
+
+        Returns:
+            Thread: The build thread, or None when near-duplicate reuse or warm-up is disabled.
+        """
+        if not getattr(settings, 'NEAR_DUPLICATE_ENABLED', True) or not getattr(settings, 'NEAR_DUPLICATE_WARM_UP', True):
+            return None
+        thread = threading.Thread(target=self._warm_up, name='near-duplicate-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self) -> None:
+        from django.db import connection
+
+        try:
+            self.ensure_loaded()
+        except Exception as e:
+            # E.g. migrations not applied yet; the first search retries.
+            logger.error(f"Near-duplicate index warm-up failed: {str(e)}", exc_info=True)
+        finally:
+            connection.close()
+
+    def _build(self) -> int:
+        from .models import CropImage
+
+        with self._lock:
+            self._pending = []
+        indexes: Dict[str, HammingIndex] = {}
+        rows = CropImage.objects.filter(
+            is_processed=True, processing_error='', degraded=False
+        ).exclude(image_hash='').values_list('pk', 'language', 'image_hash').iterator(chunk_size=10000)
+        count = 0
+        try:
+            for pk, language, image_hash in rows:
+                indexes.setdefault(language, HammingIndex()).add(pk, from_hex(image_hash))
+                count += 1
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for pk, language, image_hash in self._pending:
+                indexes.setdefault(language, HammingIndex()).add(pk, from_hex(image_hash))
+            self._indexes = indexes
+            self._pending = None
+            self._loaded = True
+        logger.info(f"Near-duplicate index built with {count} image hash(es).")
+        return count
+
+    def add(self, crop_image) -> None:
+        if not crop_image.image_hash:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((crop_image.pk, crop_image.language, crop_image.image_hash))
+                return
+            if not self._loaded:
+                return
+            index = self._indexes.setdefault(crop_image.language, HammingIndex())
+        index.add(crop_image.pk, from_hex(crop_image.image_hash))
+
+    def remove(self, crop_image) -> None:
+        index = self._indexes.get(crop_image.language)
+        if index is not None:
+            index.remove(crop_image.pk)
+
+    def search(self, image_hash: str, language: str, max_distance: int) -> List[Tuple[int, int]]:
+        self.ensure_loaded()
+        index = self._indexes.get(language)
+        if index is None:
+            return []
+        return index.search(from_hex(image_hash), max_distance)
+
+
+near_duplicates = NearDuplicateIndex()
+
+
+def find_near_duplicate(crop_image, max_distance: Optional[int] = None):
+    """
+    Find an already-diagnosed image in the same language that looks like ``crop_image``.
+
+    Args:
+        crop_image (CropImage): Image awaiting analysis, with ``image_hash`` set.
+        max_distance (int, optional): Largest Hamming distance accepted; defaults to
+            ``NEAR_DUPLICATE_MAX_DISTANCE``.
+
+    Returns:
+        CropImage: The closest processed image within ``max_distance``, or None.
+    """
+    from .models import CropImage
+
+    if not getattr(settings, 'NEAR_DUPLICATE_ENABLED', True) or not crop_image.image_hash:
+        return None
+    if max_distance is None:
+        max_distance = getattr(settings, 'NEAR_DUPLICATE_MAX_DISTANCE', 6)
+    for distance, pk in near_duplicates.search(crop_image.image_hash, crop_image.language, max_distance):
+        if pk == crop_image.pk:
+            continue
+        match = CropImage.objects.filter(pk=pk, is_processed=True, processing_error='', degraded=False).first()
+        if match is not None:
+            return match
+        # Deleted or reprocessed since the index was built.
+        near_duplicates.remove(CropImage(pk=pk, language=crop_image.language))
+    return None
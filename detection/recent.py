@@ -0,0 +1,141 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'home:recent_detections'
+REFRESH_LOCK_KEY = 'home:recent_detections:refreshing'
+
+# One background refresh at a time per process; the cache lock dedupes across processes.
+_refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recent-detections')
+
+
+def _cache():
+    return caches[getattr(settings, 'RESULT_CACHE_ALIAS', 'default')]
+
+
+def _count() -> int:
+    return getattr(settings, 'RECENT_DETECTIONS_COUNT', 6)
+
+
+def _item(crop_image) -> dict:
+    # Plain data in the shape the home page template reads from a CropImage.
+    return {
+        'pk': crop_image.pk,
+        'plant_type': crop_image.plant_type,
+        'disease_name': crop_image.disease_name,
+        'confidence': crop_image.confidence,
+        'variant_urls': {'card': crop_image.variant_urls['card']},
+        'uploaded_at': crop_image.uploaded_at.timestamp(),
+    }
+
+
+def build() -> List[dict]:
+    """
+    Query the newest processed crop images for the home page.
+    """
+    from .models import CropImage
+
+    crop_images = CropImage.objects.filter(is_processed=True).order_by('-uploaded_at', '-pk')[:_count()]
+    return [_item(crop_image) for crop_image in crop_images]
+
+
+def _store(items: List[dict], stale: bool = False, built_at: float = None) -> None:
+    entry = {'items': items, 'built_at': built_at or time.time(), 'stale': stale}
+    _cache().set(CACHE_KEY, entry, None)
+
+
+def refresh() -> List[dict]:
+    """
+    Rebuild the cached list from the database.
+    """
+    items = build()
+    _store(items)
+    return items
+
+
+def get_recent() -> List[dict]:
+    """
+    Recent detections for the home page, normally without a database query.
+
+    The list is kept current by ``update`` as analyses are saved. A list older
+    than ``RECENT_DETECTIONS_MAX_AGE`` or marked stale (e.g. after a deletion) is
+    still served, while one background refresh replaces it (stale-while-revalidate).
+    Only an empty cache is rebuilt in the request.
+    """
+    try:
+        entry = _cache().get(CACHE_KEY)
+    except Exception as e:
+        logger.error(f"Reading recent detections from cache failed: {str(e)}", exc_info=True)
+        return build()
+    if entry is None:
+        metrics.incr('recent_detections_cache_total', outcome='miss')
+        return refresh()
+    max_age = getattr(settings, 'RECENT_DETECTIONS_MAX_AGE', 300)
+    if entry['stale'] or time.time() - entry['built_at'] > max_age:
+        metrics.incr('recent_detections_cache_total', outcome='stale')
+        if _cache().add(REFRESH_LOCK_KEY, True, 30):
+            _refresher.submit(_refresh_in_background)
+    else:
+        metrics.incr('recent_detections_cache_total', outcome='fresh')
+    return entry['items']
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh()
+    except Exception as e:
+        logger.error(f"Refreshing recent detections failed: {str(e)}", exc_info=True)
+    finally:
+        _cache().delete(REFRESH_LOCK_KEY)
+        close_old_connections()
+
+
+def update(crop_images: Iterable) -> None:
+    """
+    Fold saved crop images into the cached list without querying.
+
+    Newly processed images are inserted in upload order and the oldest drop off;
+    a listed image that is no longer processed is removed and the list marked stale
+    so the next request refills it in the background.
+    """
+    try:
+        entry = _cache().get(CACHE_KEY)
+        if entry is None:
+            # Built on the next request.
+            return
+        items = {item['pk']: item for item in entry['items']}
+        changed = stale = False
+        for crop_image in crop_images:
+            if crop_image.is_processed and crop_image.uploaded_at is not None:
+                items[crop_image.pk] = _item(crop_image)
+                changed = True
+            elif items.pop(crop_image.pk, None) is not None:
+                changed = stale = True
+        if changed:
+            newest = sorted(items.values(), key=lambda item: (item['uploaded_at'], item['pk']), reverse=True)
+            # Keep the build time: a full rebuild still runs every RECENT_DETECTIONS_MAX_AGE to
+            # pick up changes made by other processes or by queryset updates.
+            _store(newest[:_count()], stale=stale or entry['stale'], built_at=entry['built_at'])
+    except Exception as e:
+        logger.error(f"Updating recent detections failed: {str(e)}", exc_info=True)
+
+
+def discard(pk: int) -> None:
+    """
+    Drop a deleted crop image from the cached list.
+    """
+    try:
+        entry = _cache().get(CACHE_KEY)
+        if entry is not None and any(item['pk'] == pk for item in entry['items']):
+            _store([item for item in entry['items'] if item['pk'] != pk], stale=True, built_at=entry['built_at'])
+    except Exception as e:
+        logger.error(f"Updating recent detections failed: {str(e)}", exc_info=True)
@@ -0,0 +1,131 @@
+import logging
+from typing import Callable, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ('not_modified', 'hit', 'miss')
+
+
+def _cache():
+    return caches[getattr(settings, 'RESULT_CACHE_ALIAS', 'default')]
+
+
+def _version_key(pk: int) -> str:
+    return f"result:{pk}:version"
+
+
+def _body_key(pk: int, version: int, view: str, language: str) -> str:
+    # Versioned, so a new version never sees an old body; superseded bodies simply expire.
+    return f"result:{pk}:v{version}:{view}:{language}"
+
+
+def _etag(pk: int, version: int, view: str, language: str) -> str:
+    return f'"{view}-{pk}-{version}-{language}"' if language else f'"{view}-{pk}-{version}"'
+
+
+def validators(crop_image) -> Tuple[int, int]:
+    """
+    (version, last-modified timestamp) identifying the current state of a crop image row.
+    """
+    return crop_image.version, int(crop_image.updated_at.timestamp())
+
+
+def invalidate(pks: Iterable[int]) -> None:
+    """
+    Forget the cached validators of these crop images, so their next request reads the row.
+
+    Call after the rows change without ``CropImage.save`` (``bulk_update``, ``update``).
+    """
+    keys = [_version_key(pk) for pk in pks if pk is not None]
+    if not keys:
+        return
+    try:
+        _cache().delete_many(keys)
+    except Exception as e:
+        logger.error(f"Invalidating cached results failed: {str(e)}", exc_info=True)
+
+
+def respond(request, pk: int, view: str, build: Callable, vary_language: bool = False,
+            use_cache: bool = True) -> HttpResponse:
+    """
+    Serve a result page or payload with conditional GET and a per-object cache.
+
+    While validators for ``pk`` are cached, a matching ``If-None-Match`` or
+    ``If-Modified-Since`` is answered with 304 and a cached body is served
+    without touching the database. Otherwise ``build`` reads the row and renders
+    the response. Only final diagnoses (``CropImage.is_reusable``) are cached;
+    pending, degraded and failed results are still expected to change and are
+    always rendered fresh.
+
+    Args:
+        request (HttpRequest): The GET request.
+        pk (int): CropImage primary key.
+        view (str): Name of the representation, e.g. 'json' or 'html'.
+        build (callable): ``build(request, pk)`` -> (CropImage, HttpResponse).
+        vary_language (bool): Whether the body depends on the active language.
+        use_cache (bool): False to skip the cache for this request (e.g. per-visitor content).
+
+    Returns:
+        HttpResponse: A 304, a cached copy or a freshly built response.
+    """
+    language = translation.get_language() if vary_language else ''
+    cache = _cache()
+    if use_cache:
+        cached = cache.get(_version_key(pk))
+        if cached is not None:
+            version, last_modified = cached
+            etag = _etag(pk, version, view, language)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                metrics.incr('result_response_cache_total', view=view, outcome='not_modified')
+                return _with_validators(response, etag, last_modified)
+            body = cache.get(_body_key(pk, version, view, language))
+            if body is not None:
+                metrics.incr('result_response_cache_total', view=view, outcome='hit')
+                content, content_type = body
+                return _with_validators(HttpResponse(content, content_type=content_type), etag, last_modified)
+
+    metrics.incr('result_response_cache_total', view=view, outcome='miss')
+    crop_image, response = build(request, pk)
+    if response.status_code != 200 or not crop_image.is_reusable:
+        return response
+
+    version, last_modified = validators(crop_image)
+    etag = _etag(pk, version, view, language)
+    if use_cache:
+        timeout = getattr(settings, 'RESULT_CACHE_TIMEOUT', 24 * 60 * 60)
+        try:
+            cache.set(_version_key(pk), (version, last_modified), timeout)
+            cache.set(_body_key(pk, version, view, language), (response.content, response['Content-Type']), timeout)
+        except Exception as e:
+            logger.error(f"Caching result {pk} failed: {str(e)}", exc_info=True)
+    # The client may already hold this version, e.g. from another process.
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return _with_validators(not_modified or response, etag, last_modified)
+
+
+def _with_validators(response: HttpResponse, etag: str, last_modified: int) -> HttpResponse:
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    # Always revalidate: cheap with the validators cached, and never stale after a change.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def hit_ratio(view: str) -> Optional[float]:
+    """
+    Share of this process's requests for ``view`` answered from cache (304 or cached body).
+    """
+    counts = {outcome: metrics.get_counter('result_response_cache_total', view=view, outcome=outcome)
+              for outcome in OUTCOMES}
+    total = sum(counts.values())
+    return (counts['not_modified'] + counts['hit']) / total if total else None
@@ -0,0 +1,187 @@
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LRUTTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries also expire after a TTL.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl)), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_memory_cache = LRUTTLCache(
+    max_entries=getattr(settings, 'ANALYSIS_CACHE_MAX_ENTRIES', 1024),
+    ttl=getattr(settings, 'ANALYSIS_CACHE_TTL', 24 * 60 * 60),
+)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'ANALYSIS_CACHE_ENABLED', True)
+
+
+def db_ttl() -> Optional[int]:
+    """
+    Lifetime of database entries in seconds (``ANALYSIS_CACHE_DB_TTL``), or None to keep them forever.
+    """
+    ttl = getattr(settings, 'ANALYSIS_CACHE_DB_TTL', 30 * 24 * 60 * 60)
+    return ttl if ttl and ttl > 0 else None
+
+
+def make_key(img: Image.Image, language: str, prompt_version: str) -> str:
+    """
+    Hash the normalized (RGB) pixel data together with the analysis parameters.
+
+    Hashing decoded pixels rather than file bytes keeps the key stable when the
+    same photo arrives with different metadata or container headers.
+
+    Args:
+        img (Image.Image): Image to analyze.
+        language (str): Analysis language.
+        prompt_version (str): Version of the prompt template used for the model call.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the analysis.
+    """
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    digest = hashlib.sha256()
+    digest.update(f"{prompt_version}|{language}|{img.width}x{img.height}|".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def get(key: str) -> Optional[Dict]:
+    """
+    Look up a cached result, first in process memory, then in the database.
+
+    Returns:
+        dict: A copy of the cached result flagged with ``cached=True``, or None on a miss.
+    """
+    from .models import AnalysisCacheEntry
+
+    result = _memory_cache.get(key)
+    if result is not None:
+        metrics.incr('analysis_cache_hits_total', tier='memory')
+        return _flag_cached(result)
+
+    try:
+        now = timezone.now()
+        entries = AnalysisCacheEntry.objects.filter(key=key)
+        ttl = db_ttl()
+        if ttl is not None:
+            # Expired rows are misses until prune_expired deletes them or a new result replaces them.
+            entries = entries.filter(created_at__gt=now - timedelta(seconds=ttl))
+        entry = entries.first()
+        if entry is not None:
+            AnalysisCacheEntry.objects.filter(pk=entry.pk).update(
+                hit_count=F('hit_count') + 1, last_hit_at=now
+            )
+            remaining = None if ttl is None else ttl - (now - entry.created_at).total_seconds()
+            _memory_cache.set(key, entry.result, ttl=remaining)
+            metrics.incr('analysis_cache_hits_total', tier='db')
+            return _flag_cached(entry.result)
+    except Exception as e:
+        logger.error(f"Analysis cache lookup failed: {str(e)}", exc_info=True)
+
+    metrics.incr('analysis_cache_misses_total')
+    return None
+
+
+def set(key: str, result: Dict, language: str, prompt_version: str) -> None:
+    """
+    Store a successful analysis result in both cache tiers.
+    """
+    from .models import AnalysisCacheEntry
+
+    result = {k: v for k, v in result.items() if k != 'cached'}
+    _memory_cache.set(key, result)
+    try:
+        AnalysisCacheEntry.objects.update_or_create(
+            key=key,
+            # A replaced (expired) entry starts a fresh lifetime.
+            defaults={'result': result, 'language': language, 'prompt_version': prompt_version,
+                      'created_at': timezone.now()},
+        )
+    except IntegrityError:
+        # Another worker stored the same key concurrently; its result is equivalent.
+        pass
+    except Exception as e:
+        logger.error(f"Analysis cache store failed: {str(e)}", exc_info=True)
+    metrics.incr('analysis_cache_stores_total')
+
+
+def prune_expired() -> int:
+    """
+    Delete database entries older than ``ANALYSIS_CACHE_DB_TTL``.
+
+    Returns:
+        int: Number of entries deleted.
+    """
+    from .models import AnalysisCacheEntry
+
+    ttl = db_ttl()
+    if ttl is None:
+        return 0
+    deleted, _ = AnalysisCacheEntry.objects.filter(
+        created_at__lte=timezone.now() - timedelta(seconds=ttl)
+    ).delete()
+    if deleted:
+        metrics.incr('analysis_cache_pruned_total', deleted)
+    return deleted
+
+
+def clear_memory() -> None:
+    _memory_cache.clear()
+
+
+def _flag_cached(result: Dict) -> Dict:
+    result = copy.deepcopy(result)
+    result['cached'] = True
+    return result
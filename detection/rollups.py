@@ -0,0 +1,160 @@
+import datetime
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+GROUP_FIELDS = ('day', 'plant_type', 'disease_name', 'language')
+
+Key = Tuple[datetime.date, str, str, str]
+
+
+def entry(crop_image) -> Optional[Tuple[Key, float]]:
+    """
+    What a crop image contributes to the daily rollups.
+
+    Only diagnoses that are shown and reused as final count: processed, without an
+    error and not degraded (degraded ones are reanalyzed later).
+
+    Returns:
+        tuple: ((day, plant_type, disease_name, language), confidence), or None.
+    """
+    if not crop_image.is_reusable or crop_image.uploaded_at is None:
+        return None
+    key = (timezone.localdate(crop_image.uploaded_at), crop_image.plant_type, crop_image.disease_name,
+           crop_image.language)
+    return key, crop_image.confidence or 0.0
+
+
+def record(crop_images: Iterable) -> None:
+    """
+    Fold newly applied analysis results into the rollups.
+
+    ``CropImage.apply_analysis_result`` remembers what the row contributed before the
+    new result, so a reanalysis moves the row between rollups instead of counting it twice.
+    Call this once the rows are saved. Failures are logged, never raised: the rollups can
+    always be rebuilt from ``CropImage`` with ``rebuild_disease_stats``.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for crop_image in crop_images:
+        previous = crop_image.__dict__.pop('_rollup_previous', None)
+        current = entry(crop_image)
+        if previous == current:
+            continue
+        for contribution, sign in ((previous, -1), (current, 1)):
+            if contribution is not None:
+                key, confidence = contribution
+                deltas[key][0] += sign
+                deltas[key][1] += sign * confidence
+    _apply(deltas)
+
+
+def discard(crop_image) -> None:
+    """
+    Remove a deleted crop image's contribution from the rollups.
+    """
+    contribution = entry(crop_image)
+    if contribution is not None:
+        key, confidence = contribution
+        _apply({key: [-1, -confidence]})
+
+
+def _apply(deltas: Dict[Key, List]) -> None:
+    from .models import DailyDiseaseStat
+
+    try:
+        with transaction.atomic():
+            for key, (count, confidence_sum) in deltas.items():
+                if not count and not confidence_sum:
+                    continue
+                lookup = dict(zip(GROUP_FIELDS, key))
+                increment = {'count': F('count') + count, 'confidence_sum': F('confidence_sum') + confidence_sum}
+                if DailyDiseaseStat.objects.filter(**lookup).update(**increment):
+                    continue
+                try:
+                    with transaction.atomic():
+                        DailyDiseaseStat.objects.create(count=count, confidence_sum=confidence_sum, **lookup)
+                except IntegrityError:
+                    # Another process created the row first.
+                    DailyDiseaseStat.objects.filter(**lookup).update(**increment)
+    except Exception as e:
+        logger.error(f"Updating disease rollups failed: {str(e)}", exc_info=True)
+
+
+def rebuild(since: Optional[datetime.date] = None, batch_size: int = 1000) -> int:
+    """
+    Recompute the rollups from ``CropImage`` with one grouped scan.
+
+    Rows written by analyses that finish while the rebuild runs may be missed; run it
+    again (or with ``since``) afterwards if that matters.
+
+    Args:
+        since (date, optional): Only rebuild this day and later.
+        batch_size (int): Rollup rows per INSERT.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    from .models import CropImage, DailyDiseaseStat
+
+    images = CropImage.objects.filter(is_processed=True, processing_error='', degraded=False)
+    stats = DailyDiseaseStat.objects.all()
+    if since is not None:
+        images = images.filter(uploaded_at__gte=timezone.make_aware(datetime.datetime.combine(since, datetime.time.min)))
+        stats = stats.filter(day__gte=since)
+    rows = (
+        images.annotate(day=TruncDate('uploaded_at'))
+        .values(*GROUP_FIELDS)
+        .annotate(count=Count('id'), confidence_sum=Sum(Coalesce('confidence', Value(0.0), output_field=FloatField())))
+        .order_by()
+    )
+    written = 0
+    with transaction.atomic():
+        stats.delete()
+        batch = []
+        for row in rows.iterator():
+            batch.append(DailyDiseaseStat(**row))
+            if len(batch) >= batch_size:
+                written += len(DailyDiseaseStat.objects.bulk_create(batch))
+                batch = []
+        written += len(DailyDiseaseStat.objects.bulk_create(batch))
+    return written
+
+
+def summarize(since: datetime.date, until: datetime.date, group_by: Iterable[str], **filters) -> List[dict]:
+    """
+    Aggregate the rollups between two days (inclusive), reading no ``CropImage`` rows.
+
+    Args:
+        since (date): First day.
+        until (date): Last day.
+        group_by (list): Subset of ``GROUP_FIELDS`` to break the counts down by.
+        **filters: Exact matches on ``plant_type``, ``disease_name`` or ``language``.
+
+    Returns:
+        list: One dict per group with its fields, ``count`` and ``average_confidence``, most frequent first.
+    """
+    from .models import DailyDiseaseStat
+
+    group_by = list(group_by)
+    rows = (
+        DailyDiseaseStat.objects.filter(day__gte=since, day__lte=until, count__gt=0, **filters)
+        .values(*group_by)
+        .annotate(total=Sum('count'), total_confidence=Sum('confidence_sum'))
+        .order_by('-total', *group_by)
+    )
+    results = []
+    for row in rows:
+        total, total_confidence = row.pop('total'), row.pop('total_confidence')
+        if 'day' in row:
+            row['day'] = row['day'].isoformat()
+        row['count'] = total
+        row['average_confidence'] = round(total_confidence / total, 2) if total else None
+        results.append(row)
+    return results
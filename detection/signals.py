@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import recent
+from .models import CropImage
+
+# Sent with ``crop_images`` after rows are written with bulk_create or bulk_update,
+# which do not send post_save.
+crop_images_saved = Signal()
+
+
+@receiver(post_save, sender=CropImage)
+def crop_image_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recent.update([instance]))
+
+
+@receiver(crop_images_saved)
+def crop_images_saved_in_bulk(sender, crop_images, **kwargs):
+    crop_images = list(crop_images)
+    transaction.on_commit(lambda: recent.update(crop_images))
+
+
+@receiver(post_delete, sender=CropImage)
+def crop_image_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: recent.discard(pk))
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.deconstruct import deconstructible
+
+from . import metrics
+
+BLOB_NAME_RE = re.compile(r'^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Filesystem storage that names each file after the SHA-256 of its content.
+
+    Files land in ``<prefix>/ab/cd/abcd...<64 hex>.<ext>``: two levels of 256
+    shards keep directories small, and identical uploads map to the same name,
+    so each blob is written once and shared by every row that references it.
+    The name passed to ``save`` only contributes its extension.
+
+    Blobs are never rewritten. Unreferenced ones are deleted by
+    ``manage.py sweep_blobs``, never inline (see ``CropImage.delete``).
+
+    Args:
+        prefix (str): Directory under ``location`` holding the shards.
+    """
+
+    def __init__(self, prefix='uploads', **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix.strip('/')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save; an existing file is identical.
+        return name
+
+    def blob_name(self, digest, extension=''):
+        return posixpath.join(self.prefix, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def is_blob_name(self, name):
+        return bool(name) and name.startswith(f"{self.prefix}/") and bool(BLOB_NAME_RE.match(name))
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '.jpeg':
+            extension = '.jpg'
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+
+        # Hash while spooling to a temporary file in the same filesystem, then rename into place.
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = self.blob_name(digest.hexdigest(), extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                try:
+                    # Reused blobs look new to sweep_blobs until the row referencing them is saved.
+                    os.utime(full_path)
+                    metrics.incr('storage_dedup_hits_total')
+                    return name
+                except FileNotFoundError:
+                    pass  # Collected in the meantime; write it again.
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # Atomic; a concurrent writer of the same blob wrote identical bytes.
+            os.replace(temp_path, full_path)
+            metrics.incr('storage_blobs_written_total')
+            return name
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def image_storage():
+    """
+    Storage for ``CropImage.image`` (the ``images`` entry of ``STORAGES``).
+    """
+    return storages['images']
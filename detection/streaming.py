@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.urls import reverse
+
+from . import metrics
+from .ai_service import RESULT_FIELDS
+from .models import AnalysisJob, CropImage
+
+logger = logging.getLogger(__name__)
+
+# Sent when nothing happened for this long, so proxies keep the connection open.
+KEEPALIVE_SECONDS = 15
+
+# One relay task per crop image being watched, shared by all of its streams.
+_relays: Dict[int, '_Relay'] = {}
+_relays_lock = threading.Lock()
+
+
+class FieldParser:
+    """
+    Incremental parser for the JSON object in a streamed model response.
+
+    Text is fed in chunks as it arrives; every top-level field of the first JSON
+    object is returned as soon as its value is complete, before the rest of the
+    object has been received. Text around the object (e.g. Markdown fences) is ignored.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ''
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = 'key'
+        self._start: Optional[int] = None
+        self._key: Optional[str] = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Consume the next chunk of response text.
+
+        Returns:
+            list: (name, value) pairs of the fields completed by this chunk.
+        """
+        fields = []
+        self._buffer += text
+        buffer = self._buffer
+        while self._position < len(buffer) and not self.done:
+            index, char = self._position, buffer[self._position]
+            self._position += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_token(index + 1, fields)
+            elif self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._start = index
+            elif char in '{[':
+                if self._depth == 1:
+                    self._start = index
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 1:
+                    self._end_scalar(index, fields)
+                    self.done = True
+                self._depth -= 1
+                if self._depth == 1:
+                    self._end_token(index + 1, fields)
+            elif self._depth == 1:
+                if char == ':':
+                    self._expect = 'value'
+                elif char == ',':
+                    self._end_scalar(index, fields)
+                    self._expect = 'key'
+                elif self._expect == 'value' and self._start is None and not char.isspace():
+                    self._start = index
+        return fields
+
+    def _end_scalar(self, end: int, fields: list) -> None:
+        # Numbers, booleans and null end at the next ',' or '}'.
+        if self._expect == 'value' and self._start is not None:
+            self._end_token(end, fields)
+
+    def _end_token(self, end: int, fields: list) -> None:
+        token, self._start = self._buffer[self._start:end], None
+        try:
+            value = json.loads(token)
+        except ValueError:
+            # Not valid JSON on its own; the parse of the complete response decides.
+            self._key = None
+            return
+        if self._expect == 'key':
+            self._key = value
+        elif self._key is not None:
+            fields.append((self._key, value))
+            self._key = None
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Encode one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _Relay:
+    """
+    Events of one crop image, fanned out to every stream listening to it.
+
+    Listeners are ``asyncio.Queue`` objects, each fed on the event loop of its stream.
+    """
+
+    def __init__(self, pk: int) -> None:
+        self.pk = pk
+        self.sent: List[Tuple[str, Any]] = []  # replayed to streams that join late
+        self.listeners: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def emit(self, item: Optional[Tuple[str, Any]]) -> None:
+        with _relays_lock:
+            if item is None:
+                # Finished: streams opened from now on start a new relay.
+                if _relays.get(self.pk) is self:
+                    del _relays[self.pk]
+            else:
+                self.sent.append(item)
+            for loop, listener in self.listeners:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(listener.put_nowait, item)
+
+
+def open_stream(crop_image: CropImage) -> asyncio.Queue:
+    """
+    Subscribe to the analysis events of a crop image; call from a running event loop.
+
+    Streams of the same image (several tabs, or an ``EventSource`` reconnecting) share
+    one relay task, which reads the stored result or the job's progress with the async
+    ORM; the analysis itself is left to ``run_analysis_worker``. Idle streams only wait
+    on their queue and hold no thread.
+
+    Returns:
+        Queue: (event, data) tuples, ending with None. Pass it to ``close_stream`` when done.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    with _relays_lock:
+        relay = _relays.get(crop_image.pk)
+        # A relay whose task died with its event loop (e.g. a stopped server thread) is replaced.
+        start = relay is None or relay.task.done()
+        if start:
+            relay = _relays[crop_image.pk] = _Relay(crop_image.pk)
+        for item in relay.sent:
+            events.put_nowait(item)
+        relay.listeners.append((loop, events))
+        if start:
+            # Only after subscribing: the relay stops as soon as nobody listens.
+            relay.task = loop.create_task(_produce(crop_image, relay))
+    return events
+
+
+def close_stream(crop_image: CropImage, events: asyncio.Queue) -> None:
+    """
+    Unsubscribe a stream; the relay stops once no stream is listening.
+    """
+    with _relays_lock:
+        relay = _relays.get(crop_image.pk)
+        if relay is not None:
+            relay.listeners = [listener for listener in relay.listeners if listener[1] is not events]
+
+
+async def aiter_events(crop_image: CropImage) -> AsyncIterator[str]:
+    """
+    Serve the analysis events of a crop image as an SSE body under ASGI.
+    """
+    events = open_stream(crop_image)
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(events.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if item is None:
+                return
+            yield format_event(*item)
+    finally:
+        close_stream(crop_image, events)
+
+
+async def _produce(crop_image: CropImage, relay: _Relay) -> None:
+    started = time.perf_counter()
+    sent = {}
+
+    def on_field(name, value):
+        # Progress is re-read on every poll; only new or changed fields are sent.
+        if name in sent and sent[name] == value:
+            return
+        if not sent:
+            metrics.observe('result_stream_first_field_seconds', time.perf_counter() - started)
+        sent[name] = value
+        relay.emit(('field', {'name': name, 'value': value}))
+
+    try:
+        with metrics.bind(language=crop_image.language):
+            if crop_image.is_processed and not crop_image.degraded:
+                metrics.incr('result_stream_total', outcome='stored')
+                _emit_result(crop_image, on_field, relay.emit)
+            else:
+                metrics.incr('result_stream_total', outcome='relayed')
+                await _relay_job(crop_image, on_field, relay)
+    except Exception as e:
+        logger.error(f"Streaming result {crop_image.pk} failed: {str(e)}", exc_info=True)
+        relay.emit(('error', {'error': 'Server error occurred'}))
+    finally:
+        relay.emit(None)
+
+
+async def _relay_job(crop_image: CropImage, on_field: Callable, relay: _Relay) -> None:
+    # The worker saves streamed fields on the job; pass them on until the job has finished.
+    interval = getattr(settings, 'RESULT_STREAM_POLL_INTERVAL', 1.0)
+    deadline = time.monotonic() + getattr(settings, 'RESULT_STREAM_TIMEOUT', 120)
+    while True:
+        job = await crop_image.jobs.only('status', 'progress').order_by('-created_at').afirst()
+        if job is None or job.is_finished:
+            await crop_image.arefresh_from_db()
+            _emit_result(crop_image, on_field, relay.emit)
+            return
+        for name in RESULT_FIELDS:
+            if name in job.progress:
+                on_field(name, job.progress[name])
+        if time.monotonic() >= deadline or not relay.listeners:
+            break
+        await asyncio.sleep(interval)
+    relay.emit(('done', _done(crop_image, job.status)))
+
+
+def _emit_result(crop_image: CropImage, on_field: Callable, emit: Callable) -> None:
+    if not crop_image.is_processed:
+        status = AnalysisJob.STATUS_PENDING
+    elif crop_image.processing_error:
+        status = AnalysisJob.STATUS_FAILED
+    else:
+        status = AnalysisJob.STATUS_DONE
+        for name in RESULT_FIELDS:
+            on_field(name, getattr(crop_image, name))
+    emit(('done', _done(crop_image, status)))
+
+
+def _done(crop_image: CropImage, status: str) -> dict:
+    return {
+        'id': crop_image.pk,
+        'status': status,
+        'result_url': reverse('crop_detection:api_result', args=[crop_image.pk]),
+    }
@@ -1,3 +1,1473 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+
+try:
+    import numpy as np
+except ImportError:  # triage tests are skipped
+    np = None
+
+from . import exports, metrics, payload, recent, result_cache, rollups, streaming, triage
+from .admission import AdmissionController, AdmissionRejected, reset_controller
+from .ai_service import RESULT_FIELDS, get_analyzer, install_model, reset_analyzers
+from .batching import MicroBatcher
+from .benchmarking import SimulatedModel, make_upload
+from .circuit import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError, get_breaker, reset_breakers,
+)
+from .ingest import EXIF_ORIENTATION, ingest_image
+from .jobs import analyze_crop, claim_jobs, enqueue_analysis, requeue_stale_jobs, run_job
+from .management.commands.analyze_dir import Command as AnalyzeDirCommand, default_checkpoint_path
+from .management.commands.sweep_blobs import Command as SweepBlobsCommand
+from .models import AnalysisCacheEntry, AnalysisJob, CropImage, DailyDiseaseStat, DetectionHistory
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .phash import HammingIndex, NearDuplicateIndex, find_near_duplicate, near_duplicates, to_hex
+from .signals import crop_images_saved
+from .storage import image_storage
+from .streaming import FieldParser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+ADMISSION_STATE_PATH = os.path.join(tempfile.mkdtemp(), 'admission.sqlite3')
+
+
+def noise(size, seed=0):
+    """
+    Random-looking RGB image that JPEG cannot compress much.
+    """
+    img = Image.frombytes('RGB', (64, 64), bytes((i * 7919 + seed * 104729) % 251 for i in range(64 * 64 * 3)))
+    return img.resize(size, Image.Resampling.NEAREST)
+
+
+class DetectionTestMixin:
+    """
+    Runs against the mock analyzer with empty caches and a throwaway media directory.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        result_cache.clear_memory()
+        payload.clear_cache()
+        reset_analyzers()
+        reset_controller()
+
+    def create_crop_image(self, seed=0, **fields):
+        defaults = {
+            'image': make_upload(seed),
+            'session_key': self.client.session.session_key or '',
+            'language': 'en',
+            'plant_type': 'Rice',
+            'disease_name': 'Leaf Blast',
+            'confidence': 90.0,
+            'explanation': 'Seeded row.',
+            'treatment': 'Seeded row.',
+            'is_processed': True,
+        }
+        defaults.update(fields)
+        return CropImage.objects.create(**defaults)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, ANALYZER_BACKEND='mock', ADMISSION_STATE_PATH=ADMISSION_STATE_PATH)
+class DetectionTestCase(DetectionTestMixin, TestCase):
+    pass
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, ANALYZER_BACKEND='mock', ADMISSION_STATE_PATH=ADMISSION_STATE_PATH)
+class DetectionTransactionTestCase(DetectionTestMixin, TransactionTestCase):
+    """
+    For code that queries the database from worker threads, which only see committed rows.
+    """
+
+
+class QueryCountTests(DetectionTestCase):
+    """
+    Query budgets of the hot paths (see ``benchmark_endpoints`` DEFAULT_BUDGETS).
+    """
+
+    def setUp(self):
+        super().setUp()
+        session = self.client.session
+        session.save()
+        self.crop_images = [self.create_crop_image(seed, session_key=session.session_key) for seed in range(25)]
+        DetectionHistory.objects.bulk_create([
+            DetectionHistory(crop_image=crop_image, session_id=session.session_key, ip_address='127.0.0.1')
+            for crop_image in self.crop_images
+        ])
+
+    def test_home(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('crop_detection:home'))
+        self.assertEqual(response.status_code, 200)
+        # The recent detections list is cached until a processed image is saved.
+        with self.assertNumQueries(0):
+            self.client.get(reverse('crop_detection:home'))
+
+    def test_result(self):
+        url = reverse('crop_detection:result', args=[self.crop_images[0].pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Leaf Blast')
+        # Later views are answered from the response cache.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_history(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('crop_detection:history'))
+        self.assertEqual(response.status_code, 200)
+        cursor = encode_cursor(self.crop_images[10])
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{reverse('crop_detection:history')}?after={cursor}")
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_result(self):
+        url = reverse('crop_detection:api_result', args=[self.crop_images[0].pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['disease_name'], 'Leaf Blast')
+        self.assertEqual(
+            response.json(),
+            self.client.get(reverse('crop_detection:async_api_result', args=[self.crop_images[0].pk])).json(),
+        )
+
+    def test_api_upload(self):
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('crop_detection:api_upload'), {'image': make_upload(100), 'language': 'en'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(AnalysisJob.objects.get(pk=response.json()['job_id']).status, AnalysisJob.STATUS_PENDING)
+
+    def test_upload(self):
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('crop_detection:upload'), {'image': make_upload(101), 'language': 'en'})
+        self.assertEqual(response.status_code, 302)
+
+
+class JobQueueTests(DetectionTestCase):
+    def test_claim_marks_jobs_running_once(self):
+        jobs = [enqueue_analysis(self.create_crop_image(seed, is_processed=False)) for seed in range(3)]
+
+        claimed = claim_jobs(2, 'worker-a')
+        self.assertEqual([job.pk for job in claimed], [jobs[0].pk, jobs[1].pk])
+        self.assertTrue(all(job.status == AnalysisJob.STATUS_RUNNING and job.worker == 'worker-a' for job in claimed))
+
+        self.assertEqual([job.pk for job in claim_jobs(5, 'worker-b')], [jobs[2].pk])
+        self.assertEqual(claim_jobs(5, 'worker-b'), [])
+        self.assertEqual(claim_jobs(0), [])
+
+    def test_run_job_stores_result(self):
+        crop_image = self.create_crop_image(is_processed=False, plant_type='', disease_name='')
+        enqueue_analysis(crop_image)
+        job = run_job(claim_jobs(1)[0])
+
+        self.assertEqual(job.status, AnalysisJob.STATUS_DONE)
+        crop_image.refresh_from_db()
+        self.assertTrue(crop_image.is_processed)
+        self.assertNotEqual(crop_image.disease_name, '')
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue_analysis(self.create_crop_image(is_processed=False))
+        claim_jobs(1, 'crashed')
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+        AnalysisJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_jobs(1, 'worker-b')[0].pk, job.pk)
+
+
+class ResultCacheTests(DetectionTestCase):
+    key = 'a' * 64
+
+    def test_tiers(self):
+        self.assertIsNone(result_cache.get(self.key))
+        result_cache.set(self.key, {'plant_type': 'Rice', 'cached': True}, 'en', '1')
+        self.assertEqual(AnalysisCacheEntry.objects.get().result, {'plant_type': 'Rice'})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(result_cache.get(self.key), {'plant_type': 'Rice', 'cached': True})
+
+        result_cache.clear_memory()
+        self.assertEqual(result_cache.get(self.key), {'plant_type': 'Rice', 'cached': True})
+        self.assertEqual(AnalysisCacheEntry.objects.get().hit_count, 1)
+        # The database hit refilled the memory tier.
+        with self.assertNumQueries(0):
+            result_cache.get(self.key)
+
+    def test_results_are_copies(self):
+        result_cache.set(self.key, {'plant_type': 'Rice'}, 'en', '1')
+        result_cache.get(self.key)['plant_type'] = 'Wheat'
+        self.assertEqual(result_cache.get(self.key)['plant_type'], 'Rice')
+
+    def test_database_entries_expire(self):
+        result_cache.set(self.key, {'plant_type': 'Rice'}, 'en', '1')
+        AnalysisCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=31))
+        result_cache.clear_memory()
+        self.assertIsNone(result_cache.get(self.key))
+
+        with override_settings(ANALYSIS_CACHE_DB_TTL=0):
+            self.assertEqual(result_cache.prune_expired(), 0)
+        self.assertEqual(result_cache.prune_expired(), 1)
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+
+    def test_replaced_entry_starts_a_new_lifetime(self):
+        result_cache.set(self.key, {'plant_type': 'Rice'}, 'en', '1')
+        AnalysisCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=31))
+        result_cache.set(self.key, {'plant_type': 'Wheat'}, 'en', '1')
+        result_cache.clear_memory()
+        self.assertEqual(result_cache.get(self.key)['plant_type'], 'Wheat')
+
+
+class KeysetPaginationTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for seed in range(7):
+            self.create_crop_image(seed)
+        # Two rows share a timestamp so the id tie-break is exercised.
+        for i, crop_image in enumerate(CropImage.objects.order_by('id')):
+            CropImage.objects.filter(pk=crop_image.pk).update(uploaded_at=now - timedelta(minutes=min(i, 5)))
+        self.ordered = list(CropImage.objects.order_by('-uploaded_at', '-id'))
+
+    def test_walks_forward_and_back(self):
+        queryset = CropImage.objects.all()
+        first = keyset_page(queryset, 3)
+        self.assertEqual(list(first), self.ordered[:3])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+        second = keyset_page(queryset, 3, after=first.next_cursor)
+        self.assertEqual(list(second), self.ordered[3:6])
+        last = keyset_page(queryset, 3, after=second.next_cursor)
+        self.assertEqual(list(last), self.ordered[6:])
+        self.assertFalse(last.has_next)
+
+        self.assertEqual(list(keyset_page(queryset, 3, before=last.previous_cursor)), self.ordered[3:6])
+        back = keyset_page(queryset, 3, before=second.previous_cursor)
+        self.assertEqual(list(back), self.ordered[:3])
+        self.assertFalse(back.has_previous)
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('not a cursor'))
+        self.assertEqual(list(keyset_page(CropImage.objects.all(), 3, after='not a cursor')), self.ordered[:3])
+
+    def test_cursor_round_trip(self):
+        crop_image = self.ordered[2]
+        self.assertEqual(decode_cursor(encode_cursor(crop_image)), (crop_image.uploaded_at, crop_image.pk))
+
+    def test_history_lists_only_this_session(self):
+        other = self.create_crop_image(20, session_key='someone-else')
+        response = self.client.get(reverse('crop_detection:history'))
+        self.assertEqual(response.context['total_detections'], len(self.ordered))
+        self.assertNotIn(other, list(response.context['page_obj']))
+
+        self.client.cookies.clear()
+        response = self.client.get(reverse('crop_detection:history'))
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+class PayloadTests(TestCase):
+    def setUp(self):
+        payload.clear_cache()
+
+    def test_small_images_keep_their_size_and_best_quality(self):
+        policy = payload.PayloadPolicy(max_bytes=10 ** 7, sizes=(1024, 512), qualities=(85, 65))
+        encoded = payload.encode(noise((300, 200)), policy)
+        self.assertEqual((encoded.size, encoded.quality, encoded.mime_type), ((300, 200), 85, 'image/jpeg'))
+        self.assertEqual(Image.open(io.BytesIO(encoded.data)).size, (300, 200))
+
+    def test_budget_shrinks_the_image(self):
+        img = noise((1600, 1200))
+        policy = payload.PayloadPolicy(max_bytes=40 * 1024, sizes=(1024, 512, 256), qualities=(85, 65))
+        encoded = payload.encode(img, policy)
+        self.assertLessEqual(len(encoded), policy.max_bytes)
+        self.assertLess(max(encoded.size), 1024)
+        self.assertEqual(encoded.size[0] * 3, encoded.size[1] * 4)
+
+    def test_smallest_encoding_when_nothing_fits(self):
+        policy = payload.PayloadPolicy(max_bytes=10, sizes=(256, 128), qualities=(85, 65))
+        encoded = payload.encode(noise((512, 512)), policy)
+        self.assertEqual((encoded.size, encoded.quality), ((128, 128), 65))
+
+    def test_grayscale(self):
+        policy = payload.PayloadPolicy(max_bytes=10 ** 7, colour='grayscale')
+        encoded = payload.encode(noise((200, 200)), policy)
+        self.assertEqual(Image.open(io.BytesIO(encoded.data)).mode, 'L')
+
+    def test_webp(self):
+        policy = payload.PayloadPolicy(max_bytes=10 ** 7, image_format='webp')
+        encoded = payload.encode(noise((200, 200)), policy)
+        self.assertEqual(encoded.mime_type, 'image/webp')
+        self.assertEqual(Image.open(io.BytesIO(encoded.data)).format, 'WEBP')
+
+    def test_get_payload_reuses_encodings(self):
+        img = noise((200, 200))
+        policy = payload.PayloadPolicy()
+        self.assertIs(payload.get_payload(img, policy), payload.get_payload(img, policy))
+        self.assertIsNot(
+            payload.get_payload(img, policy),
+            payload.get_payload(img, payload.PayloadPolicy(colour='grayscale')),
+        )
+
+    def test_rejects_unknown_settings(self):
+        with self.assertRaises(ValueError):
+            payload.PayloadPolicy(image_format='gif')
+        with self.assertRaises(ValueError):
+            payload.PayloadPolicy(qualities=())
+
+
+class FieldParserTests(TestCase):
+    def test_fields_complete_as_chunks_arrive(self):
+        parser = FieldParser()
+        self.assertEqual(parser.feed('```json\n{"plant_type": "To'), [])
+        self.assertEqual(parser.feed('mato", "confidence": 8'), [('plant_type', 'Tomato')])
+        self.assertEqual(parser.feed('5.5, "explanation": "Spots \\"ringed\\", '), [('confidence', 85.5)])
+        self.assertEqual(
+            parser.feed('dark}"\n, "extra": {"a": [1, 2]}, "healthy": false}\n```'),
+            [('explanation', 'Spots "ringed", dark}'), ('extra', {'a': [1, 2]}), ('healthy', False)],
+        )
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.feed('{"ignored": 1}'), [])
+
+    def test_one_character_at_a_time(self):
+        text = '{"plant_type": "Rice", "confidence": 70, "treatment": null}'
+        parser = FieldParser()
+        fields = [field for char in text for field in parser.feed(char)]
+        self.assertEqual(fields, [('plant_type', 'Rice'), ('confidence', 70), ('treatment', None)])
+
+
+def parse_events(body):
+    """
+    (event, data) pairs of an SSE body, skipping keep-alive comments.
+    """
+    events = []
+    for block in body.decode().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@override_settings(RESULT_STREAM_POLL_INTERVAL=0.01, RESULT_STREAM_TIMEOUT=10)
+class ResultStreamTests(DetectionTestCase):
+    def test_wsgi_requests_get_no_content(self):
+        crop_image = self.create_crop_image()
+        response = self.client.get(reverse('crop_detection:result_stream', args=[crop_image.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    async def test_stored_result_streams_fields_then_done(self):
+        crop_image = await sync_to_async(self.create_crop_image)()
+        response = await self.async_client.get(reverse('crop_detection:result_stream', args=[crop_image.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = parse_events(b''.join([chunk async for chunk in response.streaming_content]))
+
+        self.assertEqual(events[:-1], [
+            ('field', {'name': name, 'value': getattr(crop_image, name)}) for name in RESULT_FIELDS
+        ])
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['status'], AnalysisJob.STATUS_DONE)
+
+    async def test_job_progress_is_relayed_until_the_job_finishes(self):
+        crop_image = await sync_to_async(self.create_crop_image)(is_processed=False, plant_type='', disease_name='')
+        job = await AnalysisJob.objects.acreate(
+            crop_image=crop_image, status=AnalysisJob.STATUS_RUNNING, progress={'plant_type': 'Tomato'}
+        )
+        stream = streaming.aiter_events(crop_image)
+        self.assertEqual(await anext(stream), streaming.format_event('field', {'name': 'plant_type', 'value': 'Tomato'}))
+
+        # A second stream of the same image joins the running relay and gets its events replayed.
+        other = streaming.aiter_events(crop_image)
+        self.assertEqual(await anext(other), streaming.format_event('field', {'name': 'plant_type', 'value': 'Tomato'}))
+        self.assertEqual(len(streaming._relays), 1)
+
+        await AnalysisJob.objects.filter(pk=job.pk).aupdate(progress={'plant_type': 'Tomato', 'disease_name': 'Early Blight'})
+        self.assertEqual(await anext(stream), streaming.format_event('field', {'name': 'disease_name', 'value': 'Early Blight'}))
+
+        await CropImage.objects.filter(pk=crop_image.pk).aupdate(
+            is_processed=True, plant_type='Tomato', disease_name='Early Blight'
+        )
+        await AnalysisJob.objects.filter(pk=job.pk).aupdate(status=AnalysisJob.STATUS_DONE)
+        rest = parse_events(''.join([event async for event in stream]).encode())
+        # Fields already sent are not repeated.
+        self.assertEqual([data['name'] for event, data in rest if event == 'field'], ['confidence', 'explanation', 'treatment'])
+        self.assertEqual(rest[-1][0], 'done')
+        self.assertEqual(rest[-1][1]['status'], AnalysisJob.STATUS_DONE)
+        self.assertEqual(parse_events(''.join([event async for event in other]).encode())[-1], rest[-1])
+        self.assertEqual(streaming._relays, {})
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+class HammingIndexTests(TestCase):
+    def brute_force(self, stored, value, max_distance):
+        matches = [((value ^ other).bit_count(), item_id) for item_id, other in stored.items()]
+        return sorted((match for match in matches if match[0] <= max_distance), key=lambda m: (m[0], -m[1]))
+
+    def test_matches_a_linear_scan(self):
+        rnd = random.Random(0)
+        stored = {}
+        index = HammingIndex()
+        for item_id in range(500):
+            # Half near a few centres, so many queries have matches at every distance.
+            base = rnd.getrandbits(64) if item_id % 2 else flip(rnd.choice([0, 2 ** 64 - 1, 0xF0F0F0F0F0F0F0F0]),
+                                                                 *rnd.sample(range(64), rnd.randint(0, 12)))
+            stored[item_id] = base
+            index.add(item_id, base)
+        for _ in range(200):
+            query = flip(stored[rnd.randrange(500)], *rnd.sample(range(64), rnd.randint(0, 10)))
+            for max_distance in (0, 3, 6, 8):
+                self.assertEqual(index.search(query, max_distance), self.brute_force(stored, query, max_distance))
+
+    def test_no_false_negatives_at_block_boundaries(self):
+        edges = [0, 21, 22, 42, 43, 63]
+        value = 0x0123456789ABCDEF
+        index = HammingIndex()
+        # Distance 6 spread over the blocks as unevenly as possible, flipping the edge bits.
+        candidates = {
+            1: flip(value, *edges),
+            2: flip(value, 0, 21, 20, 19, 18, 17),  # all in the first block
+            3: flip(value, 43, 63, 44, 62, 45, 61),  # all in the last block
+            4: flip(value, 21, 22, 42, 43, 0, 63),
+            5: flip(value, *edges, 30),  # distance 7
+        }
+        for item_id, stored in candidates.items():
+            index.add(item_id, stored)
+        self.assertEqual(index.search(value, 6), [(6, 4), (6, 3), (6, 2), (6, 1)])
+        self.assertEqual(index.search(value, 7)[-1], (7, 5))
+        self.assertEqual(index.search(value, 5), [])
+
+    def test_remove_and_replace(self):
+        index = HammingIndex()
+        index.add(1, 0)
+        index.add(1, 2 ** 64 - 1)
+        self.assertEqual(index.search(0, 6), [])
+        self.assertEqual(index.search(2 ** 64 - 1, 0), [(0, 1)])
+        index.remove(1)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search(2 ** 64 - 1, 6), [])
+
+
+class NearDuplicateWarmUpTests(TransactionTestCase):
+    def test_warm_up_builds_the_index_before_the_first_search(self):
+        # The build thread only sees committed rows, hence TransactionTestCase.
+        crop_image = CropImage.objects.create(image='uploads/leaf.jpg', is_processed=True,
+                                              image_hash=to_hex(0x0123456789ABCDEF))
+        index = NearDuplicateIndex()
+        index.warm_up().join()
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search(to_hex(flip(0x0123456789ABCDEF, 5)), 'en', 6), [(1, crop_image.pk)])
+        self.assertEqual(index.search(to_hex(0x0123456789ABCDEF), 'es', 6), [])
+
+        with override_settings(NEAR_DUPLICATE_WARM_UP=False):
+            self.assertIsNone(NearDuplicateIndex().warm_up())
+
+
+class NearDuplicateTests(DetectionTestCase):
+    def test_find_near_duplicate_skips_itself_and_stale_entries(self):
+        near_duplicates.rebuild()
+        original = self.create_crop_image(1, image_hash=to_hex(0xFFFF0000FFFF0000))
+        near_duplicates.add(original)
+        upload = self.create_crop_image(2, is_processed=False, image_hash=to_hex(flip(0xFFFF0000FFFF0000, 1, 40)))
+        self.assertEqual(find_near_duplicate(upload), original)
+        self.assertIsNone(find_near_duplicate(upload, max_distance=1))
+
+        CropImage.objects.filter(pk=original.pk).update(is_processed=False)
+        self.assertIsNone(find_near_duplicate(upload))
+
+
+class AdmissionTests(DetectionTestCase):
+    def controller(self, **options):
+        defaults = {
+            'path': os.path.join(tempfile.mkdtemp(), 'admission.sqlite3'),
+            'max_concurrency': 1, 'rate': 0, 'burst': 1, 'max_queue': 5, 'max_wait': 0.2, 'lease_timeout': 60,
+        }
+        defaults.update(options)
+        return AdmissionController(**defaults)
+
+    def assertIdle(self, controller):
+        stats = controller.stats()
+        self.assertEqual((stats['queue_depth'], stats['in_flight']), (0, 0))
+
+    def test_full_queue_is_rejected_with_503(self):
+        controller = self.controller(max_queue=0, rate=2.0)
+        with self.assertRaises(AdmissionRejected) as raised:
+            with controller.admit():
+                self.fail("admitted past a full queue")
+        self.assertEqual((raised.exception.reason, raised.exception.status_code), ('queue_full', 503))
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+    def test_rate_limit_is_rejected_with_429(self):
+        controller = self.controller(rate=0.5, burst=1, max_wait=0)
+        with controller.admit():
+            pass
+        with self.assertRaises(AdmissionRejected) as raised:
+            with controller.admit():
+                self.fail("admitted past the rate limit")
+        self.assertEqual((raised.exception.reason, raised.exception.status_code), ('rate_limited', 429))
+        self.assertIdle(controller)
+
+    def test_lease_is_released_when_the_call_fails(self):
+        controller = self.controller()
+        with self.assertRaises(ValueError):
+            with controller.admit():
+                self.assertEqual(controller.stats()['in_flight'], 1)
+                raise ValueError
+        self.assertIdle(controller)
+        with controller.admit():
+            pass
+
+    async def test_async_lease_is_released_when_the_call_fails(self):
+        controller = self.controller()
+        with self.assertRaises(ValueError):
+            async with controller.aadmit():
+                raise ValueError
+        self.assertIdle(controller)
+
+    async def test_async_caller_gives_up_while_the_slot_is_held(self):
+        controller = self.controller(max_wait=0.1)
+        async with controller.aadmit():
+            with self.assertRaises(AdmissionRejected) as raised:
+                async with controller.aadmit():
+                    self.fail("admitted past the concurrency limit")
+        self.assertEqual((raised.exception.reason, raised.exception.status_code), ('overloaded', 503))
+        self.assertIdle(controller)
+
+    @override_settings(ADMISSION_MAX_QUEUE=0)
+    async def test_async_upload_reports_rejection_with_retry_after(self):
+        install_model(SimulatedModel(0))
+        response = await self.async_client.post(
+            reverse('crop_detection:async_api_upload'), {'image': make_upload(7), 'language': 'en'}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['reason'], 'queue_full')
+        self.assertEqual(response['Retry-After'], str(response.json()['retry_after']))
+        # The client retries, so the rejected upload is not kept.
+        self.assertEqual(await CropImage.objects.acount(), 0)
+
+
+class AnalyzeDirTests(DetectionTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        for seed in range(3):
+            with open(os.path.join(self.directory, f'{seed}.jpg'), 'wb') as f:
+                f.write(make_upload(seed).read())
+        with open(os.path.join(self.directory, 'broken.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir)
+
+    def analyze(self, *args):
+        out = io.StringIO()
+        call_command('analyze_dir', self.directory, '--workers', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_checkpoint_is_kept_out_of_the_image_directory(self):
+        before = sorted(os.listdir(self.directory))
+        self.assertIn('3 analyzed, 0 failed, 1 invalid', self.analyze())
+        self.assertEqual(sorted(os.listdir(self.directory)), before)
+        self.assertTrue(os.path.isfile(default_checkpoint_path(self.directory)))
+        self.assertEqual(CropImage.objects.filter(is_processed=True).count(), 3)
+
+        self.assertIn('Processed 0 image(s)', self.analyze())
+        self.assertIn('Processed 4 image(s)', self.analyze('--restart'))
+
+    def test_unwritable_checkpoint_fails_before_analyzing(self):
+        with self.assertRaises(CommandError):
+            self.analyze('--checkpoint', os.path.join(self.directory, '0.jpg', 'checkpoint'))
+        self.assertFalse(CropImage.objects.exists())
+
+    def test_validation_runs_in_the_callers_context(self):
+        seen = []
+        validate = AnalyzeDirCommand._validate
+
+        def record_context(command, full_path):
+            seen.append(metrics.context_labels().get('source'))
+            return validate(command, full_path)
+
+        with mock.patch.object(AnalyzeDirCommand, '_validate', record_context), metrics.bind(source='survey'):
+            self.analyze()
+        self.assertEqual(seen, ['survey'] * 4)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('detection.circuit.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=3, slow_call_seconds=5, reset_timeout=30)
+
+    def fail(self, breaker=None):
+        with self.assertRaises(ValueError):
+            with (breaker or self.breaker).guard():
+                raise ValueError
+
+    def succeed(self, seconds=0):
+        with self.breaker.guard():
+            self.clock.now += seconds
+
+    def open_circuit(self):
+        for _ in range(3):
+            self.fail()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_opens_at_the_failure_threshold(self):
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.succeed()
+        self.assertEqual(raised.exception.retry_after, 30)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_success_resets_the_failure_count(self):
+        self.fail()
+        self.fail()
+        self.succeed()
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(3):
+            self.succeed(seconds=6)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_half_open_probe_success_closes_the_circuit(self):
+        self.open_circuit()
+        self.clock.now += 29
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.clock.now += 1
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.breaker.check()
+
+        with self.breaker.guard():
+            # Only one probe at a time.
+            with self.assertRaises(CircuitOpenError):
+                with self.breaker.guard():
+                    pass
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.succeed()
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.open_circuit()
+        self.clock.now += 30
+        self.fail()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.check()
+        self.assertEqual(raised.exception.retry_after, 30)
+
+
+class DegradedModeTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        breaker = get_breaker()
+        for _ in range(breaker.failure_threshold):
+            with self.assertRaises(ValueError):
+                with breaker.guard():
+                    raise ValueError
+
+    def test_open_circuit_serves_a_looser_near_duplicate_or_defers(self):
+        model = SimulatedModel(0)
+        install_model(model)
+        original = self.create_crop_image(1, image_hash=to_hex(0x0123456789ABCDEF), disease_name='Brown Spot')
+        near_duplicates.rebuild()
+        # Nine bits apart: beyond NEAR_DUPLICATE_MAX_DISTANCE, within CIRCUIT_DEGRADED_MAX_DISTANCE.
+        similar = self.create_crop_image(2, is_processed=False, image_hash=to_hex(flip(0x0123456789ABCDEF, *range(9))))
+        unrelated = self.create_crop_image(3, is_processed=False, image_hash=to_hex(0xFEDCBA9876543210))
+
+        result = analyze_crop(similar)
+        self.assertEqual((result['disease_name'], result['degraded'], result['duplicate_of']),
+                         ('Brown Spot', True, original.pk))
+        self.assertTrue(analyze_crop(similar, degrade=False)['pending'])
+
+        result = analyze_crop(unrelated)
+        self.assertEqual((result['pending'], result['degraded']), (True, True))
+        self.assertGreaterEqual(result['retry_after'], 1)
+        self.assertEqual(model.peak_in_flight, 0)
+
+
+class MediaViewTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crop_image = self.create_crop_image()
+        self.name = self.crop_image.image.name
+        self.url = f'/media/{self.name}'
+        with open(os.path.join(MEDIA_ROOT, self.name), 'rb') as f:
+            self.content = f.read()
+
+    def fetch(self, client=None, headers=None):
+        response = (client or self.client).get(self.url, headers=headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    @override_settings(MEDIA_PRIVATE=True)
+    def test_private_media_is_served_only_to_owners_and_staff(self):
+        User = get_user_model()
+        self.assertEqual(self.fetch().status_code, 200)
+        # Another visitor's session, and no session at all, both look like a missing file.
+        other = Client()
+        other.session.save()
+        self.assertEqual(self.fetch(other).status_code, 404)
+        self.assertEqual(self.fetch(Client()).status_code, 404)
+
+        user = User.objects.create_user('farmer')
+        owned = self.create_crop_image(seed=1, session_key='', user=user)
+        self.url = f'/media/{owned.image.name}'
+        member = Client()
+        member.force_login(user)
+        self.assertEqual(self.fetch(member).status_code, 200)
+        self.assertEqual(self.fetch(other).status_code, 404)
+        staff = Client()
+        staff.force_login(User.objects.create_user('agronomist', is_staff=True))
+        self.assertEqual(self.fetch(staff).status_code, 200)
+
+    @override_settings(MEDIA_PRIVATE=True)
+    def test_variants_follow_their_original(self):
+        stem, extension = os.path.splitext(self.name)
+        variant = f'{stem}.thumb.webp'
+        with open(os.path.join(MEDIA_ROOT, variant), 'wb') as f:
+            f.write(b'variant')
+        self.url = f'/media/{variant}'
+        self.assertEqual(self.fetch().body, b'variant')
+        self.assertEqual(self.fetch(Client()).status_code, 404)
+
+    def test_public_media_and_unsafe_paths(self):
+        response = self.fetch(Client())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        for path in ('../agricareai/settings.py', '.hidden/file.jpg', 'uploads/', 'uploads/missing.jpg'):
+            self.assertEqual(self.client.get(f'/media/{path}').status_code, 404, path)
+
+    def test_conditional_requests_get_304(self):
+        response = self.fetch()
+        etag = response.headers['ETag']
+        not_modified = self.fetch(headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified.headers['ETag'], etag)
+        self.assertEqual(self.fetch(headers={'If-None-Match': '"stale"'}).status_code, 200)
+
+    def test_range_requests(self):
+        size = len(self.content)
+        response = self.fetch(headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, self.content[10:20])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(response.headers['Content-Length'], '10')
+
+        response = self.fetch(headers={'Range': 'bytes=-5'})
+        self.assertEqual(response.body, self.content[-5:])
+        self.assertEqual(response.headers['Content-Range'], f'bytes {size - 5}-{size - 1}/{size}')
+
+        response = self.fetch(headers={'Range': f'bytes={size}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{size}')
+
+        # Multi-range and a stale If-Range get the whole file.
+        self.assertEqual(self.fetch(headers={'Range': 'bytes=0-1,4-5'}).body, self.content)
+        self.assertEqual(self.fetch(headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'}).body, self.content)
+
+    def test_transfer_is_handed_to_the_front_proxy(self):
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/', MEDIA_SENDFILE=True):
+            response = self.fetch()
+        self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertNotIn('X-Sendfile', response.headers)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['Content-Type'], 'image/jpeg')
+
+        with override_settings(MEDIA_SENDFILE=True):
+            response = self.fetch()
+        self.assertEqual(response.headers['X-Sendfile'], os.path.join(MEDIA_ROOT, self.name))
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+        self.assertEqual(response.content, b'')
+
+
+class BlobStorageTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.storage = image_storage()
+
+    def blob(self, seed, age=0):
+        """
+        Store an upload with a variant next to it; returns (blob path, variant path).
+        """
+        name = self.storage.save('leaf.jpg', make_upload(seed))
+        path = self.storage.path(name)
+        variant = f'{os.path.splitext(path)[0]}.thumb.webp'
+        with open(variant, 'wb') as f:
+            f.write(b'variant')
+        if age:
+            past = time.time() - age
+            for each in (path, variant):
+                os.utime(each, (past, past))
+        return path, variant
+
+    def sweep(self, **options):
+        out = io.StringIO()
+        call_command('sweep_blobs', stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_crop_image(seed=0)
+        second = self.create_crop_image(seed=0)
+        other = self.create_crop_image(seed=1)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertTrue(self.storage.is_blob_name(first.image.name))
+        with open(first.image.path, 'rb') as f:
+            self.assertEqual(os.path.basename(first.image.name).split('.')[0], hashlib.sha256(f.read()).hexdigest())
+        # Variants are named '<digest>.<variant>.<ext>'.
+        blobs = [name for _dir, _dirs, files in os.walk(self.storage.path('uploads')) for name in files
+                 if name.count('.') == 1]
+        self.assertEqual(len(blobs), 2)
+        # Deleting one of the rows leaves the shared blob to sweep_blobs.
+        first.delete()
+        self.assertTrue(os.path.exists(second.image.path))
+
+    def test_sweep_keeps_referenced_and_recent_blobs(self):
+        referenced = self.create_crop_image(seed=0)
+        recent, recent_variant = self.blob(1)
+        orphan, orphan_variant = self.blob(2, age=7200)
+        incoming = os.path.join(os.path.dirname(orphan), '.incoming-crashed')
+        open(incoming, 'wb').close()
+        os.utime(incoming, (time.time() - 7200,) * 2)
+
+        report = self.sweep(grace=3600)
+        self.assertEqual(report['blobs'], 3)
+        self.assertEqual(report['referenced'], 1)
+        self.assertEqual(report['recent'], 1)
+        self.assertEqual(report['deleted'], 1)
+        self.assertEqual(report['files_deleted'], 3)
+        self.assertTrue(os.path.exists(referenced.image.path))
+        self.assertTrue(os.path.exists(recent) and os.path.exists(recent_variant))
+        self.assertFalse(os.path.exists(orphan) or os.path.exists(orphan_variant) or os.path.exists(incoming))
+
+        # Without a grace period the recent blob goes too.
+        self.assertEqual(self.sweep(grace=0)['deleted'], 1)
+        self.assertFalse(os.path.exists(recent))
+
+    def test_dry_run_only_reports(self):
+        orphan, variant = self.blob(0, age=7200)
+        report = self.sweep(dry_run=True)
+        self.assertTrue(report['dry_run'])
+        self.assertEqual(report['deleted'], 1)
+        self.assertEqual(report['files_deleted'], 2)
+        self.assertEqual(report['bytes_freed'], os.path.getsize(orphan) + os.path.getsize(variant))
+        self.assertTrue(os.path.exists(orphan) and os.path.exists(variant))
+
+    def test_blob_reused_during_the_sweep_is_restored(self):
+        orphan, variant = self.blob(0, age=7200)
+        sweeper = SweepBlobsCommand()
+        cutoff = time.time() - 3600
+        # An upload of the same content touched the blob after it was listed.
+        os.utime(orphan)
+        self.assertIsNone(sweeper._collect(orphan, [variant], cutoff, dry_run=False))
+        self.assertTrue(os.path.exists(orphan) and os.path.exists(variant))
+
+        # An upload that found the blob gone wrote it again while it was set aside.
+        os.utime(orphan, (cutoff - 60,) * 2)
+        older = sweeper._older
+
+        def upload_meanwhile(path, cutoff):
+            if os.path.basename(path).startswith('.sweep-') and not os.path.exists(orphan):
+                self.storage.save('leaf.jpg', make_upload(0))
+            return older(path, cutoff)
+
+        with mock.patch.object(sweeper, '_older', upload_meanwhile):
+            self.assertIsNone(sweeper._collect(orphan, [variant], cutoff, dry_run=False))
+        self.assertTrue(os.path.exists(orphan) and os.path.exists(variant))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(orphan)) if name.startswith('.')], [])
+
+
+class DiseaseStatsTests(DetectionTestCase):
+    def result(self, disease_name='Leaf Blast', confidence=80.0, **fields):
+        return {'plant_type': 'Rice', 'disease_name': disease_name, 'confidence': confidence, **fields}
+
+    def stats(self):
+        """
+        {(disease_name, language): (count, confidence_sum)} over all days.
+        """
+        totals = {}
+        for stat in DailyDiseaseStat.objects.filter(count__gt=0):
+            count, confidence_sum = totals.get((stat.disease_name, stat.language), (0, 0.0))
+            totals[stat.disease_name, stat.language] = (count + stat.count, confidence_sum + stat.confidence_sum)
+        return totals
+
+    def assertMatchesRebuild(self):
+        maintained = self.stats()
+        rollups.rebuild()
+        self.assertEqual(self.stats(), maintained)
+
+    def test_reanalysis_moves_the_row_between_rollups(self):
+        crop_image = self.create_crop_image(is_processed=False)
+        crop_image.apply_analysis_result(self.result())
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (1, 80.0)})
+        crop_image.apply_analysis_result(self.result())
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (1, 80.0)})
+
+        crop_image.apply_analysis_result(self.result('Brown Spot', 60.0))
+        self.assertEqual(self.stats(), {('Brown Spot', 'en'): (1, 60.0)})
+        self.assertEqual(DailyDiseaseStat.objects.get(disease_name='Leaf Blast').count, 0)
+        self.assertMatchesRebuild()
+
+        # Degraded and failed results are not counted until reanalyzed.
+        crop_image.apply_analysis_result(self.result('Brown Spot', 60.0, degraded=True))
+        self.assertEqual(self.stats(), {})
+        crop_image.apply_analysis_result({'success': False, 'error': 'Model unavailable'})
+        self.assertEqual(self.stats(), {})
+        crop_image.apply_analysis_result(self.result('Brown Spot', 70.0))
+        self.assertEqual(self.stats(), {('Brown Spot', 'en'): (1, 70.0)})
+        self.assertMatchesRebuild()
+
+    async def test_async_reanalysis(self):
+        crop_image = await sync_to_async(self.create_crop_image)(is_processed=False)
+        await crop_image.aapply_analysis_result(self.result())
+        await crop_image.aapply_analysis_result(self.result('Brown Spot', 60.0))
+        self.assertEqual(await sync_to_async(self.stats)(), {('Brown Spot', 'en'): (1, 60.0)})
+
+    def test_delete_discards_the_contribution(self):
+        kept, deleted = self.create_crop_image(is_processed=False), self.create_crop_image(seed=1, is_processed=False)
+        kept.apply_analysis_result(self.result(confidence=90.0))
+        deleted.apply_analysis_result(self.result(confidence=70.0))
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (2, 160.0)})
+        deleted.delete()
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (1, 90.0)})
+        self.assertMatchesRebuild()
+
+        # An unprocessed row never counted, so deleting it changes nothing.
+        self.create_crop_image(seed=2, is_processed=False).delete()
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (1, 90.0)})
+
+    def test_rebuild_disease_stats_command(self):
+        old = self.create_crop_image()
+        CropImage.objects.filter(pk=old.pk).update(uploaded_at=timezone.now() - timedelta(days=10))
+        self.create_crop_image(seed=1, confidence=70.0)
+        self.create_crop_image(seed=2, language='hi', disease_name='Brown Spot', confidence=50.0)
+        self.create_crop_image(seed=3, processing_error='Model unavailable')
+        self.create_crop_image(seed=4, is_processed=False)
+
+        out = io.StringIO()
+        call_command('rebuild_disease_stats', stdout=out)
+        self.assertIn('Wrote 3 rollup row(s)', out.getvalue())
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (2, 160.0), ('Brown Spot', 'hi'): (1, 50.0)})
+
+        # --since leaves older days alone.
+        DailyDiseaseStat.objects.update(count=0)
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        call_command('rebuild_disease_stats', since=since, stdout=io.StringIO())
+        self.assertEqual(self.stats(), {('Leaf Blast', 'en'): (1, 70.0), ('Brown Spot', 'hi'): (1, 50.0)})
+        with self.assertRaises(CommandError):
+            call_command('rebuild_disease_stats', since='yesterday')
+
+    def test_stats_api(self):
+        self.create_crop_image(confidence=90.0)
+        self.create_crop_image(seed=1, confidence=70.0)
+        self.create_crop_image(seed=2, language='hi', disease_name='Brown Spot', confidence=50.0)
+        rollups.rebuild()
+        url = reverse('crop_detection:api_stats')
+
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['group_by'], ['disease_name'])
+        self.assertEqual(data['results'], [
+            {'disease_name': 'Leaf Blast', 'count': 2, 'average_confidence': 80.0},
+            {'disease_name': 'Brown Spot', 'count': 1, 'average_confidence': 50.0},
+        ])
+
+        today = timezone.localdate().isoformat()
+        data = self.client.get(url, {'group_by': 'day,language', 'disease_name': 'Leaf Blast'}).json()
+        self.assertEqual(data['filters'], {'disease_name': 'Leaf Blast'})
+        self.assertEqual(data['results'], [{'day': today, 'language': 'en', 'count': 2, 'average_confidence': 80.0}])
+
+        yesterday = (timezone.localdate() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(url, {'until': yesterday}).json()['total'], 0)
+        for params in ({'group_by': 'confidence'}, {'since': 'last week'}, {'since': today, 'until': yesterday},
+                       {'since': '2000-01-01', 'until': today}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+
+class BatchUploadTests(DetectionTransactionTestCase):
+    url = reverse('crop_detection:api_batch_upload')
+
+    def post(self, *images):
+        return self.client.post(self.url, {'images': list(images), 'language': 'en'})
+
+    def test_invalid_files_fail_on_their_own(self):
+        response = self.post(make_upload(1), SimpleUploadedFile('notes.txt', b'not an image'), make_upload(2))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual((data['count'], data['processed'], data['queued']), (3, 2, 0))
+        valid, invalid, other = data['results']
+        self.assertEqual([item['index'] for item in data['results']], [0, 1, 2])
+        self.assertTrue(valid['success'] and other['success'])
+        self.assertEqual((invalid['filename'], invalid['success']), ('notes.txt', False))
+        self.assertIn('image', invalid['errors'])
+        self.assertNotIn('id', invalid)
+
+        crop_images = CropImage.objects.order_by('pk')
+        self.assertEqual([crop_image.pk for crop_image in crop_images], [valid['id'], other['id']])
+        self.assertTrue(all(crop_image.is_processed for crop_image in crop_images))
+        self.assertEqual(DetectionHistory.objects.filter(crop_image__in=crop_images).count(), 2)
+
+    @override_settings(BATCH_UPLOAD_MAX_FILES=2)
+    def test_too_many_files_are_rejected_up_front(self):
+        response = self.post(make_upload(1), make_upload(2), make_upload(3))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max 2', response.json()['error'])
+        self.assertEqual(CropImage.objects.count(), 0)
+        self.assertEqual(self.client.post(self.url, {'language': 'en'}).status_code, 400)
+
+    @override_settings(ADMISSION_MAX_QUEUE=0)
+    def test_rejected_analyses_are_queued_as_jobs(self):
+        install_model(SimulatedModel(0))
+        data = self.post(make_upload(1), make_upload(2)).json()
+        self.assertEqual((data['success'], data['processed'], data['queued']), (False, 0, 2))
+        for item in data['results']:
+            self.assertTrue(item['queued'])
+            self.assertGreaterEqual(item['retry_after'], 1)
+            job = AnalysisJob.objects.get(pk=item['job_id'])
+            self.assertEqual((job.crop_image_id, job.status), (item['id'], AnalysisJob.STATUS_PENDING))
+            self.assertEqual(self.client.get(item['status_url']).json()['status'], AnalysisJob.STATUS_PENDING)
+        self.assertFalse(CropImage.objects.filter(is_processed=True).exists())
+
+
+class IngestTests(TestCase):
+    def jpeg(self, size, orientation=1, **options):
+        """
+        JPEG that is red on its left half and blue on its right, as stored.
+        """
+        img = Image.new('RGB', size, 'blue')
+        img.paste('red', (0, 0, size[0] // 2, size[1]))
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=95, exif=exif.tobytes(), **options)
+        buffer.seek(0)
+        buffer.name = 'leaf.jpeg'
+        return buffer
+
+    def assertColor(self, img, xy, color):
+        for channel, expected in zip(img.getpixel(xy), color):
+            self.assertAlmostEqual(channel, expected, delta=40)
+
+    def test_upright_jpeg_within_the_limit_is_stored_unchanged(self):
+        upload = self.jpeg((200, 100))
+        ingested = ingest_image(upload, max_size=(400, 400))
+        self.assertEqual(ingested.content.read(), upload.getvalue())
+        self.assertEqual((ingested.image.size, ingested.original_size, ingested.source_format),
+                         ((200, 100), (200, 100), 'JPEG'))
+
+    def test_exif_orientation_is_applied(self):
+        # Orientation 6: the camera was turned, so viewers rotate the image 90 degrees clockwise.
+        ingested = ingest_image(self.jpeg((200, 100), orientation=6), max_size=(400, 400))
+        self.assertEqual((ingested.image.size, ingested.original_size), ((100, 200), (100, 200)))
+        self.assertColor(ingested.image, (50, 20), (255, 0, 0))
+        self.assertColor(ingested.image, (50, 180), (0, 0, 255))
+        # Re-encoded upright, without the orientation tag.
+        stored = Image.open(ingested.content)
+        self.assertEqual(stored.size, (100, 200))
+        self.assertEqual(stored.getexif().get(EXIF_ORIENTATION, 1), 1)
+        self.assertEqual(ingested.content.name, 'leaf.jpg')
+
+    def test_large_jpegs_are_decoded_at_draft_size(self):
+        draft = JpegImageFile.draft
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=draft) as drafted:
+            ingested = ingest_image(self.jpeg((1600, 800)), max_size=(400, 400))
+        drafted.assert_called_once_with(mock.ANY, 'RGB', (400, 200))
+        self.assertEqual((ingested.image.size, ingested.original_size), ((400, 200), (1600, 800)))
+
+        # A rotated image is drafted in its stored orientation.
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=draft) as drafted:
+            ingested = ingest_image(self.jpeg((1600, 800), orientation=8), max_size=(400, 400))
+        drafted.assert_called_once_with(mock.ANY, 'RGB', (400, 200))
+        self.assertEqual(ingested.image.size, (200, 400))
+        self.assertColor(ingested.image, (100, 380), (255, 0, 0))
+
+        # Images within the limit are decoded in full.
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=draft) as drafted:
+            ingest_image(self.jpeg((300, 200)), max_size=(400, 400))
+        drafted.assert_not_called()
+
+    def test_other_formats_are_converted_to_rgb_jpeg(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (600, 300), (0, 128, 0, 128)).save(buffer, format='PNG')
+        buffer.seek(0)
+        ingested = ingest_image(buffer, name='leaf.png', max_size=(300, 300))
+        self.assertEqual((ingested.image.mode, ingested.image.size, ingested.source_format), ('RGB', (300, 150), 'PNG'))
+        self.assertEqual(Image.open(ingested.content).format, 'JPEG')
+        self.assertEqual(ingested.content.name, 'leaf.jpg')
+
+    def test_truncated_upload_is_rejected(self):
+        data = self.jpeg((200, 100)).getvalue()
+        with self.assertRaises(OSError):
+            ingest_image(io.BytesIO(data[:len(data) // 2]))
+
+
+class ScriptedModel(SimulatedModel):
+    """
+    Simulated model that answers multi-image prompts with a fixed text, or raises it.
+    """
+
+    def __init__(self, batch_answer):
+        super().__init__(0)
+        self.batch_answer = batch_answer
+        self.calls = []  # images per call
+
+    def generate_content(self, contents, **kwargs):
+        images = sum(1 for part in contents if not isinstance(part, str))
+        self.calls.append(images)
+        if images > 1:
+            if isinstance(self.batch_answer, Exception):
+                raise self.batch_answer
+            return mock.Mock(text=self.batch_answer)
+        return super().generate_content(contents, **kwargs)
+
+
+def batch_entry(image, disease_name):
+    return {'image': image, 'plant_type': 'Rice', 'disease_name': disease_name, 'confidence': 70}
+
+
+@override_settings(TRIAGE_ENABLED=False)
+class MicroBatchTests(DetectionTransactionTestCase):
+    def images(self, count):
+        return [noise((64, 64), seed) for seed in range(1, count + 1)]
+
+    def test_parse_batch_response(self):
+        analyzer = get_analyzer('en')
+        text = '```json\n' + json.dumps([
+            batch_entry(3, 'Brown Spot'),
+            batch_entry(1, 'Leaf Blast'),
+            batch_entry(1, 'Duplicate'),
+            batch_entry(9, 'Out of range'),
+            {'image': 2, 'disease_name': 'Bad confidence', 'confidence': 'high'},
+            {'image': 4, 'plant_type': 'Rice'},
+        ]) + '\n```'
+        results = analyzer._parse_batch_response(text, 4)
+        self.assertEqual([result and result['disease_name'] for result in results],
+                         ['Leaf Blast', None, 'Brown Spot', None])
+        self.assertEqual((results[0]['confidence'], results[0]['success']), (70.0, True))
+
+        # Without numbers, entries are matched by position.
+        positional = json.dumps([{'disease_name': 'Leaf Blast'}, {'disease_name': 'Brown Spot'}])
+        self.assertEqual([result['disease_name'] for result in analyzer._parse_batch_response(positional, 2)],
+                         ['Leaf Blast', 'Brown Spot'])
+        with self.assertLogs('detection.ai_service', 'WARNING'):
+            for malformed in ('No idea.', '[{"image": 1,', '{"image": 1, "disease_name": "Leaf Blast"}'):
+                self.assertEqual(analyzer._parse_batch_response(malformed, 2), [None, None], malformed)
+
+    def test_images_missing_from_the_batch_answer_are_analyzed_alone(self):
+        model = ScriptedModel(json.dumps([batch_entry(2, 'Brown Spot')]))
+        install_model(model)
+        results = get_analyzer('en').analyze_crop_images(self.images(3), batch_size=3)
+        self.assertEqual(model.calls, [3, 1, 1])
+        self.assertEqual([result['disease_name'] for result in results], ['Early Blight', 'Brown Spot', 'Early Blight'])
+        self.assertTrue(all(result['success'] for result in results))
+
+    def test_malformed_or_failed_batches_fall_back_to_single_calls(self):
+        # Failed batch calls count against the shared circuit breaker.
+        self.addCleanup(reset_breakers)
+        for batch_answer in ('The images show rice plants.', RuntimeError('deadline exceeded')):
+            reset_analyzers()
+            result_cache.clear_memory()
+            AnalysisCacheEntry.objects.all().delete()
+            model = ScriptedModel(batch_answer)
+            install_model(model)
+            with self.assertLogs('detection.ai_service', 'WARNING'):
+                results = get_analyzer('en').analyze_crop_images(self.images(4), batch_size=2)
+            self.assertEqual(model.calls, [2, 1, 1, 2, 1, 1], batch_answer)
+            self.assertEqual([result['disease_name'] for result in results], ['Early Blight'] * 4)
+
+    def test_micro_batcher_groups_concurrent_requests_by_language(self):
+        model = ScriptedModel(json.dumps([batch_entry(1, 'Leaf Blast'), batch_entry(2, 'Brown Spot')]))
+        install_model(model)
+        batcher = MicroBatcher(max_size=2, max_wait=0.05, workers=2)
+        first, second, third = self.images(3)
+        # A full batch is sent at once; a lone image is sent when max_wait runs out.
+        futures = [batcher.submit(first, 'en'), batcher.submit(third, 'es'), batcher.submit(second, 'en')]
+        results = [future.result(timeout=10) for future in futures]
+        self.assertEqual([result['disease_name'] for result in results], ['Leaf Blast', 'Early Blight', 'Brown Spot'])
+        self.assertEqual(sorted(model.calls), [1, 2])
+
+
+def leaf(color, seed):
+    """
+    A mostly ``color`` image with some texture.
+    """
+    return Image.blend(Image.new('RGB', (64, 64), color), noise((64, 64), seed), 0.15)
+
+
+@skipUnless(triage.is_available(), "triage needs NumPy")
+class TriageTests(DetectionTestCase):
+    HEALTHY, BLIGHTED = (40, 170, 40), (140, 90, 30)
+
+    def setUp(self):
+        super().setUp()
+        samples = [(leaf(self.HEALTHY, seed), 'tomato:healthy') for seed in range(8)]
+        samples += [(leaf(self.BLIGHTED, seed), 'tomato:early_blight') for seed in range(8, 16)]
+        templates = {
+            'tomato:healthy': {
+                'en': {'plant_type': 'Tomato', 'disease_name': 'Healthy', 'explanation': 'Healthy.', 'treatment': 'None.'},
+                'es': {'plant_type': 'Tomate', 'disease_name': 'Sano', 'explanation': 'Sano.', 'treatment': 'Ninguno.'},
+            },
+        }
+        model = triage.TriageModel.fit(
+            np.stack([triage.extract_features(img) for img, _label in samples]),
+            [label for _img, label in samples],
+            templates=templates,
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.model_path = os.path.join(directory, 'triage_model.npz')
+        model.save(self.model_path)
+        path_override = override_settings(TRIAGE_MODEL_PATH=self.model_path)
+        path_override.enable()
+        self.addCleanup(path_override.disable)
+        triage.reset_model()
+        self.addCleanup(triage.reset_model)
+
+    def test_class_labels(self):
+        self.assertEqual(triage.class_label('Tomato', 'Early Blight'), 'tomato:early_blight')
+        self.assertEqual(triage.class_label('Rice', 'Mancha marrón'), 'rice:brown_spot')
+        self.assertEqual(triage.class_label('Bell Pepper', 'healthy'), 'bell_pepper:healthy')
+        self.assertIsNone(triage.class_label('Unknown', 'Early Blight'))
+        self.assertIsNone(triage.class_label('Tomato', 'Something new'))
+
+    def test_confident_predictions_are_answered_locally(self):
+        result = triage.classify(leaf(self.HEALTHY, 99), 'es')
+        self.assertEqual((result['plant_type'], result['disease_name'], result['local']), ('Tomate', 'Sano', True))
+        self.assertGreaterEqual(result['confidence'], 90)
+        # Missing translations fall back to English.
+        self.assertEqual(triage.classify(leaf(self.HEALTHY, 99), 'hi')['disease_name'], 'Healthy')
+
+    def test_uncertain_or_untemplated_predictions_are_escalated(self):
+        with override_settings(TRIAGE_CONFIDENCE_THRESHOLD=1.01):
+            self.assertIsNone(triage.classify(leaf(self.HEALTHY, 99), 'en'))
+        # Confident, but there is no stored diagnosis to answer with.
+        label, probability = triage.get_model().predict(leaf(self.BLIGHTED, 99))
+        self.assertEqual(label, 'tomato:early_blight')
+        self.assertGreaterEqual(probability, 0.9)
+        self.assertIsNone(triage.classify(leaf(self.BLIGHTED, 99), 'en'))
+        with override_settings(TRIAGE_ENABLED=False):
+            self.assertIsNone(triage.classify(leaf(self.HEALTHY, 99), 'en'))
+
+    def test_analyzer_calls_the_model_only_for_escalated_images(self):
+        model = ScriptedModel('[]')
+        install_model(model)
+        analyzer = get_analyzer('en')
+        local, escalated = analyzer.analyze_crop_images([leaf(self.HEALTHY, 99), leaf(self.BLIGHTED, 99)])
+        self.assertEqual((local['disease_name'], local.get('local')), ('Healthy', True))
+        self.assertEqual((escalated['disease_name'], escalated.get('local')), ('Early Blight', None))
+        self.assertEqual(model.calls, [1])
+
+    def test_models_without_plant_labels_are_ignored(self):
+        legacy = triage.TriageModel.fit(
+            np.stack([triage.extract_features(leaf(color, 0)) for color in (self.HEALTHY, self.BLIGHTED)]),
+            ['healthy', 'early_blight'],
+        )
+        legacy.save(self.model_path)
+        triage.reset_model()
+        with self.assertLogs('detection.triage', 'WARNING'):
+            self.assertIsNone(triage.get_model())
+
+
+class ExportTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', None)
+        self.crop_images = [
+            self.create_crop_image(user=self.admin, explanation='Lesions, "brown"\nand dry.'),
+            self.create_crop_image(seed=1, language='es', disease_name='Mancha marrón'),
+        ]
+
+    def export(self, action):
+        client = Client()
+        client.force_login(self.admin)
+        response = client.post(reverse('admin:detection_cropimage_changelist'), {
+            'action': action,
+            '_selected_action': [crop_image.pk for crop_image in self.crop_images],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        response, body = self.export('export_to_csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="crop_images_export.csv"')
+        rows = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+        self.assertEqual(rows[0], exports.EXPORTS['crop_images'].headers)
+        self.assertEqual(len(rows), 3)
+        first, second = (dict(zip(rows[0], row)) for row in rows[1:])
+        self.assertEqual((first['ID'], first['User']), (str(self.crop_images[0].pk), 'admin'))
+        self.assertEqual(first['Explanation'], 'Lesions, "brown"\nand dry.')
+        self.assertEqual(first['Image URL'], self.crop_images[0].image.url)
+        self.assertEqual((second['User'], second['Disease Name']), ('Anonymous', 'Mancha marrón'))
+
+    def test_jsonl_export(self):
+        response, body = self.export('export_to_jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([line['ID'] for line in lines], [crop_image.pk for crop_image in self.crop_images])
+        self.assertEqual(lines[0]['Uploaded At'], self.crop_images[0].uploaded_at.isoformat())
+        self.assertEqual((lines[0]['Confidence'], lines[0]['Processed']), (90.0, True))
+
+    def test_gzipped_export(self):
+        _response, plain = self.export('export_to_csv')
+        response, body = self.export('export_to_csv_gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="crop_images_export.csv.gz"')
+        self.assertEqual(gzip.decompress(body), plain)
+
+    def test_rows_are_streamed_in_chunks_without_extra_queries(self):
+        for seed in range(2, 7):
+            DetectionHistory.objects.create(crop_image=self.create_crop_image(seed=seed), session_id='s',
+                                            ip_address='127.0.0.1', user=self.admin if seed % 2 else None)
+        export = exports.EXPORTS['detection_history']
+        with mock.patch.object(exports, 'ROWS_PER_CHUNK', 2), self.assertNumQueries(1):
+            chunks = list(exports.encode(export, export.rows(DetectionHistory.objects.all()), 'csv'))
+        # The header line, then two rows per chunk.
+        self.assertEqual([chunk.count(b'\r\n') for chunk in chunks], [1, 2, 2, 1])
+        self.assertEqual([row[1] for row in csv.reader(io.StringIO(b''.join(chunks).decode()))][1:],
+                         ['Anonymous', 'admin', 'Anonymous', 'admin', 'Anonymous'])
+        with self.assertRaises(ValueError):
+            list(exports.encode(export, [], 'xml'))
+
+    def test_export_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'export.jsonl.gz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        CropImage.objects.filter(pk=self.crop_images[0].pk).update(uploaded_at=timezone.now() - timedelta(days=3))
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        call_command('export_detections', 'crop_images', format='jsonl', gzip=True, output=path, since=since,
+                     stdout=io.StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['ID'] for line in f], [self.crop_images[1].pk])
+        with self.assertRaises(CommandError):
+            call_command('export_detections', 'crop_images', since='03/01/2026')
+
+
+@override_settings(RECENT_DETECTIONS_COUNT=3)
+class RecentDetectionsTests(DetectionTransactionTestCase):
+    def pks(self):
+        with self.assertNumQueries(0):
+            return [item['pk'] for item in recent.get_recent()]
+
+    def entry(self):
+        return cache.get(recent.CACHE_KEY)
+
+    def test_saved_images_update_the_cached_list(self):
+        first, second = self.create_crop_image(), self.create_crop_image(seed=1)
+        self.assertEqual(recent.refresh(), recent.build())
+        self.assertEqual(self.pks(), [second.pk, first.pk])
+
+        third = self.create_crop_image(seed=2)
+        fourth = self.create_crop_image(seed=3)
+        self.create_crop_image(seed=4, is_processed=False)
+        self.assertEqual(self.pks(), [fourth.pk, third.pk, second.pk])
+        self.assertFalse(self.entry()['stale'])
+
+        # Results applied with bulk_update arrive through crop_images_saved.
+        pending = self.create_crop_image(seed=5, is_processed=False)
+        pending.apply_analysis_result({'plant_type': 'Rice', 'disease_name': 'Brown Spot'}, save=False)
+        CropImage.objects.bulk_update([pending], CropImage.ANALYSIS_RESULT_FIELDS)
+        crop_images_saved.send(sender=CropImage, crop_images=[pending])
+        self.assertEqual(self.pks(), [pending.pk, fourth.pk, third.pk])
+        self.assertEqual(recent.get_recent()[0]['disease_name'], 'Brown Spot')
+
+    def test_removed_images_mark_the_list_stale(self):
+        first, second, third = (self.create_crop_image(seed=seed) for seed in range(3))
+        recent.refresh()
+        second.delete()
+        self.assertEqual((self.pks(), self.entry()['stale']), ([third.pk, first.pk], True))
+
+        recent.refresh()
+        third.is_processed = False
+        third.save()
+        self.assertEqual((self.pks(), self.entry()['stale']), ([first.pk], True))
+
+        # Images that were not listed leave it alone.
+        recent.refresh()
+        self.create_crop_image(seed=9, is_processed=False).delete()
+        self.assertFalse(self.entry()['stale'])
+
+    def test_stale_lists_are_served_while_one_background_refresh_runs(self):
+        first = self.create_crop_image()
+        recent.refresh()
+        # Saved by a queryset update, which sends no signal.
+        CropImage.objects.filter(pk=first.pk).update(disease_name='Brown Spot')
+        self.assertEqual(recent.get_recent()[0]['disease_name'], 'Leaf Blast')
+
+        with override_settings(RECENT_DETECTIONS_MAX_AGE=0), \
+                mock.patch.object(recent._refresher, 'submit') as submit:
+            time.sleep(0.01)
+            self.assertEqual(recent.get_recent()[0]['disease_name'], 'Leaf Blast')
+            self.assertEqual(recent.get_recent()[0]['disease_name'], 'Leaf Blast')
+        submit.assert_called_once_with(recent._refresh_in_background)
+
+        recent._refresh_in_background()
+        self.assertEqual(recent.get_recent()[0]['disease_name'], 'Brown Spot')
+        self.assertIsNone(cache.get(recent.REFRESH_LOCK_KEY))
+
+    def test_empty_cache_is_built_in_the_request(self):
+        crop_image = self.create_crop_image()
+        self.assertIsNone(self.entry())
+        with self.assertNumQueries(1):
+            self.assertEqual([item['pk'] for item in recent.get_recent()], [crop_image.pk])
+        self.assertEqual(self.pks(), [crop_image.pk])
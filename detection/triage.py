@@ -0,0 +1,317 @@
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+from . import metrics
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - triage is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FEATURE_SIZE = (64, 64)
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 12, 4, 4
+GRADIENT_BINS = 8
+
+# Free-text names the model has returned for the canonical disease codes, beyond the codes and labels themselves.
+DISEASE_ALIASES = {
+    'sano': 'healthy',
+    'saludable': 'healthy',
+    'no_disease': 'healthy',
+    'tizón_temprano': 'early_blight',
+    'oídio': 'powdery_mildew',
+    'mildiu': 'downy_mildew',
+    'mildiu_velloso': 'downy_mildew',
+    'virus_del_mosaico': 'mosaic_virus',
+    'mancha_marrón': 'brown_spot',
+    'tizón_bacteriano': 'bacterial_blight',
+    'añublo_de_la_hoja': 'leaf_blast',
+}
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+def canonical_disease(name: str) -> Optional[str]:
+    """
+    Map a stored free-text disease name to a ``CropImage.DISEASE_CHOICES`` code.
+
+    Args:
+        name (str): Disease name as returned by the analyzer, e.g. 'Early Blight'.
+
+    Returns:
+        str: Canonical code such as 'early_blight', or None when the name is not recognised.
+    """
+    from .models import CropImage
+
+    slug = re.sub(r'[\s\-]+', '_', (name or '').strip().lower())
+    codes = {code for code, _label in CropImage.DISEASE_CHOICES if code != 'unknown'}
+    if slug in codes:
+        return slug
+    for code, label in CropImage.DISEASE_CHOICES:
+        if code != 'unknown' and slug == re.sub(r'\s+', '_', str(label).lower()):
+            return code
+    return DISEASE_ALIASES.get(slug)
+
+
+def class_label(plant_type: str, disease_name: str) -> Optional[str]:
+    """
+    Triage class of a stored diagnosis: the plant and the canonical disease code.
+
+    Classes include the plant so that a prediction comes with the plant type,
+    explanation and treatment of images of that same plant.
+
+    Args:
+        plant_type (str): Plant as returned by the analyzer, e.g. 'Tomato'.
+        disease_name (str): Disease as returned by the analyzer, e.g. 'Early Blight'.
+
+    Returns:
+        str: Label such as 'tomato:early_blight', or None when the plant is unknown or
+             the disease is not recognised.
+    """
+    plant = re.sub(r'[\s\-:]+', '_', (plant_type or '').strip().lower())
+    code = canonical_disease(disease_name)
+    if not plant or plant == 'unknown' or code is None:
+        return None
+    return f"{plant}:{code}"
+
+
+def extract_features(img: Image.Image) -> 'np.ndarray':
+    """
+    Compute a small colour and texture descriptor for an image, on CPU only.
+
+    Leaf diseases show up mostly as colour shifts (yellowing, brown lesions, white
+    mildew) and local texture, so the vector is a joint HSV histogram, a gradient
+    magnitude histogram and per-channel RGB moments.
+
+    Args:
+        img (Image.Image): Image to describe.
+
+    Returns:
+        np.ndarray: 1-D float32 feature vector.
+    """
+    small = img.convert('RGB').resize(FEATURE_SIZE, Image.Resampling.BILINEAR)
+    hsv = np.asarray(small.convert('HSV'), dtype=np.int32)
+    hue = hsv[..., 0] * HUE_BINS // 256
+    saturation = hsv[..., 1] * SATURATION_BINS // 256
+    value = hsv[..., 2] * VALUE_BINS // 256
+    joint = (hue * SATURATION_BINS + saturation) * VALUE_BINS + value
+    colour = np.bincount(joint.ravel(), minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS)
+    colour = colour / joint.size
+
+    gray = np.asarray(small.convert('L'), dtype=np.float32) / 255.0
+    magnitude = np.hypot(np.diff(gray, axis=1)[:-1, :], np.diff(gray, axis=0)[:, :-1])
+    texture, _edges = np.histogram(magnitude, bins=GRADIENT_BINS, range=(0.0, 0.5))
+    texture = texture / magnitude.size
+
+    rgb = np.asarray(small, dtype=np.float32) / 255.0
+    moments = np.concatenate([rgb.mean(axis=(0, 1)), rgb.std(axis=(0, 1))])
+    return np.concatenate([colour, texture, moments]).astype(np.float32)
+
+
+class TriageModel:
+    """
+    Multinomial logistic regression over ``extract_features`` vectors.
+
+    Classes are ``class_label`` values. Besides the weights, the model keeps one stored
+    diagnosis per class and language (plant type, explanation, treatment) so a local
+    prediction can be returned in the analyzer's result format.
+    """
+
+    def __init__(self, classes: Sequence[str], mean, scale, weights, bias,
+                 templates: Optional[Dict[str, Dict[str, dict]]] = None) -> None:
+        self.classes = list(classes)
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights
+        self.bias = bias
+        self.templates = templates or {}
+
+    @classmethod
+    def fit(cls, features: 'np.ndarray', labels: Sequence[str], epochs: int = 500,
+            learning_rate: float = 0.5, l2: float = 1e-3,
+            templates: Optional[Dict[str, Dict[str, dict]]] = None) -> 'TriageModel':
+        """
+        Train with full-batch gradient descent on standardized features.
+
+        Args:
+            features (np.ndarray): (n_samples, n_features) matrix.
+            labels (list): ``class_label`` per sample.
+            epochs (int): Gradient descent steps.
+            learning_rate (float): Step size.
+            l2 (float): Weight decay.
+            templates (dict, optional): Diagnosis per class and language used in predictions.
+
+        Returns:
+            TriageModel: The trained model.
+        """
+        classes = sorted(set(labels))
+        index = {code: i for i, code in enumerate(classes)}
+        targets = np.zeros((len(labels), len(classes)), dtype=np.float32)
+        targets[np.arange(len(labels)), [index[label] for label in labels]] = 1.0
+
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        x = (features - mean) / scale
+        weights = np.zeros((x.shape[1], len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        for _ in range(epochs):
+            gradient = _softmax(x @ weights + bias) - targets
+            weights -= learning_rate * (x.T @ gradient / len(x) + l2 * weights)
+            bias -= learning_rate * gradient.mean(axis=0)
+        return cls(classes, mean, scale, weights, bias, templates)
+
+    def predict_proba(self, features: 'np.ndarray') -> 'np.ndarray':
+        x = (np.atleast_2d(features) - self.mean) / self.scale
+        return _softmax(x @ self.weights + self.bias)
+
+    def predict(self, img: Image.Image) -> Tuple[str, float]:
+        """
+        Return the most likely class label and its probability for an image.
+        """
+        probabilities = self.predict_proba(extract_features(img))[0]
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    def save(self, path) -> None:
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                classes=np.array(self.classes),
+                mean=self.mean,
+                scale=self.scale,
+                weights=self.weights,
+                bias=self.bias,
+                templates=np.array(json.dumps(self.templates)),
+            )
+
+    @classmethod
+    def load(cls, path) -> 'TriageModel':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                [str(code) for code in data['classes']],
+                data['mean'],
+                data['scale'],
+                data['weights'],
+                data['bias'],
+                json.loads(str(data['templates'])),
+            )
+
+
+def _softmax(logits: 'np.ndarray') -> 'np.ndarray':
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+_model: Optional[TriageModel] = None
+_model_path: Optional[str] = None
+_model_lock = threading.Lock()
+
+
+def get_model_path() -> Path:
+    return Path(getattr(settings, 'TRIAGE_MODEL_PATH', settings.BASE_DIR / 'triage_model.npz'))
+
+
+def get_model() -> Optional[TriageModel]:
+    """
+    Return the process-wide triage model, loading it on first use.
+
+    Returns:
+        TriageModel: The trained model, or None when triage is disabled, NumPy is
+                     missing or no model has been trained yet.
+    """
+    global _model, _model_path
+    if not getattr(settings, 'TRIAGE_ENABLED', True) or np is None:
+        return None
+    path = get_model_path()
+    with _model_lock:
+        if _model_path != str(path):
+            _model_path = str(path)
+            _model = None
+            if path.is_file():
+                try:
+                    _model = TriageModel.load(path)
+                    logger.info(f"Triage model loaded from {path} ({len(_model.classes)} classes).")
+                    if not all(':' in label for label in _model.classes):
+                        # Trained on disease codes alone, so its templates may name another plant.
+                        logger.warning(f"Ignoring triage model {path}: retrain it with train_triage_model.")
+                        _model = None
+                except Exception as e:
+                    logger.error(f"Failed to load triage model from {path}: {str(e)}", exc_info=True)
+        return _model
+
+
+def reset_model() -> None:
+    global _model, _model_path
+    with _model_lock:
+        _model = None
+        _model_path = None
+
+
+def classify(img: Image.Image, language: str) -> Optional[dict]:
+    """
+    Diagnose an image locally when the triage model is confident enough.
+
+    Args:
+        img (Image.Image): RGB image to classify.
+        language (str): Language of the diagnosis to return.
+
+    Returns:
+        dict: Analyzer-format result with ``local=True`` when the top class reaches
+              ``TRIAGE_CONFIDENCE_THRESHOLD``; None when the image should go to Gemini.
+    """
+    model = get_model()
+    if model is None:
+        return None
+    label, probability = model.predict(img)
+    templates = model.templates.get(label, {})
+    template = templates.get(language) or templates.get('en')
+    if probability < getattr(settings, 'TRIAGE_CONFIDENCE_THRESHOLD', 0.9) or template is None:
+        metrics.incr('triage_escalated_total')
+        return None
+    plant, code = label.split(':', 1)
+    metrics.incr('triage_local_total', plant=plant, disease=code)
+    result = dict(template)
+    result.update({'confidence': round(probability * 100, 2), 'success': True, 'local': True})
+    return result
+
+
+def evaluate(model: TriageModel, features: 'np.ndarray', labels: Sequence[str],
+             thresholds: Sequence[float]) -> List[dict]:
+    """
+    Measure how many remote calls a model would avoid, and at what accuracy.
+
+    Args:
+        model (TriageModel): Model to evaluate.
+        features (np.ndarray): Held-out feature matrix.
+        labels (list): ``class_label`` per held-out sample.
+        thresholds (list): Confidence thresholds to report.
+
+    Returns:
+        list: One dict per threshold with ``local`` (calls avoided), ``escalated``,
+              ``coverage`` and ``local_accuracy`` (accuracy of the avoided calls).
+    """
+    probabilities = model.predict_proba(features)
+    predicted = np.array(model.classes)[probabilities.argmax(axis=1)]
+    confidence = probabilities.max(axis=1)
+    correct = predicted == np.array(labels)
+    rows = []
+    for threshold in thresholds:
+        local = confidence >= threshold
+        rows.append({
+            'threshold': threshold,
+            'local': int(local.sum()),
+            'escalated': int((~local).sum()),
+            'coverage': float(local.mean()) if len(labels) else 0.0,
+            'local_accuracy': float(correct[local].mean()) if local.any() else None,
+        })
+    return rows
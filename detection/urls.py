@@ -7,7 +7,17 @@ urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('upload/', views.UploadImageView.as_view(), name='upload'),
     path('result/<int:pk>/', views.ResultView.as_view(), name='result'),
+    path('result/<int:pk>/stream/', views.ResultStreamView.as_view(), name='result_stream'),
     path('history/', views.HistoryView.as_view(), name='history'),
     path('api/upload/', views.APIUploadView.as_view(), name='api_upload'),
+    path('api/upload/batch/', views.APIBatchUploadView.as_view(), name='api_batch_upload'),
     path('api/results/<int:pk>/', views.APIResultView.as_view(), name='api_result'),
+    path('api/jobs/<int:pk>/', views.APIJobStatusView.as_view(), name='api_job_status'),
+    path('api/stats/', views.APIStatsView.as_view(), name='api_stats'),
+    path('api/metrics/', views.APIMetricsView.as_view(), name='api_metrics'),
+    path('metrics/', views.PrometheusMetricsView.as_view(), name='metrics'),
+    # Async variants, served natively when running under ASGI (agricareai.asgi)
+    path('async/upload/', views.AsyncUploadImageView.as_view(), name='async_upload'),
+    path('api/async/upload/', views.AsyncAPIUploadView.as_view(), name='async_api_upload'),
+    path('api/async/results/<int:pk>/', views.AsyncAPIResultView.as_view(), name='async_api_result'),
 ]
\ No newline at end of file
@@ -1,61 +1,101 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
-from .models import CropImage, DetectionHistory
+from .models import AnalysisJob, CropImage, DetectionHistory
 from .forms import ImageUploadForm
-from .ai_service import GlobalCropAnalyzer
+from .jobs import aanalyze_crop, analyze_crops, enqueue_analysis
+from .pagination import keyset_page
+from .phash import near_duplicates
+from . import admission, circuit, media, metrics, recent, response_cache, rollups, streaming
+from .admission import AdmissionRejected
+from .signals import crop_images_saved
+import datetime
 import logging
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+def admission_rejected_response(exc):
+    response = JsonResponse({
+        'error': 'Analysis service is busy, please retry later',
+        'reason': exc.reason,
+        'retry_after': exc.retry_after,
+    }, status=exc.status_code)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+def serialize_result(crop_image):
+    """
+    JSON body of ``api/results/<id>/``, shared by the sync and async result views.
+    """
+    return {
+        'success': True,
+        'id': crop_image.id,
+        'plant_type': crop_image.plant_type,
+        'disease_name': crop_image.disease_name,
+        'confidence': round(crop_image.confidence, 2) if crop_image.confidence is not None else None,
+        'explanation': crop_image.explanation,
+        'treatment': crop_image.treatment,
+        'image_url': crop_image.image.url,
+        'language': crop_image.language,
+        'is_processed': crop_image.is_processed,
+        'from_cache': crop_image.from_cache,
+        'degraded': crop_image.degraded,
+        'triaged_locally': crop_image.triaged_locally,
+        'uploaded_at': crop_image.uploaded_at.isoformat(),
+    }
+
+def get_session_key(request):
+    if not request.session.session_key:
+        request.session.create()
+    return request.session.session_key
+
 class HomeView(View):
     def get(self, request):
         form = ImageUploadForm()
-        recent_detections = CropImage.objects.filter(is_processed=True).select_related('user').order_by('-uploaded_at')[:6]
         context = {
             'form': form,
-            'recent_detections': recent_detections,
+            'recent_detections': recent.get_recent(),
             'supported_languages': getattr(settings, 'SUPPORTED_LANGUAGES', {'en': 'English'}),
         }
         return render(request, 'detection/upload.html', context)
 
 class UploadImageView(View):
     def post(self, request):
+        language = request.POST.get('language', 'en')
+        metrics.label(language=language)
         form = ImageUploadForm(request.POST, request.FILES)
-        if form.is_valid():
+        with metrics.span('form_validation'):
+            is_valid = form.is_valid()
+        if is_valid:
             try:
                 crop_image = form.save(commit=False)
                 if request.user.is_authenticated:
                     crop_image.user = request.user
-                language = request.POST.get('language', 'en')
                 crop_image.language = language
-                crop_image.save()
-                ai_service = GlobalCropAnalyzer(language=language)
-                result = ai_service.analyze_crop_image(crop_image.image.path)
-                crop_image.plant_type = result.get('plant_type', 'Unknown')
-                crop_image.disease_name = result.get('disease_name', 'Unknown')
-                crop_image.confidence = result.get('confidence', 0.0)
-                crop_image.explanation = result.get('explanation', '')
-                crop_image.treatment = result.get('treatment', '')
-                crop_image.is_processed = True
-                if not result.get('success', True):
-                    crop_image.processing_error = result.get('error', 'Unknown error')
-                crop_image.save()
-                DetectionHistory.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    crop_image=crop_image,
-                    session_id=request.session.session_key or request.session.create(),
-                    ip_address=self.get_client_ip(request),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
-                messages.success(request, _('Image processed successfully!'))
+                crop_image.session_key = get_session_key(request)
+                with metrics.span('save_image'):
+                    crop_image.save()
+                with metrics.span('enqueue_job'):
+                    enqueue_analysis(crop_image)
+                with metrics.span('save_history'):
+                    DetectionHistory.objects.create(
+                        user=request.user if request.user.is_authenticated else None,
+                        crop_image=crop_image,
+                        session_id=crop_image.session_key,
+                        ip_address=self.get_client_ip(request),
+                        user_agent=request.META.get('HTTP_USER_AGENT', '')
+                    )
+                messages.success(request, _('Image uploaded! Analysis is in progress.'))
                 return redirect('crop_detection:result', pk=crop_image.pk)
             except Exception as e:
                 logger.error(f"Image upload processing error: {str(e)}", exc_info=True)
@@ -72,39 +112,49 @@ class UploadImageView(View):
 
 class ResultView(View):
     def get(self, request, pk):
+        # Flash messages belong to one visitor, so a page showing them is never cached.
+        has_messages = len(messages.get_messages(request)) > 0
+        return response_cache.respond(request, pk, 'html', self.render_result, vary_language=True, use_cache=not has_messages)
+
+    def render_result(self, request, pk):
         crop_image = get_object_or_404(CropImage.objects.select_related('user'), pk=pk)
         context = {
             'crop_image': crop_image,
             'language': crop_image.language,
+            'pending_job': crop_image.jobs.exclude(status__in=[AnalysisJob.STATUS_DONE, AnalysisJob.STATUS_FAILED]).order_by('-created_at').first() if not crop_image.is_processed or crop_image.degraded else None,
         }
-        return render(request, 'detection/result.html', context)
+        return crop_image, render(request, 'detection/result.html', context)
+
+class ResultStreamView(View):
+    def get(self, request, pk):
+        # A WSGI worker would be held for the whole analysis; 204 tells EventSource not
+        # to reconnect, and the page falls back to polling the job status.
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        crop_image = get_object_or_404(CropImage, pk=pk)
+        response = StreamingHttpResponse(streaming.aiter_events(crop_image), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class HistoryView(View):
     def get(self, request):
         if request.user.is_authenticated:
-            crop_images = CropImage.objects.filter(
-                user=request.user, is_processed=True
-            ).select_related('user').order_by('-uploaded_at')
+            crop_images = CropImage.objects.filter(user=request.user, is_processed=True)
+        elif request.session.session_key:
+            crop_images = CropImage.objects.filter(session_key=request.session.session_key, is_processed=True)
         else:
-            session_key = request.session.session_key
-            if session_key:
-                detection_histories = DetectionHistory.objects.filter(session_id=session_key).values_list('crop_image_id', flat=True)
-                crop_images = CropImage.objects.filter(
-                    id__in=detection_histories, is_processed=True
-                ).select_related('user').order_by('-uploaded_at')
-            else:
-                crop_images = CropImage.objects.none()
-        paginator = Paginator(crop_images, 12)
-        page_number = request.GET.get('page', 1)
-        try:
-            page_obj = paginator.page(page_number)
-        except PageNotAnInteger:
-            page_obj = paginator.page(1)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages)
+            crop_images = CropImage.objects.none()
+        page_obj = keyset_page(
+            crop_images,
+            getattr(settings, 'HISTORY_PAGE_SIZE', 12),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
         context = {
             'page_obj': page_obj,
-            'total_detections': crop_images.count(),
+            # At most one COUNT, and none when everything fits on this page.
+            'total_detections': crop_images.count() if page_obj.has_other_pages() else len(page_obj),
         }
         return render(request, 'detection/history.html', context)
 
@@ -114,35 +164,143 @@ class APIUploadView(View):
         try:
             if 'image' not in request.FILES:
                 return JsonResponse({'error': 'No image file provided'}, status=400)
+            language = request.POST.get('language', 'en')
+            metrics.label(language=language)
             form = ImageUploadForm(request.POST, request.FILES)
-            if form.is_valid():
+            with metrics.span('form_validation'):
+                is_valid = form.is_valid()
+            if is_valid:
                 crop_image = form.save(commit=False)
                 if request.user.is_authenticated:
                     crop_image.user = request.user
-                language = request.POST.get('language', 'en')
                 crop_image.language = language
-                crop_image.save()
-                ai_service = GlobalCropAnalyzer(language=language)
-                result = ai_service.analyze_crop_image(crop_image.image.path)
-                crop_image.plant_type = result.get('plant_type', 'Unknown')
-                crop_image.disease_name = result.get('disease_name', 'Unknown')
-                crop_image.confidence = result.get('confidence', 0.0)
-                crop_image.explanation = result.get('explanation', '')
-                crop_image.treatment = result.get('treatment', '')
-                crop_image.is_processed = True
-                if not result.get('success', True):
-                    crop_image.processing_error = result.get('error', 'Unknown error')
-                crop_image.save()
-                DetectionHistory.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    crop_image=crop_image,
-                    session_id=request.session.session_key or request.session.create(),
-                    ip_address=self.get_client_ip(request),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
+                crop_image.session_key = get_session_key(request)
+                with metrics.span('save_image'):
+                    crop_image.save()
+                with metrics.span('enqueue_job'):
+                    job = enqueue_analysis(crop_image)
+                with metrics.span('save_history'):
+                    DetectionHistory.objects.create(
+                        user=request.user if request.user.is_authenticated else None,
+                        crop_image=crop_image,
+                        session_id=crop_image.session_key,
+                        ip_address=self.get_client_ip(request),
+                        user_agent=request.META.get('HTTP_USER_AGENT', '')
+                    )
                 return JsonResponse({
                     'success': True,
                     'id': crop_image.id,
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': reverse('crop_detection:api_job_status', args=[job.id]),
+                    'result_url': reverse('crop_detection:api_result', args=[crop_image.id]),
+                    'image_url': crop_image.image.url,
+                    'language': crop_image.language,
+                }, status=202)
+            else:
+                return JsonResponse({'error': 'Invalid form data'}, status=400)
+        except Exception as e:
+            logger.error(f"API upload error: {str(e)}", exc_info=True)
+            return JsonResponse({'error': 'Server error occurred'}, status=500)
+    
+    def get_client_ip(self, request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+        return ip
+
+@method_decorator(csrf_exempt, name='dispatch')
+class APIBatchUploadView(View):
+    def post(self, request):
+        try:
+            uploads = request.FILES.getlist('images')
+            if not uploads:
+                return JsonResponse({'error': 'No image files provided'}, status=400)
+            max_files = getattr(settings, 'BATCH_UPLOAD_MAX_FILES', 50)
+            if len(uploads) > max_files:
+                return JsonResponse({'error': f'Too many images (max {max_files} per request)'}, status=400)
+
+            language = request.POST.get('language', 'en')
+            metrics.label(language=language)
+            user = request.user if request.user.is_authenticated else None
+            session_id = get_session_key(request)
+            items = []
+            crop_images = []
+            for index, upload in enumerate(uploads):
+                form = ImageUploadForm({'language': language}, {'image': upload})
+                with metrics.span('form_validation'):
+                    is_valid = form.is_valid()
+                if not is_valid:
+                    items.append({
+                        'index': index,
+                        'filename': upload.name,
+                        'success': False,
+                        'errors': {field: [str(e) for e in errors] for field, errors in form.errors.items()},
+                    })
+                    continue
+                crop_image = form.save(commit=False)
+                crop_image.user = user
+                crop_image.language = language
+                crop_image.session_key = session_id
+                crop_images.append(crop_image)
+                items.append({'index': index, 'filename': upload.name, 'crop_image': crop_image})
+
+            with metrics.span('save_image'):
+                for crop_image in crop_images:
+                    crop_image.store_image()
+                CropImage.objects.bulk_create(crop_images)
+            results = analyze_crops(crop_images)
+            analyzed = []
+            deferred = {}
+            for crop_image, result in zip(crop_images, results):
+                if result.get('pending'):
+                    # Over capacity or circuit open: hand the image to the background queue instead of failing it.
+                    deferred[crop_image.pk] = (enqueue_analysis(crop_image), result['retry_after'])
+                    continue
+                crop_image.apply_analysis_result(result, save=False)
+                analyzed.append(crop_image)
+            CropImage.objects.bulk_update(analyzed, CropImage.ANALYSIS_RESULT_FIELDS)
+            rollups.record(analyzed)
+            response_cache.invalidate(crop_image.pk for crop_image in analyzed)
+            crop_images_saved.send(sender=CropImage, crop_images=analyzed)
+            for crop_image in analyzed:
+                if crop_image.degraded:
+                    # Reanalyze once the service recovers.
+                    enqueue_analysis(crop_image)
+                elif crop_image.is_reusable:
+                    near_duplicates.add(crop_image)
+
+            ip_address = self.get_client_ip(request)
+            user_agent = request.META.get('HTTP_USER_AGENT', '')
+            with metrics.span('save_history'):
+                DetectionHistory.objects.bulk_create([
+                    DetectionHistory(
+                        user=user,
+                        crop_image=crop_image,
+                        session_id=session_id,
+                        ip_address=ip_address,
+                        user_agent=user_agent,
+                    )
+                    for crop_image in crop_images
+                ])
+
+            for item in items:
+                crop_image = item.pop('crop_image', None)
+                if crop_image is None:
+                    continue
+                if crop_image.pk in deferred:
+                    job, retry_after = deferred[crop_image.pk]
+                    item.update({
+                        'success': False,
+                        'queued': True,
+                        'id': crop_image.id,
+                        'job_id': job.id,
+                        'status_url': reverse('crop_detection:api_job_status', args=[job.id]),
+                        'retry_after': retry_after,
+                    })
+                    continue
+                item.update({
+                    'success': not crop_image.processing_error,
+                    'id': crop_image.id,
                     'plant_type': crop_image.plant_type,
                     'disease_name': crop_image.disease_name,
                     'confidence': round(crop_image.confidence, 2),
@@ -150,13 +308,23 @@ class APIUploadView(View):
                     'treatment': crop_image.treatment,
                     'image_url': crop_image.image.url,
                     'language': crop_image.language,
+                    'from_cache': crop_image.from_cache,
+                    'degraded': crop_image.degraded,
+                    'triaged_locally': crop_image.triaged_locally,
                 })
-            else:
-                return JsonResponse({'error': 'Invalid form data'}, status=400)
+                if crop_image.processing_error:
+                    item['error'] = crop_image.processing_error
+            return JsonResponse({
+                'success': all(item['success'] for item in items),
+                'count': len(items),
+                'processed': len(analyzed),
+                'queued': len(deferred),
+                'results': items,
+            })
         except Exception as e:
-            logger.error(f"API upload error: {str(e)}", exc_info=True)
+            logger.error(f"API batch upload error: {str(e)}", exc_info=True)
             return JsonResponse({'error': 'Server error occurred'}, status=500)
-    
+
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
@@ -165,9 +333,136 @@ class APIUploadView(View):
 class APIResultView(View):
     def get(self, request, pk):
         try:
-            crop_image = get_object_or_404(CropImage.objects.select_related('user'), pk=pk)
+            return response_cache.respond(request, pk, 'json', self.render_result)
+        except Exception as e:
+            logger.error(f"API result error for pk={pk}: {str(e)}", exc_info=True)
+            return JsonResponse({'error': 'Server error occurred'}, status=500)
+
+    def render_result(self, request, pk):
+        crop_image = get_object_or_404(CropImage.objects.select_related('user'), pk=pk)
+        return crop_image, JsonResponse(serialize_result(crop_image))
+
+class APIJobStatusView(View):
+    def get(self, request, pk):
+        job = get_object_or_404(AnalysisJob, pk=pk)
+        return JsonResponse({
+            'success': True,
+            'job_id': job.id,
+            'id': job.crop_image_id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'error': job.error,
+            'created_at': job.created_at.isoformat(),
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'result_url': reverse('crop_detection:api_result', args=[job.crop_image_id]),
+        })
+
+
+class AsyncUploadMixin:
+    """
+    Shared upload handling for the async views: analysis is awaited inline, so a
+    single ASGI worker can hold many analyses in flight. While the circuit breaker is
+    open, images without a degraded diagnosis are queued for the background worker
+    and returned with their pending job.
+    """
+
+    async def process_upload(self, request, form):
+        user = await request.auser()
+        crop_image = form.save(commit=False)
+        if user.is_authenticated:
+            crop_image.user = user
+        crop_image.language = request.POST.get('language', 'en')
+        crop_image.session_key = await sync_to_async(get_session_key)(request)
+        metrics.label(language=crop_image.language)
+        with metrics.span('save_image'):
+            await crop_image.asave()
+        try:
+            result = await aanalyze_crop(crop_image)
+        except AdmissionRejected:
+            # The client is told to retry, so don't keep a half-processed row around.
+            await sync_to_async(crop_image.delete)()
+            raise
+        job = None
+        if result.get('pending'):
+            with metrics.span('enqueue_job'):
+                job = await AnalysisJob.objects.acreate(crop_image=crop_image)
+        else:
+            with metrics.span('apply_result'):
+                await crop_image.aapply_analysis_result(result)
+            if crop_image.degraded:
+                with metrics.span('enqueue_job'):
+                    job = await AnalysisJob.objects.acreate(crop_image=crop_image)
+        with metrics.span('save_history'):
+            await DetectionHistory.objects.acreate(
+                user=user if user.is_authenticated else None,
+                crop_image=crop_image,
+                session_id=crop_image.session_key,
+                ip_address=self.get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+        return crop_image, job
+
+    def get_client_ip(self, request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+        return ip
+
+class AsyncUploadImageView(AsyncUploadMixin, View):
+    async def post(self, request):
+        form = ImageUploadForm(request.POST, request.FILES)
+        with metrics.span('form_validation', request.POST.get('language', 'en')):
+            is_valid = await sync_to_async(form.is_valid)()
+        if is_valid:
+            try:
+                crop_image, job = await self.process_upload(request, form)
+                if not crop_image.is_processed:
+                    messages.warning(request, _('The analysis service is temporarily unavailable. Your image has been queued for analysis.'))
+                else:
+                    messages.success(request, _('Image processed successfully!'))
+                return redirect('crop_detection:result', pk=crop_image.pk)
+            except AdmissionRejected as e:
+                messages.error(request, _('The analysis service is busy. Please try again in %(seconds)d seconds.') % {
+                    'seconds': e.retry_after
+                })
+                return redirect('crop_detection:home')
+            except Exception as e:
+                logger.error(f"Async image upload processing error: {str(e)}", exc_info=True)
+                messages.error(request, _('An error occurred while processing the image. Please try again.'))
+                return redirect('crop_detection:home')
+        else:
+            messages.error(request, _('Please select a valid image file.'))
+            return redirect('crop_detection:home')
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIUploadView(AsyncUploadMixin, View):
+    async def post(self, request):
+        try:
+            if 'image' not in request.FILES:
+                return JsonResponse({'error': 'No image file provided'}, status=400)
+            form = ImageUploadForm(request.POST, request.FILES)
+            with metrics.span('form_validation', request.POST.get('language', 'en')):
+                is_valid = await sync_to_async(form.is_valid)()
+            if not is_valid:
+                return JsonResponse({'error': 'Invalid form data'}, status=400)
+            try:
+                crop_image, job = await self.process_upload(request, form)
+            except AdmissionRejected as e:
+                return admission_rejected_response(e)
+            if not crop_image.is_processed:
+                return JsonResponse({
+                    'success': True,
+                    'id': crop_image.id,
+                    'job_id': job.id,
+                    'status': job.status,
+                    'degraded': True,
+                    'status_url': reverse('crop_detection:api_job_status', args=[job.id]),
+                    'result_url': reverse('crop_detection:api_result', args=[crop_image.id]),
+                    'image_url': crop_image.image.url,
+                    'language': crop_image.language,
+                }, status=202)
             return JsonResponse({
-                'success': True,
+                'success': not crop_image.processing_error,
                 'id': crop_image.id,
                 'plant_type': crop_image.plant_type,
                 'disease_name': crop_image.disease_name,
@@ -176,8 +471,92 @@ class APIResultView(View):
                 'treatment': crop_image.treatment,
                 'image_url': crop_image.image.url,
                 'language': crop_image.language,
-                'uploaded_at': crop_image.uploaded_at.isoformat(),
+                'from_cache': crop_image.from_cache,
+                'degraded': crop_image.degraded,
+                'triaged_locally': crop_image.triaged_locally,
             })
         except Exception as e:
-            logger.error(f"API result error for pk={pk}: {str(e)}", exc_info=True)
-            return JsonResponse({'error': 'Server error occurred'}, status=500)
\ No newline at end of file
+            logger.error(f"Async API upload error: {str(e)}", exc_info=True)
+            return JsonResponse({'error': 'Server error occurred'}, status=500)
+
+class AsyncAPIResultView(View):
+    async def get(self, request, pk):
+        try:
+            crop_image = await CropImage.objects.select_related('user').aget(pk=pk)
+        except CropImage.DoesNotExist:
+            return JsonResponse({'error': 'Not found'}, status=404)
+        return JsonResponse(serialize_result(crop_image))
+
+class APIStatsView(View):
+    def get(self, request):
+        group_by = [field for field in request.GET.get('group_by', 'disease_name').split(',') if field]
+        if not group_by or any(field not in rollups.GROUP_FIELDS for field in group_by):
+            return JsonResponse(
+                {'error': f"group_by must be a comma-separated subset of {', '.join(rollups.GROUP_FIELDS)}"}, status=400
+            )
+        try:
+            until = datetime.date.fromisoformat(request.GET['until']) if 'until' in request.GET else timezone.localdate()
+            default_days = getattr(settings, 'STATS_DEFAULT_DAYS', 30)
+            since = (datetime.date.fromisoformat(request.GET['since']) if 'since' in request.GET
+                     else until - datetime.timedelta(days=default_days - 1))
+        except ValueError:
+            return JsonResponse({'error': 'since and until must be dates in YYYY-MM-DD format'}, status=400)
+        max_days = getattr(settings, 'STATS_MAX_DAYS', 366)
+        if since > until or (until - since).days >= max_days:
+            return JsonResponse({'error': f'Date range must be 1 to {max_days} days'}, status=400)
+        filters = {field: request.GET[field] for field in ('plant_type', 'disease_name', 'language') if field in request.GET}
+        results = rollups.summarize(since, until, group_by, **filters)
+        return JsonResponse({
+            'success': True,
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'group_by': group_by,
+            'filters': filters,
+            'total': sum(row['count'] for row in results),
+            'results': results,
+        })
+
+
+def refresh_gauges():
+    controller = admission.get_controller()
+    if controller is not None:
+        for name, value in controller.stats().items():
+            metrics.set_gauge(f'admission_{name}', value)
+    if circuit.is_enabled():
+        # Reading the state publishes a pending open -> half-open transition.
+        circuit.get_breaker().state
+    for view in ('html', 'json'):
+        ratio = response_cache.hit_ratio(view)
+        if ratio is not None:
+            metrics.set_gauge('result_response_cache_hit_ratio', ratio, view=view)
+
+class APIMetricsView(View):
+    def get(self, request):
+        refresh_gauges()
+        return JsonResponse({'success': True, 'metrics': metrics.snapshot()})
+
+class PrometheusMetricsView(View):
+    def get(self, request):
+        refresh_gauges()
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class MediaView(View):
+    def get(self, request, path):
+        resolved = media.resolve(path)
+        if resolved is None:
+            raise Http404
+        name, full_path, st = resolved
+        if getattr(settings, 'MEDIA_PRIVATE', False) and not self.has_access(request, name):
+            # Same answer as a missing file, so private file names cannot be probed.
+            raise Http404
+        return media.serve(request, name, full_path, st)
+
+    def has_access(self, request, name):
+        if request.user.is_staff:
+            return True
+        owner = Q(pk__in=[])
+        if request.session.session_key:
+            owner |= Q(session_key=request.session.session_key)
+        if request.user.is_authenticated:
+            owner |= Q(user=request.user)
+        return CropImage.objects.filter(owner, media.image_lookup(name)).exists()